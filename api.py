@@ -3,14 +3,62 @@ from flask_cors import CORS
 import csv
 import random
 import os
+import sys
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attached_assets'))
+from cold_start import ColdStartRecommender
+from model_registry import ModelRegistry
+from chart_data import CHART_FORMATS, DEFAULT_POINT_BUDGET, encode_chart_payload, limit_cluster_chart, load_chart_data
+from percentile_index import PercentileIndex
+from leaderboard import BOARDS, WeeklyLeague, week_start
+
 app = Flask(__name__)
 CORS(app)
 
 # Global in-memory storage for user data (backup)
 user_data_store = {}
 
+# Full generated CSV rows of recently generated users (demographic + physical + activity),
+# least recently generated evicted first; evicted users are read back from the CSVs
+MAX_USER_RECORDS = 10000
+user_records = OrderedDict()
+
+# Precomputed cold-start recommendations, exported by AdminAnalytics
+COLD_START_TABLE = 'attached_assets/cold_start_recommendations.json'
+cold_start_cache = {'mtime': None, 'recommender': None}
+
+# Cluster model artifact exported by AdminAnalytics.export_cluster_model, hot-reloaded;
+# watched from import on, so any WSGI server has the model without a first /assign-cluster
+MODEL_ARTIFACT = 'attached_assets/cluster_model'
+model_registry = ModelRegistry(MODEL_ARTIFACT).start()
+
+# Admin and cluster chart series exported by AdminAnalytics.export_chart_data
+CHART_DATA = 'attached_assets/chart_data.json'
+chart_data_cache = {'mtime': None, 'data': None}
+
+# Sorted per-cohort metric arrays exported by AdminAnalytics.export_percentile_index;
+# users created through this API are folded into the loaded index, and again after a
+# reload until an export newer than them has picked them up from the CSVs
+PERCENTILE_INDEX = 'attached_assets/percentile_index.npz'
+percentile_cache = {'mtime': None, 'index': None, 'added': OrderedDict()}
+percentile_lock = threading.Lock()
+
+# Weekly step league, built from the activity CSV on first use and then kept up to date
+# in memory; finished weeks are archived as CSV standings
+LEADERBOARD_ARCHIVE = 'attached_assets/leaderboard_archive'
+league_cache = {'league': None}
+league_lock = threading.Lock()
+
+# Per-user chart series come from a UserAnalytics instance: built once, kept current by
+# folding in users created through this API, and rebuilt in a background thread (while
+# the old instance keeps serving) when the CSVs are changed by anything else
+user_analytics_cache = {'stamps': None, 'analytics': None, 'refreshing': False}
+user_analytics_lock = threading.Lock()
+
 # Your existing CSV file paths
 CSV_FILES = {
     'demographic': 'attached_assets/users_demographic.csv',
@@ -168,8 +216,8 @@ def generate_activity_data(user_id, age, gender, fitness_level, physical_data):
     else:
         workout_types = ','.join(random.sample(advanced_workouts, min(3, len(advanced_workouts))))
     
-    # Current week data
-    current_week = datetime.now().strftime('%Y-%m-%d')
+    # Current week data (weeks start on Monday)
+    current_week = week_start(datetime.now())
     
     return {
         'user_id': user_id,
@@ -201,6 +249,10 @@ def write_user_to_existing_csvs(user_id, age, gender, fitness_level, user_info=N
         demographic_data = generate_demographic_data(user_id, age, gender, fitness_level, user_info)
         physical_data = generate_physical_data(user_id, age, gender, fitness_level)
         activity_data = generate_activity_data(user_id, age, gender, fitness_level, physical_data)
+        user_records[user_id] = {**demographic_data, **physical_data, **activity_data}
+        user_records.move_to_end(user_id)
+        while len(user_records) > MAX_USER_RECORDS:
+            user_records.popitem(last=False)
         
         # Write to demographic CSV
         if os.path.exists(CSV_FILES['demographic']):
@@ -336,6 +388,411 @@ def load_user_from_existing_csvs(user_id):
         print(f"❌ Error loading from existing CSV files: {e}")
         return None
 
+def load_user_record_from_csvs(user_id):
+    """Load a user's raw CSV rows merged into one record"""
+    record = {}
+    for path in CSV_FILES.values():
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                if row.get('user_id') == user_id:
+                    record.update(row)
+                    break
+    return record or None
+
+def get_cold_start_recommender():
+    """Cold-start table, reloaded when the exported file changes"""
+    if not os.path.exists(COLD_START_TABLE):
+        return None
+    mtime = os.path.getmtime(COLD_START_TABLE)
+    if cold_start_cache['mtime'] != mtime:
+        cold_start_cache['recommender'] = ColdStartRecommender.load(COLD_START_TABLE)
+        cold_start_cache['mtime'] = mtime
+    return cold_start_cache['recommender']
+
+def get_percentile_index():
+    """Percentile index, reloaded when the exported file changes (call with percentile_lock held)"""
+    if not os.path.exists(PERCENTILE_INDEX):
+        return None
+    mtime = os.path.getmtime(PERCENTILE_INDEX)
+    if percentile_cache['mtime'] != mtime:
+        index = PercentileIndex.load(PERCENTILE_INDEX)
+        added = percentile_cache['added']
+        for user_id in [user_id for user_id, (_, added_at) in added.items() if added_at < mtime]:
+            del added[user_id]
+        for record, _ in added.values():
+            index.add(record)
+        percentile_cache['index'] = index
+        percentile_cache['mtime'] = mtime
+    return percentile_cache['index']
+
+def add_to_percentile_index(user_id, record):
+    """Fold an API-created user into the percentile index, replacing their earlier record"""
+    record = with_cluster(record)
+    with percentile_lock:
+        index = get_percentile_index()
+        if index is None:
+            return
+        added = percentile_cache['added']
+        previous = added.pop(user_id, None)
+        if previous is not None:
+            index.remove(previous[0])
+        index.add(record)
+        added[user_id] = (record, time.time())
+        while len(added) > MAX_USER_RECORDS:
+            # A reload would not replay the evicted user either, so the live index drops them too
+            _, (evicted, _) = added.popitem(last=False)
+            index.remove(evicted)
+
+def with_cluster(record):
+    """The record with its cluster from the active model, when one is available"""
+    model = model_registry.active
+    if model is None or 'cluster' in record:
+        return record
+    try:
+        return {**record, 'cluster': int(model.predict([record])[0])}
+    except Exception as e:
+        print(f"⚠️ Could not assign cluster for percentiles: {e}")
+        return record
+
+def get_league():
+    """The weekly league, built from the CSV files on first use (call with league_lock held)"""
+    if league_cache['league'] is None:
+        if not os.path.exists(CSV_FILES['activity']):
+            league_cache['league'] = WeeklyLeague(LEADERBOARD_ARCHIVE)
+        else:
+            league_cache['league'] = WeeklyLeague.from_csv_files(
+                CSV_FILES['activity'], CSV_FILES['demographic'], CSV_FILES['physical'], LEADERBOARD_ARCHIVE
+            )
+    return league_cache['league']
+
+def get_chart_data():
+    """Exported chart data, reloaded when the file changes"""
+    if not os.path.exists(CHART_DATA):
+        return None
+    mtime = os.path.getmtime(CHART_DATA)
+    if chart_data_cache['mtime'] != mtime:
+        chart_data_cache['data'] = load_chart_data(CHART_DATA)
+        chart_data_cache['mtime'] = mtime
+    return chart_data_cache['data']
+
+def csv_stamps():
+    """Modification times of the user CSV files (None for a missing file)"""
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in CSV_FILES.values())
+
+def load_user_analytics():
+    """A UserAnalytics instance freshly loaded from the CSV files"""
+    from user_analytics import UserAnalytics
+    
+    analytics = UserAnalytics(data_dir=os.path.dirname(CSV_FILES['demographic']))
+    analytics.load_and_prepare_data()
+    return analytics
+
+def refresh_user_analytics():
+    """Rebuild UserAnalytics from the CSV files and swap it in (runs in a background thread)"""
+    try:
+        stamps = csv_stamps()
+        analytics = load_user_analytics()
+        with user_analytics_lock:
+            user_analytics_cache['analytics'] = analytics
+            user_analytics_cache['stamps'] = stamps
+    except Exception as e:
+        print(f"❌ Error refreshing user analytics: {e}")
+    finally:
+        with user_analytics_lock:
+            user_analytics_cache['refreshing'] = False
+
+def get_user_analytics():
+    """UserAnalytics over the CSV files; loaded inline only the first time
+    
+    When the files changed since the instance was built, one background
+    refresh is started and the current instance keeps answering until it is
+    swapped.
+    """
+    stamps = csv_stamps()
+    with user_analytics_lock:
+        analytics = user_analytics_cache['analytics']
+        if analytics is None:
+            analytics = load_user_analytics()
+            user_analytics_cache['analytics'] = analytics
+            user_analytics_cache['stamps'] = stamps
+        elif user_analytics_cache['stamps'] != stamps and not user_analytics_cache['refreshing']:
+            user_analytics_cache['refreshing'] = True
+            threading.Thread(target=refresh_user_analytics, daemon=True).start()
+        return analytics
+
+def add_to_user_analytics(record, stamps_before):
+    """Fold an API-created user into the loaded UserAnalytics
+    
+    stamps_before are the CSV stamps from before the user was written: if the
+    instance was current then, it is current again with the user folded in,
+    so the write does not trigger a reload.
+    """
+    with user_analytics_lock:
+        analytics = user_analytics_cache['analytics']
+        if analytics is None:
+            return
+        try:
+            analytics.add_user(record)
+        except Exception as e:
+            print(f"⚠️ Could not add user to analytics, reloading instead: {e}")
+            return
+        if user_analytics_cache['stamps'] == stamps_before:
+            user_analytics_cache['stamps'] = csv_stamps()
+
+def chart_response(payload):
+    """Chart series as compact JSON (default) or binary columnar (?format=columnar)"""
+    output_format = request.args.get('format', 'json')
+    if output_format not in CHART_FORMATS:
+        return jsonify({'error': f'Unknown format {output_format}, expected one of {list(CHART_FORMATS)}'}), 400
+    body, mimetype = encode_chart_payload(payload, output_format)
+    return app.response_class(body, mimetype=mimetype)
+
+@app.route('/charts/user/<user_id>')
+def get_user_charts(user_id):
+    """Series behind the user dashboard panels, without any rendered HTML"""
+    try:
+        max_points = request.args.get('points', DEFAULT_POINT_BUDGET, type=int)
+        charts = get_user_analytics().user_chart_data(user_id, max_points)
+        if 'error' in charts:
+            return jsonify(charts), 404
+        return chart_response(charts)
+        
+    except Exception as e:
+        print(f"❌ Error getting user charts: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/charts/admin')
+def get_admin_charts():
+    """Series behind the admin dashboard panels, from the exported chart data"""
+    try:
+        data = get_chart_data()
+        if data is None:
+            return jsonify({'error': 'Chart data has not been exported yet'}), 503
+        return chart_response(data['admin'])
+        
+    except Exception as e:
+        print(f"❌ Error getting admin charts: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/charts/clusters')
+def get_cluster_charts():
+    """Cluster density tiles and a user sample, cut down to ?points=N per series"""
+    try:
+        data = get_chart_data()
+        if data is None or data.get('clusters') is None:
+            return jsonify({'error': 'Cluster chart data has not been exported yet'}), 503
+        
+        clusters = data['clusters']
+        max_points = request.args.get('points', type=int)
+        if max_points is not None:
+            clusters = limit_cluster_chart(clusters, max(max_points, 1))
+        return chart_response(clusters)
+        
+    except Exception as e:
+        print(f"❌ Error getting cluster charts: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/percentiles/<user_id>')
+def get_user_percentiles(user_id):
+    """The user's percentile per metric, overall and within age band, gender, provider and cluster
+    
+    Optional ?metrics=total_steps,fitness_score and ?cohorts=age_band,gender narrow the answer.
+    """
+    try:
+        if not os.path.exists(PERCENTILE_INDEX):
+            return jsonify({'error': 'Percentile index has not been exported yet'}), 503
+        
+        record = user_records.get(user_id) or load_user_record_from_csvs(user_id)
+        if not record:
+            return jsonify({'error': f'User {user_id} not found'}), 404
+        record = with_cluster(record)
+        
+        metrics = request.args.get('metrics')
+        cohorts = request.args.get('cohorts')
+        with percentile_lock:
+            index = get_percentile_index()
+            if index is None:
+                return jsonify({'error': 'Percentile index has not been exported yet'}), 503
+            percentiles = index.user_percentiles(
+                record,
+                metrics.split(',') if metrics else None,
+                ['all'] + cohorts.split(',') if cohorts else None
+            )
+        return jsonify({'user_id': user_id, 'percentiles': percentiles})
+        
+    except Exception as e:
+        print(f"❌ Error getting percentiles: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/leaderboard')
+def get_leaderboard():
+    """One page of weekly standings: ?board=global|city|provider&scope=<city or provider>&offset=0&limit=10
+    
+    ?week=<week_start_date> pages through an archived week instead of the current one.
+    """
+    try:
+        board = request.args.get('board', 'global')
+        if board not in BOARDS:
+            return jsonify({'error': f'Unknown board {board}, expected one of {list(BOARDS)}'}), 400
+        scope = request.args.get('scope')
+        if board != 'global' and not scope:
+            return jsonify({'error': f'scope is required for the {board} board'}), 400
+        offset = request.args.get('offset', 0, type=int)
+        if offset < 0:
+            return jsonify({'error': f'Invalid offset {offset}, expected 0 or more'}), 400
+        limit = request.args.get('limit', 10, type=int)
+        if limit < 1:
+            return jsonify({'error': f'Invalid limit {limit}, expected 1 or more'}), 400
+        limit = min(limit, 100)
+        
+        week = request.args.get('week')
+        if week:
+            try:
+                week = week_start(week)
+            except ValueError:
+                return jsonify({'error': f'Invalid week {week}, expected YYYY-MM-DD'}), 400
+        with league_lock:
+            league = get_league()
+            if week and week != league.week:
+                standings = league.archived_top(week, board, scope, offset, limit)
+                if standings is None:
+                    return jsonify({'error': f'No archived standings for week {week}'}), 404
+            else:
+                week = league.week
+                standings = league.current.top(board, scope, offset, limit)
+        
+        return jsonify({'week': week, 'board': board, 'scope': scope, 'offset': offset, 'standings': standings})
+        
+    except Exception as e:
+        print(f"❌ Error getting leaderboard: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/leaderboard/rank/<user_id>')
+def get_leaderboard_rank(user_id):
+    """A user's rank this week globally, in their city and with their provider
+    
+    Users without steps this week get their ranks from the latest archived week they took part in.
+    """
+    try:
+        with league_lock:
+            league = get_league()
+            current_week = league.week
+            ranks = league.current.user_ranks(user_id)
+            archived = None if ranks is not None else league.archived_user_ranks(user_id)
+        if ranks is not None:
+            return jsonify({'week': current_week, 'user_id': user_id, 'ranks': ranks, 'archived': False})
+        if archived is None:
+            return jsonify({'error': f'User {user_id} has no steps in week {current_week} or any archived week'}), 404
+        week, ranks = archived
+        return jsonify({'week': week, 'user_id': user_id, 'ranks': ranks, 'archived': True})
+        
+    except Exception as e:
+        print(f"❌ Error getting leaderboard rank: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/leaderboard/steps', methods=['POST'])
+def record_leaderboard_steps():
+    """Record a user's weekly steps: {"userId", "totalSteps", "weekStartDate" (default: current week)}
+    
+    weekStartDate is an ISO date; any day counts towards the week starting on its Monday.
+    A newer week archives the current standings and starts a new week.
+    """
+    try:
+        data = request.get_json() or {}
+        user_id = data.get('userId')
+        total_steps = data.get('totalSteps')
+        if not user_id or total_steps is None:
+            return jsonify({'error': 'userId and totalSteps are required'}), 400
+        try:
+            total_steps = int(total_steps)
+        except (TypeError, ValueError):
+            return jsonify({'error': f'Invalid totalSteps {total_steps}, expected an integer'}), 400
+        if total_steps < 0:
+            return jsonify({'error': 'totalSteps must not be negative'}), 400
+        
+        week = data.get('weekStartDate')
+        if week:
+            try:
+                week = week_start(week)
+            except (TypeError, ValueError):
+                return jsonify({'error': f'Invalid weekStartDate {week}, expected YYYY-MM-DD'}), 400
+        record = user_records.get(user_id) or load_user_record_from_csvs(user_id) or {}
+        with league_lock:
+            league = get_league()
+            week = week or league.week or week_start(datetime.now())
+            if not league.record(user_id, week, total_steps, record.get('city'),
+                                 record.get('current_insurance_provider')):
+                return jsonify({'error': f'Week {week} is already archived'}), 409
+            current_week, ranks = league.week, league.current.user_ranks(user_id)
+        
+        return jsonify({'week': current_week, 'user_id': user_id, 'ranks': ranks})
+        
+    except Exception as e:
+        print(f"❌ Error recording leaderboard steps: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/recommendations/<user_id>')
+def get_user_recommendations(user_id):
+    """First-visit service recommendations from the precomputed cold-start table
+    
+    ?cluster= overrides the assigned cluster (400 if the model has no such cluster).
+    """
+    try:
+        recommender = get_cold_start_recommender()
+        if recommender is None:
+            return jsonify({'error': 'Cold-start recommendations have not been exported yet'}), 503
+        
+        record = user_records.get(user_id) or load_user_record_from_csvs(user_id)
+        if not record:
+            return jsonify({'error': f'User {user_id} not found'}), 404
+        
+        n_recommendations = request.args.get('n', 2, type=int)
+        cluster = request.args.get('cluster')
+        if cluster is not None and not recommender.has_cluster(cluster):
+            return jsonify({'error': f'Unknown cluster: {cluster}'}), 400
+        result = recommender.recommend(record, n_recommendations,
+                                       cluster=None if cluster is None else int(cluster))
+        if 'error' in result:
+            return jsonify(result), 404
+        return jsonify(result)
+        
+    except Exception as e:
+        print(f"❌ Error getting recommendations: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/assign-cluster', methods=['POST'])
+def assign_cluster():
+    """Assign a user record (JSON body, or {"userId": ...} of a known user) to a cluster"""
+    try:
+        # Loading happens on the registry's watcher thread, never on the request path
+        model = model_registry.active
+        if model is None:
+            return jsonify({'error': 'No cluster model available yet'}), 503
+        
+        data = request.get_json() or {}
+        record = data
+        user_id = data.get('userId') or data.get('user_id')
+        if user_id and not any(feature in data for feature in model.features):
+            record = user_records.get(user_id) or load_user_record_from_csvs(user_id)
+            if not record:
+                return jsonify({'error': f'User {user_id} not found'}), 404
+        
+        cluster = int(model.predict([record])[0])
+        cluster_info = (model.cluster_summary or {}).get(f'Cluster_{cluster}', {})
+        return jsonify({
+            'user_id': user_id,
+            'predicted_cluster': cluster,
+            'cluster_description': cluster_info.get('description', 'No description'),
+            'cluster_size': cluster_info.get('size', 0),
+            'model_version': model.version
+        })
+        
+    except Exception as e:
+        print(f"❌ Error assigning cluster: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/user/<user_id>')
 def get_user_profile(user_id):
     """Get user profile data"""
@@ -390,12 +847,26 @@ def generate_csv_endpoint():
         print(f"💼 Occupation: {user_info['occupation'] or 'Not provided'}")
         
         # Generate and write user data to existing CSV files
+        stamps_before = csv_stamps()
         user_data = write_user_to_existing_csvs(user_id, age, gender, fitness_level, user_info)
         
         if user_data:
             # Store in memory as backup
             user_data_store[user_id] = user_data
             
+            # New users count towards everyone's percentiles right away
+            add_to_percentile_index(user_id, user_records[user_id])
+            
+            # ... get their dashboard charts without a reload of every CSV
+            add_to_user_analytics(user_records[user_id], stamps_before)
+            
+            # ... and enter the league with their generated week
+            record = user_records[user_id]
+            with league_lock:
+                if league_cache['league'] is not None:
+                    league_cache['league'].record(user_id, record['week_start_date'], record['total_steps'],
+                                                  record['city'], record['current_insurance_provider'])
+            
             return jsonify({
                 'success': True,
                 'message': f'Data generated and saved for user {user_id}',
@@ -450,6 +921,7 @@ def health_check():
         'status': 'healthy',
         'message': 'BewegungsLiga+ API is running with existing CSV structure',
         'users_in_memory': len(user_data_store),
+        'cluster_model': model_registry.status(),
         'csv_files': {
             'demographic': os.path.exists(CSV_FILES['demographic']),
             'physical': os.path.exists(CSV_FILES['physical']),
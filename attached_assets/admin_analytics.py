@@ -12,43 +12,125 @@ import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
-from sklearn.metrics import silhouette_score
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA, IncrementalPCA
 from sklearn.metrics.pairwise import cosine_similarity
 import joblib
+import os
 import warnings
+from cluster_quality import (
+    StreamingClusterMetrics, evaluate_cluster_quality, sampled_silhouette, stratified_sample_indices
+)
+from analytics_pipeline import PIPELINE_CACHE_DIR, run_admin_pipeline
+from analytics_cube import AGE_BAND_LABELS, NO_CLUSTER, AnalyticsCube
+from percentile_index import PercentileIndex
+from chart_data import DEFAULT_POINT_BUDGET, coarsen_tiles, density_tiles, write_chart_data
+from cluster_stats import build_cluster_summary, compute_cluster_stats
+from cold_start import export_cold_start_table
+from recommendation_store import RecommendationStore, frame_fingerprint, row_fingerprints
+from recommendation_tables import CompiledRecommendationTables, top_k_positions
+from services_catalog import ServicesCatalog, parse_yes_no
+from eligibility import EligibilityEngine
+from model_artifact import ModelArtifact, export_model_artifact
+from sharded_clustering import feature_moments, fit_sharded_clustering, scaler_from_moments
 warnings.filterwarnings('ignore')
 
+DEFAULT_CLUSTERING_FEATURES = [
+    'age', 'bmi', 'fitness_level_encoded', 'gender_encoded',
+    'total_steps', 'total_calories_burned', 'total_active_minutes',
+    'exercise_frequency_per_week', 'resting_heart_rate',
+    'sleep_hours_avg', 'stress_level_avg', 'income_numeric',
+    'has_medical_condition'
+]
+
+# Categorical encodings shared by the dataset, single-user and batch encoders
+FITNESS_LEVEL_MAP = {'Beginner': 0, 'Intermediate': 1, 'Advanced': 2}
+GENDER_MAP = {'Male': 0, 'Female': 1}
+SMOKING_MAP = {'Non-smoker': 0, 'Ex-smoker': 1, 'Smoker': 2}
+ALCOHOL_MAP = {'Low': 0, 'Moderate': 1, 'High': 2}
+INCOME_MAP = {
+    '30000-35000': 32500, '35000-40000': 37500, '40000-50000': 45000,
+    '50000-75000': 62500, '75000-100000': 87500, '100000+': 110000
+}
+
+# (source column, encoded column, mapping, value for unknown categories of new users)
+NEW_USER_ENCODINGS = [
+    ('fitness_level', 'fitness_level_encoded', FITNESS_LEVEL_MAP, 0),
+    ('gender', 'gender_encoded', GENDER_MAP, 0),
+    ('smoking_status', 'smoking_encoded', SMOKING_MAP, 0),
+    ('alcohol_consumption', 'alcohol_encoded', ALCOHOL_MAP, 0),
+    ('income_bracket', 'income_numeric', INCOME_MAP, 50000)
+]
+
+# Most recently assigned users kept for the visualization (older ones are dropped)
+MAX_PROJECTED_USERS = 100000
+
+# User columns the service relevance score depends on; a change re-scores that user
+RECOMMENDATION_KEY_COLUMNS = [
+    'cluster', 'provider_id', 'fitness_level', 'total_steps', 'age',
+    'has_medical_condition', 'stress_level_avg', 'sleep_hours_avg'
+]
+
+
 class AdminAnalytics:
     def __init__(self):
         self.master_df = None
         self.scaler = StandardScaler()
         self.clustering_model = None
         self.pca_model = None
+        self.pca_solver = 'full'
+        self.projected_users = []
         self.cluster_labels = None
         self.cluster_summary = None
+        self.cluster_stats = None
+        # Users added to or removed from cluster_stats since it was computed
+        # from master_df: user_id -> cluster, or None once removed
+        self.stats_members = {}
+        self.cluster_quality = None
+        self.analytics_cube = None
+        self.percentile_index = None
+        self.clustering_features = None
+        self.feature_means = None
+        self.model_version = None
+        self.recommendation_tables = None
+        self.recommendation_store = None
+        self.catalog = None
+        self.eligibility_engine = None
         self.services_df = None
         self.insurance_df = None
         
     def load_and_prepare_data(self):
         """Load all datasets and combine them into master dataset"""
+        master_df = self.load_datasets()
+        
+        # Encode categorical variables
+        master_df = self._encode_categorical_features(master_df)
+        
+        self.master_df = master_df
+        self.analytics_cube = None
+        self.percentile_index = None
+        
+        print(f"Master dataset created with {len(master_df)} users and {len(master_df.columns)} features")
+        return master_df
+    
+    def load_datasets(self):
+        """Read and merge the user CSVs with their provider ids (before encoding)"""
         print("Loading datasets...")
         
         # Load individual datasets
         demo_df = pd.read_csv('users_demographic.csv')
         physical_df = pd.read_csv('users_physical.csv')
         activity_df = pd.read_csv('users_activity_weekly.csv')
-        insurance_df = pd.read_csv('insurance_providers.csv')
-        services_df = pd.read_csv('insurance_services.csv')
+        
+        # Providers and services come from the provider-indexed catalog (loaded once)
+        self.load_services_catalog()
         
         # Combine datasets
         master_df = demo_df.merge(physical_df, on='user_id')
         master_df = master_df.merge(activity_df, on='user_id')
         
         # Add insurance provider details
-        insurance_mapping = insurance_df.set_index('provider_name')['provider_id'].to_dict()
-        master_df['provider_id'] = master_df['current_insurance_provider'].map(insurance_mapping)
+        master_df['provider_id'] = master_df['current_insurance_provider'].map(self.catalog.insurance_mapping)
         
         # Remove unnecessary columns for clustering
         columns_to_remove = [
@@ -59,137 +141,536 @@ class AdminAnalytics:
         
         # Only remove columns that exist
         columns_to_remove = [col for col in columns_to_remove if col in master_df.columns]
-        master_df = master_df.drop(columns=columns_to_remove)
-        
-        # Encode categorical variables
-        master_df = self._encode_categorical_features(master_df)
-        
-        self.master_df = master_df
-        self.services_df = services_df
-        self.insurance_df = insurance_df
-        
-        print(f"Master dataset created with {len(master_df)} users and {len(master_df.columns)} features")
-        return master_df
+        return master_df.drop(columns=columns_to_remove)
+    
+    def load_services_catalog(self):
+        """Load the providers/services catalog once, or reload it if the files changed"""
+        if self.catalog is None:
+            self.catalog = ServicesCatalog()
+        else:
+            self.catalog.reload_if_changed()
+        self.services_df = self.catalog.services_df
+        self.insurance_df = self.catalog.providers_df
+        return self.insurance_df, self.services_df
     
     def _encode_categorical_features(self, df):
         """Encode categorical features for ML algorithms"""
         # Fitness level encoding
-        fitness_map = {'Beginner': 0, 'Intermediate': 1, 'Advanced': 2}
-        df['fitness_level_encoded'] = df['fitness_level'].map(fitness_map)
+        df['fitness_level_encoded'] = df['fitness_level'].map(FITNESS_LEVEL_MAP)
         
         # Gender encoding
-        gender_map = {'Male': 0, 'Female': 1}
-        df['gender_encoded'] = df['gender'].map(gender_map)
+        df['gender_encoded'] = df['gender'].map(GENDER_MAP)
         
         # Smoking status encoding
-        smoking_map = {'Non-smoker': 0, 'Ex-smoker': 1, 'Smoker': 2}
-        df['smoking_encoded'] = df['smoking_status'].map(smoking_map)
+        df['smoking_encoded'] = df['smoking_status'].map(SMOKING_MAP)
         
         # Alcohol consumption encoding
-        alcohol_map = {'Low': 0, 'Moderate': 1, 'High': 2}
-        df['alcohol_encoded'] = df['alcohol_consumption'].map(alcohol_map)
+        df['alcohol_encoded'] = df['alcohol_consumption'].map(ALCOHOL_MAP)
         
         # Medical conditions binary encoding
         df['has_medical_condition'] = (df['medical_conditions'] != 'None').astype(int)
         
         # Income bracket encoding
-        income_map = {
-            '30000-35000': 32500, '35000-40000': 37500, '40000-50000': 45000,
-            '50000-75000': 62500, '75000-100000': 87500, '100000+': 110000
-        }
-        df['income_numeric'] = df['income_bracket'].map(income_map)
+        df['income_numeric'] = df['income_bracket'].map(INCOME_MAP)
         
         return df
     
-    def perform_user_clustering(self, n_clusters=5, clustering_features=None):
-        """Perform K-means clustering on user data"""
+    def run_cached_pipeline(self, n_clusters=5, k_values=None, clustering_features=None,
+                            cache_dir=PIPELINE_CACHE_DIR, random_state=42, cold_start_path=None):
+        """Load -> encode -> scale/PCA -> cluster -> stats -> recommendation rules (-> cold-start table),
+        reusing cached stages whose inputs are unchanged"""
+        return run_admin_pipeline(self, n_clusters=n_clusters, k_values=k_values,
+                                  clustering_features=clustering_features, cache_dir=cache_dir,
+                                  random_state=random_state, cold_start_path=cold_start_path)
+    
+    def perform_user_clustering(self, n_clusters=5, clustering_features=None, mode='batch',
+                                chunk_size=10000, feature_source=None, n_passes=3,
+                                silhouette_sample_size=10000, pca_solver=None, max_rows=None,
+                                random_state=42):
+        """Perform K-means clustering on user data
+        
+        mode='batch' fits full-batch KMeans on the in-memory feature matrix.
+        mode='streaming' fits MiniBatchKMeans over chunked reads of
+        feature_source (a callable taking the feature list and chunk size and
+        yielding DataFrames, defaults to the master dataset) so the scaled
+        matrix is never materialized as a whole. feature_source is training
+        data only: the scaler and centers are fitted on it, while the labels
+        and PCA coordinates are always computed for the rows of master_df.
+        
+        The silhouette is estimated on a stratified sample of at most
+        silhouette_sample_size users; the full report, including
+        Calinski-Harabasz, Davies-Bouldin and per-cluster inertia, is kept in
+        self.cluster_quality. max_rows caps how many users those streaming
+        metrics read (all by default); 'complete' in the report tells whether
+        the cap cut any users off.
+        
+        pca_solver picks how the batch-mode visualization PCA is fitted:
+        'full', 'randomized' or 'incremental' (fitted on row batches, for
+        populations where a centered copy of the scaled matrix does not fit).
+        Users assigned later are projected with the same components and
+        appended to the visualization (see get_projected_users).
+        random_state seeds the k-means initialization.
+        """
+        clustering_features = self._resolve_clustering_features(clustering_features)
+        if pca_solver is not None:
+            self.pca_solver = pca_solver
+        
+        if mode == 'streaming':
+            return self._perform_streaming_clustering(
+                n_clusters, clustering_features, chunk_size, feature_source,
+                n_passes, silhouette_sample_size, max_rows, random_state
+            )
+        if mode != 'batch':
+            raise ValueError(f"Unknown clustering mode: {mode}")
+        
+        # Prepare and scale data
+        X_scaled = self.prepare_scaled_features(clustering_features)
+        
+        # Perform clustering
+        model = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10)
+        model.fit(X_scaled)
+        
+        return self.apply_clustering_model(model, X_scaled, silhouette_sample_size, max_rows)
+    
+    def _resolve_clustering_features(self, clustering_features=None):
+        """Pick the clustering features that exist in the master dataset"""
         if self.master_df is None:
             self.load_and_prepare_data()
         
         # Define clustering features if not provided
         if clustering_features is None:
-            clustering_features = [
-                'age', 'bmi', 'fitness_level_encoded', 'gender_encoded',
-                'total_steps', 'total_calories_burned', 'total_active_minutes',
-                'exercise_frequency_per_week', 'resting_heart_rate',
-                'sleep_hours_avg', 'stress_level_avg', 'income_numeric',
-                'has_medical_condition'
-            ]
+            clustering_features = DEFAULT_CLUSTERING_FEATURES
         
         # Filter features that exist in the dataset
         clustering_features = [f for f in clustering_features if f in self.master_df.columns]
+        self.clustering_features = clustering_features
         
         print(f"Clustering using features: {clustering_features}")
+        return clustering_features
+    
+    def prepare_scaled_features(self, clustering_features=None):
+        """Fill missing values, fit the scaler and return the scaled feature matrix"""
+        if clustering_features is None or clustering_features != self.clustering_features:
+            clustering_features = self._resolve_clustering_features(clustering_features)
+        
+        self.feature_means = self.master_df[clustering_features].mean()
+        X = self.master_df[clustering_features].fillna(self.feature_means)
+        self.scaler = StandardScaler()
+        return self.scaler.fit_transform(X)
+    
+    def apply_clustering_model(self, model, X_scaled, silhouette_sample_size=10000, max_rows=None):
+        """Adopt a fitted KMeans model: label users, score quality, summarize and project"""
+        _, silhouette_avg = self.label_users(model, X_scaled, silhouette_sample_size, max_rows)
         
-        # Prepare data
-        X = self.master_df[clustering_features].fillna(self.master_df[clustering_features].mean())
+        # Create cluster summary
+        self._create_cluster_summary()
         
-        # Scale features
-        X_scaled = self.scaler.fit_transform(X)
+        # Perform PCA for visualization
+        X_pca = self._fit_visualization_pca(X_scaled)
+        self.master_df['pca_x'] = X_pca[:, 0]
+        self.master_df['pca_y'] = X_pca[:, 1]
         
-        # Perform clustering
-        self.clustering_model = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        cluster_labels = self.clustering_model.fit_predict(X_scaled)
+        # Users whose cluster changed get re-scored in the materialized table
+        if self.recommendation_store is not None:
+            self.materialize_recommendations(self.recommendation_store.k)
+        
+        return self.cluster_labels, silhouette_avg
+    
+    def label_users(self, model, X_scaled, silhouette_sample_size=10000, max_rows=None):
+        """Adopt a fitted KMeans model: label master_df and score cluster quality"""
+        self.clustering_model = model
+        cluster_labels = model.predict(X_scaled)
         
         # Add cluster labels to dataframe
         self.master_df['cluster'] = cluster_labels
+        self.analytics_cube = None
+        self.percentile_index = None
         self.cluster_labels = cluster_labels
         
-        # Calculate silhouette score
-        silhouette_avg = silhouette_score(X_scaled, cluster_labels)
-        print(f"Clustering completed with {n_clusters} clusters")
-        print(f"Silhouette Score: {silhouette_avg:.3f}")
+        # Calculate cluster quality (sampled silhouette, streaming full-data metrics)
+        self.cluster_quality = evaluate_cluster_quality(
+            X_scaled, cluster_labels, centers=model.cluster_centers_,
+            sample_size=silhouette_sample_size, max_rows=max_rows
+        )
+        silhouette_avg = self.cluster_quality['silhouette']
+        print(f"Clustering completed with {model.n_clusters} clusters")
+        self._print_cluster_quality()
+        
+        return cluster_labels, silhouette_avg
+    
+    def _fit_visualization_pca(self, X_scaled, batch_size=10000):
+        """Fit the 2-D visualization PCA with self.pca_solver and project the training rows
+        
+        'incremental' fits IncrementalPCA on row batches and never holds more
+        than one centered batch next to X_scaled; 'randomized' uses the
+        randomized SVD, which is faster than 'full' for large populations.
+        """
+        if self.pca_solver == 'incremental':
+            self.pca_model = IncrementalPCA(n_components=2)
+            n_batches = max(1, -(-len(X_scaled) // batch_size))
+            # Equal-sized batches, so none is smaller than n_components
+            for rows in np.array_split(np.arange(len(X_scaled)), n_batches):
+                self.pca_model.partial_fit(X_scaled[rows[0]:rows[-1] + 1])
+        elif self.pca_solver in ('full', 'randomized', 'auto'):
+            self.pca_model = PCA(n_components=2, svd_solver=self.pca_solver, random_state=42)
+            self.pca_model.fit(X_scaled)
+        else:
+            raise ValueError(f"Unknown PCA solver: {self.pca_solver}")
+        
+        # Users appended after an earlier fit are in the old PCA basis
+        self.projected_users = []
+        return self.project_to_pca(X_scaled, batch_size)
+    
+    def project_to_pca(self, X_scaled, batch_size=10000):
+        """Visualization coordinates (n x 2) of scaled feature rows, transformed in batches"""
+        X_scaled = np.asarray(X_scaled, dtype=float)
+        X_pca = np.empty((len(X_scaled), 2))
+        for start in range(0, len(X_scaled), batch_size):
+            X_pca[start:start + batch_size] = self.pca_model.transform(X_scaled[start:start + batch_size])[:, :2]
+        return X_pca
+    
+    def _record_projected_users(self, user_ids, clusters, X_pca):
+        """Append newly assigned users to the visualization coordinates"""
+        self.projected_users.append(pd.DataFrame({
+            'user_id': user_ids,
+            'cluster': np.asarray(clusters),
+            'pca_x': X_pca[:, 0],
+            'pca_y': X_pca[:, 1]
+        }))
+        # Compact now and then, so the list and the rows it holds stay bounded
+        if (len(self.projected_users) > 64
+                or sum(len(frame) for frame in self.projected_users) > MAX_PROJECTED_USERS):
+            self.get_projected_users()
+    
+    def get_projected_users(self):
+        """Users assigned since the last fit with their PCA coordinates (one DataFrame)
+        
+        A user assigned more than once appears with the latest assignment;
+        at most MAX_PROJECTED_USERS of the most recent users are kept.
+        """
+        if not self.projected_users:
+            return pd.DataFrame(columns=['user_id', 'cluster', 'pca_x', 'pca_y'])
+        if len(self.projected_users) > 1 or len(self.projected_users[0]) > MAX_PROJECTED_USERS:
+            projected = pd.concat(self.projected_users, ignore_index=True)
+            repeated = projected['user_id'].notna() & projected.duplicated('user_id', keep='last')
+            projected = projected[~repeated].tail(MAX_PROJECTED_USERS).reset_index(drop=True)
+            self.projected_users = [projected]
+        return self.projected_users[0]
+    
+    def _drop_projected_user(self, user_id):
+        """Take a user out of the visualization coordinates of assigned users"""
+        if self.projected_users:
+            projected = self.get_projected_users()
+            self.projected_users = [projected[projected['user_id'] != user_id].reset_index(drop=True)]
+    
+    def _perform_streaming_clustering(self, n_clusters, clustering_features, chunk_size,
+                                      feature_source, n_passes, silhouette_sample_size, max_rows=None,
+                                      random_state=42):
+        """Fit scaler, MiniBatchKMeans and IncrementalPCA chunk by chunk"""
+        if feature_source is None:
+            feature_source = self._master_feature_chunks
+        
+        # Pass 1: NaN-aware moments per feature; StandardScaler.partial_fit turns
+        # a chunk whose column is all missing into NaN statistics
+        n_rows = 0
+        counts = np.zeros(len(clustering_features), dtype=np.int64)
+        sums = np.zeros(len(clustering_features))
+        sumsq = np.zeros(len(clustering_features))
+        for chunk in feature_source(clustering_features, chunk_size):
+            rows, chunk_counts, chunk_sums, chunk_sumsq = feature_moments(chunk[clustering_features])
+            n_rows += rows
+            counts += chunk_counts
+            sums += chunk_sums
+            sumsq += chunk_sumsq
+        self.scaler = scaler_from_moments(n_rows, counts, sums, sumsq)
+        self.feature_means = pd.Series(self.scaler.mean_, index=clustering_features)
+        
+        # Remaining passes: mini-batch k-means over the scaled chunks
+        self.clustering_model = MiniBatchKMeans(
+            n_clusters=n_clusters, random_state=random_state, batch_size=min(chunk_size, 4096), n_init=3
+        )
+        pending = []
+        for _ in range(n_passes):
+            for chunk in feature_source(clustering_features, chunk_size):
+                pending.append(self._scale_feature_chunk(chunk))
+                # The first partial_fit call needs at least n_clusters rows
+                if sum(len(x) for x in pending) < n_clusters:
+                    continue
+                self.clustering_model.partial_fit(np.vstack(pending))
+                pending = []
+        if pending and hasattr(self.clustering_model, 'cluster_centers_'):
+            self.clustering_model.partial_fit(np.vstack(pending))
+        
+        # Label the master dataset chunk-wise and fit the visualization PCA alongside
+        n_users = len(self.master_df)
+        rng = np.random.default_rng(42)
+        sample_rate = min(1.0, silhouette_sample_size / max(n_users, 1))
+        self.pca_model = IncrementalPCA(n_components=2)
+        cluster_labels = np.empty(n_users, dtype=np.int32)
+        metrics = StreamingClusterMetrics(self.clustering_model.cluster_centers_, max_rows=max_rows)
+        sample_X, sample_labels = [], []
+        pca_buffer = []
+        for start, chunk in self._master_chunks_with_offset(clustering_features, chunk_size):
+            X_chunk = self._scale_feature_chunk(chunk)
+            labels = self.clustering_model.predict(X_chunk)
+            cluster_labels[start:start + len(labels)] = labels
+            metrics.update(X_chunk, labels)
+            
+            keep = rng.random(len(labels)) < sample_rate
+            sample_X.append(X_chunk[keep])
+            sample_labels.append(labels[keep])
+            
+            # IncrementalPCA batches must hold at least n_components rows
+            pca_buffer.append(X_chunk)
+            if sum(len(x) for x in pca_buffer) >= 2:
+                self.pca_model.partial_fit(np.vstack(pca_buffer))
+                pca_buffer = []
+        
+        self.master_df['cluster'] = cluster_labels
+        self.analytics_cube = None
+        self.percentile_index = None
+        self.cluster_labels = cluster_labels
+        
+        # Silhouette on a sample instead of all O(N^2) pairs, weighted by true cluster sizes
+        self.cluster_quality = metrics.result()
+        self.cluster_quality.update(sampled_silhouette(
+            np.vstack(sample_X), np.concatenate(sample_labels), silhouette_sample_size,
+            population_counts=dict(enumerate(np.bincount(cluster_labels, minlength=n_clusters).tolist()))
+        ))
+        silhouette_avg = self.cluster_quality['silhouette']
+        print(f"Streaming clustering completed with {n_clusters} clusters")
+        self._print_cluster_quality()
         
-        # Create cluster summary
         self._create_cluster_summary()
         
-        # Perform PCA for visualization
-        self.pca_model = PCA(n_components=2)
-        X_pca = self.pca_model.fit_transform(X_scaled)
-        self.master_df['pca_x'] = X_pca[:, 0]
-        self.master_df['pca_y'] = X_pca[:, 1]
+        pca_x = np.empty(n_users)
+        pca_y = np.empty(n_users)
+        for start, chunk in self._master_chunks_with_offset(clustering_features, chunk_size):
+            X_pca = self.pca_model.transform(self._scale_feature_chunk(chunk))
+            pca_x[start:start + len(X_pca)] = X_pca[:, 0]
+            pca_y[start:start + len(X_pca)] = X_pca[:, 1]
+        self.master_df['pca_x'] = pca_x
+        self.master_df['pca_y'] = pca_y
+        self.projected_users = []
+        
+        # Users whose cluster changed get re-scored in the materialized table
+        if self.recommendation_store is not None:
+            self.materialize_recommendations(self.recommendation_store.k)
         
         return cluster_labels, silhouette_avg
     
-    def _create_cluster_summary(self):
-        """Create detailed summary of each cluster"""
-        cluster_summary = {}
+    def perform_sharded_clustering(self, shards, n_clusters=5, clustering_features=None, n_jobs=None,
+                                   chunk_size=100000, model_path=None, **kwargs):
+        """Map-reduce K-means over shards of the master dataset (CSV or Parquet files)
+        
+        For populations larger than memory: shards are read chunk-wise by a
+        process pool and only per-shard partial sums travel back, so neither
+        master_df nor the scaled matrix is ever materialized. Produces the
+        same scaler, KMeans, PCA, cluster summary and artifact as the
+        in-memory path; per-user labels are written per shard when labels_dir
+        is given (sharded_clustering.check_in_memory_equivalence compares both
+        paths on one dataset). See sharded_clustering.fit_sharded_clustering
+        for options.
+        """
+        return fit_sharded_clustering(
+            self, shards, n_clusters=n_clusters, clustering_features=clustering_features,
+            n_jobs=n_jobs, chunk_size=chunk_size, model_path=model_path, **kwargs
+        )
+    
+    def _print_cluster_quality(self):
+        """Print the headline cluster quality metrics"""
+        quality = self.cluster_quality
+        if quality['exact'] or quality['ci_low'] == quality['ci_high']:
+            print(f"Silhouette Score: {quality['silhouette']:.3f}")
+        else:
+            print(f"Silhouette Score: {quality['silhouette']:.3f} "
+                  f"({quality['confidence']:.0%} CI {quality['ci_low']:.3f}-{quality['ci_high']:.3f}, "
+                  f"sample of {quality['sample_size']})")
+        print(f"Calinski-Harabasz: {quality['calinski_harabasz']:.1f}, "
+              f"Davies-Bouldin: {quality['davies_bouldin']:.3f}")
+    
+    def _master_feature_chunks(self, clustering_features, chunk_size):
+        """Yield successive feature chunks from the master dataset"""
+        for _, chunk in self._master_chunks_with_offset(clustering_features, chunk_size):
+            yield chunk
+    
+    def _master_chunks_with_offset(self, clustering_features, chunk_size):
+        """Yield (row offset, feature chunk) pairs from the master dataset"""
+        for start in range(0, len(self.master_df), chunk_size):
+            yield start, self.master_df.iloc[start:start + chunk_size][clustering_features]
+    
+    def _scale_feature_chunk(self, chunk):
+        """Fill missing values with the fitted means and scale a feature chunk"""
+        fill_values = pd.Series(self.scaler.mean_, index=chunk.columns)
+        return self.scaler.transform(chunk.fillna(fill_values))
+    
+    def csv_feature_source(self, filepath):
+        """Build a chunked feature source over a CSV in master dataset format"""
+        def source(clustering_features, chunk_size):
+            for chunk in pd.read_csv(filepath, chunksize=chunk_size):
+                chunk = self._encode_categorical_features(chunk)
+                yield chunk[clustering_features]
+        return source
+    
+    def partial_fit_new_users(self, new_users):
+        """Update a streaming clustering model with newly arrived users"""
+        if self.clustering_model is None or not hasattr(self.clustering_model, 'partial_fit'):
+            print("Incremental updates require the streaming clustering mode")
+            return None
         
-        for cluster_id in sorted(self.master_df['cluster'].unique()):
-            cluster_data = self.master_df[self.master_df['cluster'] == cluster_id]
-            
-            summary = {
-                'size': len(cluster_data),
-                'percentage': round(len(cluster_data) / len(self.master_df) * 100, 1),
-                'demographics': {
-                    'avg_age': round(cluster_data['age'].mean(), 1),
-                    'gender_distribution': cluster_data['gender'].value_counts().to_dict(),
-                    'fitness_level_distribution': cluster_data['fitness_level'].value_counts().to_dict(),
-                    'top_cities': cluster_data['city'].value_counts().head(3).to_dict()
-                },
-                'health_metrics': {
-                    'avg_bmi': round(cluster_data['bmi'].mean(), 1),
-                    'avg_resting_hr': round(cluster_data['resting_heart_rate'].mean(), 1),
-                    'medical_conditions': cluster_data['medical_conditions'].value_counts().head(3).to_dict(),
-                    'avg_sleep_hours': round(cluster_data['sleep_hours_avg'].mean(), 1)
-                },
-                'activity_metrics': {
-                    'avg_steps': int(cluster_data['total_steps'].mean()),
-                    'avg_calories': int(cluster_data['total_calories_burned'].mean()),
-                    'avg_active_minutes': int(cluster_data['total_active_minutes'].mean()),
-                    'avg_exercise_sessions': round(cluster_data['exercise_sessions'].mean(), 1)
-                },
-                'insurance_distribution': cluster_data['current_insurance_provider'].value_counts().to_dict()
-            }
-            
-            # Generate cluster description
-            summary['description'] = self._generate_cluster_description(summary)
-            
-            cluster_summary[f'Cluster_{cluster_id}'] = summary
+        if isinstance(new_users, pd.DataFrame):
+            records = new_users.to_dict('records')
+        else:
+            records = list(new_users)
+        encoded_records = [self._encode_new_user_features(r) for r in records]
+        encoded = pd.DataFrame(encoded_records).reindex(columns=self.clustering_features)
+        X_scaled = self._scale_feature_chunk(encoded)
+        
+        self.clustering_model.partial_fit(X_scaled)
+        labels = self.clustering_model.predict(X_scaled)
+        
+        # Keep the cluster summaries live for the new arrivals
+        if self.cluster_summary is not None:
+            stats = self._get_cluster_stats()
+            for record, label in zip(encoded_records, labels):
+                stats.add(record, label)
+                if record.get('user_id') is not None:
+                    self.stats_members[record['user_id']] = label
+            self._refresh_cluster_summary(set(labels))
+        return labels
+    
+    def _create_cluster_summary(self):
+        """Create detailed summary of each cluster from one grouped aggregation pass"""
+        self.cluster_stats = compute_cluster_stats(self.master_df)
+        self.stats_members = {}
+        cluster_summary = build_cluster_summary(self.cluster_stats, self._generate_cluster_description)
         
         self.cluster_summary = cluster_summary
         return cluster_summary
     
+    def add_user_to_cluster_stats(self, user_record, cluster_id):
+        """Fold an assigned user into the running cluster statistics in O(features)"""
+        self._get_cluster_stats().add(user_record, cluster_id)
+        if user_record.get('user_id') is not None:
+            self.stats_members[user_record['user_id']] = cluster_id
+        self._refresh_cluster_summary([cluster_id])
+        if self.analytics_cube is not None:
+            self.analytics_cube.add(dict(user_record, cluster=cluster_id))
+        if self.percentile_index is not None:
+            self.percentile_index.add(dict(user_record, cluster=cluster_id))
+    
+    def _stats_cluster_of(self, user_id):
+        """Cluster a user currently counts towards in cluster_stats (None if not counted)"""
+        if user_id in self.stats_members:
+            return self.stats_members[user_id]
+        if self.master_df is None or 'cluster' not in self.master_df.columns:
+            return None
+        clusters = self.master_df.loc[self.master_df['user_id'] == user_id, 'cluster']
+        return None if clusters.empty else clusters.iloc[0]
+    
+    def remove_user_from_cluster_stats(self, user, cluster_id=None):
+        """Take a user (record or user_id) out of the running cluster statistics
+        
+        Users are only removed from the cluster they are counted in, and only
+        once. A record without a user_id needs cluster_id.
+        """
+        user_id = user if isinstance(user, str) else user.get('user_id')
+        if user_id is not None:
+            member_of = self._stats_cluster_of(user_id)
+            if member_of is None:
+                print(f"User {user_id} is not in the cluster statistics")
+                return
+            if cluster_id is not None and cluster_id != member_of:
+                print(f"User {user_id} is in cluster {member_of}, not {cluster_id}")
+                return
+            cluster_id = member_of
+        if cluster_id is None:
+            raise ValueError("cluster_id is required when removing a user record")
+        
+        stats = self._get_cluster_stats()
+        if isinstance(user, str):
+            user_rows = self.master_df[self.master_df['user_id'] == user]
+            if user_rows.empty:
+                print(f"User {user} has no record to remove; pass the record instead")
+                return
+            user = user_rows.iloc[0]
+        if stats.sizes.get(cluster_id, 0) <= 0:
+            print(f"Cluster {cluster_id} has no users to remove")
+            return
+        
+        stats.remove(user, cluster_id)
+        if user_id is not None:
+            self.stats_members[user_id] = None
+            self._drop_projected_user(user_id)
+        self._refresh_cluster_summary([cluster_id])
+        if self.analytics_cube is not None:
+            self.analytics_cube.remove(dict(user, cluster=cluster_id))
+        if self.percentile_index is not None:
+            self.percentile_index.remove(dict(user, cluster=cluster_id))
+    
+    def _refresh_cluster_summary(self, cluster_ids):
+        """Rebuild summaries of changed clusters and the percentages of all clusters"""
+        stats = self._get_cluster_stats()
+        rebuilt = build_cluster_summary(stats, self._generate_cluster_description, cluster_ids=cluster_ids)
+        for cluster_id in cluster_ids:
+            key = f'Cluster_{cluster_id}'
+            if key in rebuilt:
+                # Assigned in place, so existing clusters keep their order
+                self.cluster_summary[key] = rebuilt[key]
+            else:
+                self.cluster_summary.pop(key, None)
+        
+        total = stats.total
+        for cluster_id, size in stats.sizes.items():
+            summary = self.cluster_summary.get(f'Cluster_{cluster_id}')
+            if summary is not None:
+                summary['percentage'] = round(size / total * 100, 1)
+    
+    def _get_cluster_stats(self):
+        """Return the shared per-cluster statistics, computing them if needed"""
+        if self.cluster_stats is None:
+            self.cluster_stats = compute_cluster_stats(self.master_df)
+            self.stats_members = {}
+        return self.cluster_stats
+    
+    def _get_analytics_cube(self):
+        """Return the provider x cluster x age band x gender x fitness cube, building it if needed"""
+        if self.analytics_cube is None:
+            if self.master_df is None:
+                self.load_and_prepare_data()
+            self.analytics_cube = AnalyticsCube.build(self.master_df)
+        return self.analytics_cube
+    
+    def query_analytics_cube(self, group_by=(), filters=None, metrics=None):
+        """Ad-hoc slice from the pre-aggregated cube: counts, means and standard deviations
+        
+        group_by and filter keys are cube dimensions ('provider', 'cluster',
+        'age_band', 'gender', 'fitness_level'); filter values may be lists,
+        e.g. query_analytics_cube(['cluster'], {'provider': 'TK', 'gender': 'Female'}).
+        """
+        return self._get_analytics_cube().aggregate(group_by, filters, metrics)
+    
+    def _get_percentile_index(self):
+        """Return the sorted per-cohort metric arrays, building them if needed"""
+        if self.percentile_index is None:
+            if self.master_df is None:
+                self.load_and_prepare_data()
+            self.percentile_index = PercentileIndex.build(self.master_df)
+        return self.percentile_index
+    
+    def user_percentiles(self, user_id, metrics=None, dimensions=None):
+        """A user's percentile per metric overall and within their age band, gender, provider and cluster"""
+        if self.master_df is None:
+            self.load_and_prepare_data()
+        user_rows = self.master_df[self.master_df['user_id'] == user_id]
+        if user_rows.empty:
+            return {"error": f"User {user_id} not found"}
+        return self._get_percentile_index().user_percentiles(user_rows.iloc[0], metrics, dimensions)
+    
+    def export_percentile_index(self, filepath='percentile_index.npz'):
+        """Export the percentile index for the API to serve rank lookups"""
+        self._get_percentile_index().save(filepath)
+    
     def _generate_cluster_description(self, summary):
         """Generate human-readable description for cluster"""
         avg_age = summary['demographics']['avg_age']
@@ -210,12 +691,27 @@ class AdminAnalytics:
         
         return description
     
-    def visualize_clusters(self, save_path=None):
-        """Create comprehensive cluster visualizations"""
+    def visualize_clusters(self, save_path=None, mode='auto', bins=80, sample_size=2000,
+                           density_threshold=20000):
+        """Create comprehensive cluster visualizations
+        
+        mode='points' draws one marker per user. mode='density' bins the PCA
+        coordinates into a bins x bins grid per cluster (one marker per
+        occupied tile, opacity by count) plus a stratified sample of at most
+        sample_size users for hover detail, and draws the age box plots from
+        precomputed quartiles, so the figure size no longer grows with the
+        population. mode='auto' switches to density above density_threshold
+        users.
+        """
         if self.cluster_labels is None:
             print("Please run clustering first")
             return
         
+        if mode == 'auto':
+            mode = 'density' if len(self.master_df) > density_threshold else 'points'
+        if mode not in ('points', 'density'):
+            raise ValueError(f"Unknown visualization mode: {mode}")
+        
         # Create subplots
         fig = make_subplots(
             rows=3, cols=2,
@@ -232,16 +728,37 @@ class AdminAnalytics:
         )
         
         # 1. PCA Scatter Plot
-        for cluster_id in sorted(self.master_df['cluster'].unique()):
-            cluster_data = self.master_df[self.master_df['cluster'] == cluster_id]
+        if mode == 'density':
+            self._add_density_scatter(fig, bins, sample_size)
+        else:
+            for cluster_id in sorted(self.master_df['cluster'].unique()):
+                cluster_data = self.master_df[self.master_df['cluster'] == cluster_id]
+                fig.add_trace(
+                    go.Scatter(
+                        x=cluster_data['pca_x'],
+                        y=cluster_data['pca_y'],
+                        mode='markers',
+                        name=f'Cluster {cluster_id}',
+                        text=cluster_data['user_id'],
+                        hovertemplate='User: %{text}<br>Cluster: ' + str(cluster_id)
+                    ),
+                    row=1, col=1
+                )
+        
+        # Users assigned since the fit, projected with the stored PCA components
+        projected = self.get_projected_users()
+        if mode == 'density':
+            projected = projected.tail(sample_size)
+        if len(projected):
             fig.add_trace(
                 go.Scatter(
-                    x=cluster_data['pca_x'],
-                    y=cluster_data['pca_y'],
+                    x=projected['pca_x'],
+                    y=projected['pca_y'],
                     mode='markers',
-                    name=f'Cluster {cluster_id}',
-                    text=cluster_data['user_id'],
-                    hovertemplate='User: %{text}<br>Cluster: ' + str(cluster_id)
+                    marker=dict(symbol='x', size=9, color='black'),
+                    name='New users',
+                    text=projected['user_id'].astype(str) + ' (Cluster ' + projected['cluster'].astype(str) + ')',
+                    hovertemplate='User: %{text}'
                 ),
                 row=1, col=1
             )
@@ -258,19 +775,35 @@ class AdminAnalytics:
         )
         
         # 3. Age Distribution by Cluster (Box Plot)
-        for cluster_id in sorted(self.master_df['cluster'].unique()):
-            cluster_data = self.master_df[self.master_df['cluster'] == cluster_id]
-            fig.add_trace(
-                go.Box(
-                    y=cluster_data['age'],
-                    name=f'Cluster {cluster_id}',
-                    showlegend=False
-                ),
-                row=2, col=1
-            )
+        if mode == 'density':
+            # Quartiles computed here; the figure carries five numbers per cluster
+            quartiles = self.master_df.groupby('cluster')['age'].quantile([0, 0.25, 0.5, 0.75, 1]).unstack()
+            for cluster_id, q in quartiles.iterrows():
+                fig.add_trace(
+                    go.Box(
+                        q1=[q[0.25]], median=[q[0.5]], q3=[q[0.75]],
+                        lowerfence=[q[0.0]], upperfence=[q[1.0]],
+                        name=f'Cluster {cluster_id}',
+                        showlegend=False
+                    ),
+                    row=2, col=1
+                )
+        else:
+            for cluster_id in sorted(self.master_df['cluster'].unique()):
+                cluster_data = self.master_df[self.master_df['cluster'] == cluster_id]
+                fig.add_trace(
+                    go.Box(
+                        y=cluster_data['age'],
+                        name=f'Cluster {cluster_id}',
+                        showlegend=False
+                    ),
+                    row=2, col=1
+                )
+        
+        cluster_means = self._get_cluster_stats().means
         
         # 4. Activity Levels by Cluster (Bar Chart)
-        cluster_activity = self.master_df.groupby('cluster')['total_steps'].mean()
+        cluster_activity = cluster_means['total_steps']
         fig.add_trace(
             go.Bar(
                 x=[f'Cluster {i}' for i in cluster_activity.index],
@@ -282,7 +815,7 @@ class AdminAnalytics:
         )
         
         # 5. Health Metrics by Cluster (BMI)
-        cluster_bmi = self.master_df.groupby('cluster')['bmi'].mean()
+        cluster_bmi = cluster_means['bmi']
         fig.add_trace(
             go.Bar(
                 x=[f'Cluster {i}' for i in cluster_bmi.index],
@@ -318,6 +851,71 @@ class AdminAnalytics:
         fig.show()
         return fig
     
+    def cluster_density_tiles(self, bins=80):
+        """Count users per (cluster, x tile, y tile) on one shared PCA grid in a single pass
+        
+        Returns (cluster ids, counts of shape clusters x bins x bins, x edges, y edges).
+        """
+        x = self.master_df['pca_x'].to_numpy(dtype=float)
+        y = self.master_df['pca_y'].to_numpy(dtype=float)
+        cluster_ids, inverse = np.unique(self.master_df['cluster'].to_numpy(), return_inverse=True)
+        
+        x_edges = np.linspace(x.min(), x.max(), bins + 1)
+        y_edges = np.linspace(y.min(), y.max(), bins + 1)
+        x_bin = np.clip(np.searchsorted(x_edges, x, side='right') - 1, 0, bins - 1)
+        y_bin = np.clip(np.searchsorted(y_edges, y, side='right') - 1, 0, bins - 1)
+        
+        flat = (inverse * bins + x_bin) * bins + y_bin
+        counts = np.bincount(flat, minlength=len(cluster_ids) * bins * bins)
+        return cluster_ids, counts.reshape(len(cluster_ids), bins, bins), x_edges, y_edges
+    
+    def _add_density_scatter(self, fig, bins, sample_size):
+        """PCA panel as per-cluster density tiles plus a capped stratified point sample"""
+        cluster_ids, counts, x_edges, y_edges = self.cluster_density_tiles(bins)
+        x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+        y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+        max_count = max(int(counts.max()), 1)
+        colors = px.colors.qualitative.Plotly
+        
+        for i, cluster_id in enumerate(cluster_ids):
+            x_bin, y_bin = np.nonzero(counts[i])
+            tile_counts = counts[i, x_bin, y_bin]
+            fig.add_trace(
+                go.Scatter(
+                    x=x_centers[x_bin],
+                    y=y_centers[y_bin],
+                    mode='markers',
+                    marker=dict(
+                        symbol='square', size=6, color=colors[i % len(colors)],
+                        opacity=0.2 + 0.8 * np.log1p(tile_counts) / np.log1p(max_count)
+                    ),
+                    name=f'Cluster {cluster_id}',
+                    legendgroup=f'cluster-{cluster_id}',
+                    customdata=tile_counts,
+                    hovertemplate=f'Cluster {cluster_id}<br>Users in tile: %{{customdata}}<extra></extra>'
+                ),
+                row=1, col=1
+            )
+        
+        # Individual users for hover detail, every cluster represented proportionally
+        sample = self.master_df.iloc[stratified_sample_indices(self.master_df['cluster'].to_numpy(), sample_size)]
+        for i, cluster_id in enumerate(cluster_ids):
+            cluster_data = sample[sample['cluster'] == cluster_id]
+            fig.add_trace(
+                go.Scatter(
+                    x=cluster_data['pca_x'],
+                    y=cluster_data['pca_y'],
+                    mode='markers',
+                    marker=dict(size=3, color=colors[i % len(colors)]),
+                    name=f'Cluster {cluster_id} (sample)',
+                    legendgroup=f'cluster-{cluster_id}',
+                    showlegend=False,
+                    text=cluster_data['user_id'],
+                    hovertemplate='User: %{text}<br>Cluster: ' + str(cluster_id)
+                ),
+                row=1, col=1
+            )
+    
     def print_cluster_summary(self):
         """Print detailed cluster analysis"""
         if self.cluster_summary is None:
@@ -352,32 +950,32 @@ class AdminAnalytics:
             
             print("\n" + "="*50 + "\n")
     
-    def assign_new_user_to_cluster(self, new_user_data):
-        """Assign a new user to the most appropriate cluster"""
+    def assign_new_user_to_cluster(self, new_user_data, update_stats=False):
+        """Assign a new user to the most appropriate cluster
+        
+        With update_stats the user is folded into the running cluster
+        statistics, so cluster_summary stays current without re-clustering.
+        cluster_size is the size of the cluster before the assignment.
+        """
         if self.clustering_model is None:
             print("Please run clustering first")
             return None
         
         # Ensure new user data has all required features
-        clustering_features = [
-            'age', 'bmi', 'fitness_level_encoded', 'gender_encoded',
-            'total_steps', 'total_calories_burned', 'total_active_minutes',
-            'exercise_frequency_per_week', 'resting_heart_rate',
-            'sleep_hours_avg', 'stress_level_avg', 'income_numeric',
-            'has_medical_condition'
-        ]
+        clustering_features = self.clustering_features or DEFAULT_CLUSTERING_FEATURES
         
         # Encode categorical features for new user
         new_user_encoded = self._encode_new_user_features(new_user_data)
         
         # Prepare feature vector
+        feature_means = self._get_feature_means()
         feature_vector = []
         for feature in clustering_features:
             if feature in new_user_encoded:
                 feature_vector.append(new_user_encoded[feature])
             else:
-                # Use mean value from training data
-                feature_vector.append(self.master_df[feature].mean())
+                # Use cached mean value from training data
+                feature_vector.append(feature_means[feature])
         
         # Scale features
         feature_vector_scaled = self.scaler.transform([feature_vector])
@@ -395,74 +993,150 @@ class AdminAnalytics:
             'confidence_score': self._calculate_assignment_confidence(feature_vector_scaled, predicted_cluster)
         }
         
+        if update_stats and self.cluster_summary is not None:
+            self.add_user_to_cluster_stats(new_user_encoded, predicted_cluster)
+        
+        # Position in the visualization space of the fitted PCA
+        if self.pca_model is not None:
+            X_pca = self.project_to_pca(feature_vector_scaled)
+            self._record_projected_users([new_user_data.get('user_id')], [predicted_cluster], X_pca)
+            result['pca_x'] = float(X_pca[0, 0])
+            result['pca_y'] = float(X_pca[0, 1])
+        
         return result
     
-    def _encode_new_user_features(self, user_data):
-        """Encode categorical features for a new user"""
-        encoded = user_data.copy()
+    def assign_new_users_to_clusters(self, new_users, update_stats=False):
+        """Assign a batch of new users (DataFrame or list of dicts) to clusters
         
-        # Fitness level encoding
-        fitness_map = {'Beginner': 0, 'Intermediate': 1, 'Advanced': 2}
-        if 'fitness_level' in encoded:
-            encoded['fitness_level_encoded'] = fitness_map.get(encoded['fitness_level'], 0)
+        Records are encoded column-wise, missing features are filled from the
+        cached training means and distances to all centers come from one
+        matrix operation. Returns a dict of arrays aligned with the input rows.
+        """
+        if self.clustering_model is None:
+            print("Please run clustering first")
+            return None
         
-        # Gender encoding
-        gender_map = {'Male': 0, 'Female': 1}
-        if 'gender' in encoded:
-            encoded['gender_encoded'] = gender_map.get(encoded['gender'], 0)
+        clustering_features = self.clustering_features or DEFAULT_CLUSTERING_FEATURES
+        encoded = self._encode_new_users_frame(new_users)
+        X = encoded.reindex(columns=clustering_features).astype(float)
+        X = X.fillna(self._get_feature_means()[clustering_features])
+        X_scaled = self.scaler.transform(X)
         
-        # Smoking status encoding
-        smoking_map = {'Non-smoker': 0, 'Ex-smoker': 1, 'Smoker': 2}
-        if 'smoking_status' in encoded:
-            encoded['smoking_encoded'] = smoking_map.get(encoded['smoking_status'], 0)
+        distances = self._center_distances(X_scaled)
+        predicted_clusters = distances.argmin(axis=1)
+        confidence_scores = self._assignment_confidences(distances, predicted_clusters)
         
-        # Alcohol consumption encoding
-        alcohol_map = {'Low': 0, 'Moderate': 1, 'High': 2}
-        if 'alcohol_consumption' in encoded:
-            encoded['alcohol_encoded'] = alcohol_map.get(encoded['alcohol_consumption'], 0)
+        n_clusters = len(self.clustering_model.cluster_centers_)
+        cluster_info = [self.cluster_summary.get(f'Cluster_{i}', {}) for i in range(n_clusters)]
+        descriptions = np.array([info.get('description', 'No description') for info in cluster_info], dtype=object)
+        sizes = np.array([info.get('size', 0) for info in cluster_info])
+        
+        result = {
+            'predicted_cluster': predicted_clusters,
+            'cluster_description': descriptions[predicted_clusters],
+            'cluster_size': sizes[predicted_clusters],
+            'confidence_score': confidence_scores
+        }
+        
+        if update_stats and self.cluster_summary is not None and len(encoded):
+            self._get_cluster_stats().add_frame(encoded, predicted_clusters)
+            if 'user_id' in encoded.columns:
+                self.stats_members.update(zip(encoded['user_id'].tolist(), predicted_clusters.tolist()))
+            self._refresh_cluster_summary(sorted(set(predicted_clusters.tolist())))
+            if self.analytics_cube is not None:
+                self.analytics_cube.add_frame(encoded.assign(cluster=predicted_clusters))
+            if self.percentile_index is not None:
+                self.percentile_index.add_frame(encoded.assign(cluster=predicted_clusters))
+        
+        if self.pca_model is not None:
+            X_pca = self.project_to_pca(X_scaled)
+            user_ids = encoded['user_id'].to_numpy() if 'user_id' in encoded.columns else [None] * len(encoded)
+            self._record_projected_users(user_ids, predicted_clusters, X_pca)
+            result['pca_x'] = X_pca[:, 0]
+            result['pca_y'] = X_pca[:, 1]
+        
+        return result
+    
+    def _get_feature_means(self):
+        """Training means of the clustering features, computed once and cached"""
+        if self.feature_means is None:
+            clustering_features = self.clustering_features or DEFAULT_CLUSTERING_FEATURES
+            self.feature_means = self.master_df[clustering_features].mean()
+        return self.feature_means
+    
+    def _encode_new_user_features(self, user_data):
+        """Encode categorical features for a new user"""
+        encoded = user_data.copy()
+        
+        # Fitness level, gender, smoking, alcohol and income encodings
+        for source, target, mapping, default in NEW_USER_ENCODINGS:
+            if source in encoded:
+                encoded[target] = mapping.get(encoded[source], default)
         
         # Medical conditions binary encoding
         if 'medical_conditions' in encoded:
             encoded['has_medical_condition'] = 1 if encoded['medical_conditions'] != 'None' else 0
         
-        # Income bracket encoding
-        income_map = {
-            '30000-35000': 32500, '35000-40000': 37500, '40000-50000': 45000,
-            '50000-75000': 62500, '75000-100000': 87500, '100000+': 110000
-        }
-        if 'income_bracket' in encoded:
-            encoded['income_numeric'] = income_map.get(encoded['income_bracket'], 50000)
-        
         return encoded
     
+    def _encode_new_users_frame(self, new_users):
+        """Vectorized counterpart of _encode_new_user_features for many records"""
+        if isinstance(new_users, pd.DataFrame):
+            df = new_users.reset_index(drop=True).copy()
+        else:
+            df = pd.DataFrame(list(new_users))
+        
+        for source, target, mapping, default in NEW_USER_ENCODINGS:
+            if source in df.columns:
+                encoded = df[source].map(mapping)
+                # Unknown categories get the default, absent values stay missing
+                df[target] = encoded.where(encoded.notna() | df[source].isna(), default)
+        
+        if 'medical_conditions' in df.columns:
+            has_condition = (df['medical_conditions'] != 'None').astype(float)
+            df['has_medical_condition'] = has_condition.where(df['medical_conditions'].notna())
+        
+        return df
+    
+    def _center_distances(self, X_scaled):
+        """Euclidean distances from every row to every cluster center"""
+        centers = self.clustering_model.cluster_centers_
+        squared = (
+            np.einsum('ij,ij->i', X_scaled, X_scaled)[:, None]
+            - 2 * X_scaled @ centers.T
+            + np.einsum('ij,ij->i', centers, centers)[None, :]
+        )
+        return np.sqrt(np.maximum(squared, 0))
+    
+    def _assignment_confidences(self, distances, predicted_clusters):
+        """Confidence per row: how close the assigned center is relative to the nearest/farthest"""
+        min_distance = distances.min(axis=1)
+        max_distance = distances.max(axis=1)
+        assigned = distances[np.arange(len(distances)), predicted_clusters]
+        spread = max_distance - min_distance
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            confidence = 1 - (assigned - min_distance) / spread
+        return np.where(spread == 0, 1.0, np.round(confidence, 3))
+    
     def _calculate_assignment_confidence(self, feature_vector_scaled, predicted_cluster):
         """Calculate confidence score for cluster assignment"""
         # Calculate distances to all cluster centers
-        distances = []
-        for center in self.clustering_model.cluster_centers_:
-            distance = np.linalg.norm(feature_vector_scaled[0] - center)
-            distances.append(distance)
+        distances = self._center_distances(np.asarray(feature_vector_scaled, dtype=float))
         
         # Confidence is inversely related to distance to assigned cluster
-        min_distance = min(distances)
-        max_distance = max(distances)
-        
-        if max_distance == min_distance:
-            return 1.0
-        
-        confidence = 1 - (distances[predicted_cluster] - min_distance) / (max_distance - min_distance)
-        return round(confidence, 3)
+        return float(self._assignment_confidences(distances, np.array([predicted_cluster]))[0])
     
     def build_recommendation_engine(self):
-        """Build comprehensive recommendation engine"""
-        if self.master_df is None:
-            self.load_and_prepare_data()
+        """Build comprehensive recommendation engine
         
-        # Create user-service interaction matrix for collaborative filtering
-        user_provider_matrix = pd.crosstab(
-            self.master_df['user_id'], 
-            self.master_df['current_insurance_provider']
-        )
+        Needs only the per-cluster statistics and the services catalog, so it
+        also works after sharded clustering, where master_df is never loaded.
+        """
+        if self.cluster_stats is None and self.master_df is None:
+            self.load_and_prepare_data()
+        if self.services_df is None:
+            self.load_services_catalog()
         
         # Calculate service popularity scores
         service_popularity = self.services_df.groupby('category')['popularity_score'].mean()
@@ -470,14 +1144,14 @@ class AdminAnalytics:
         # Create recommendation rules based on clusters
         recommendation_rules = {}
         
-        for cluster_id in sorted(self.master_df['cluster'].unique()):
-            cluster_data = self.master_df[self.master_df['cluster'] == cluster_id]
-            
+        cluster_means = self._get_cluster_stats().means
+        
+        for cluster_id in sorted(cluster_means.index):
             # Analyze cluster characteristics
-            avg_fitness = cluster_data['fitness_level_encoded'].mean()
-            avg_age = cluster_data['age'].mean()
-            avg_activity = cluster_data['total_calories_burned'].mean()
-            has_conditions = cluster_data['has_medical_condition'].mean()
+            avg_fitness = cluster_means.loc[cluster_id, 'fitness_level_encoded']
+            avg_age = cluster_means.loc[cluster_id, 'age']
+            avg_activity = cluster_means.loc[cluster_id, 'total_calories_burned']
+            has_conditions = cluster_means.loc[cluster_id, 'has_medical_condition']
             
             # Define recommendation priorities
             rules = []
@@ -501,12 +1175,21 @@ class AdminAnalytics:
             recommendation_rules[cluster_id] = rules
         
         self.recommendation_rules = recommendation_rules
+        self.recommendation_tables = CompiledRecommendationTables(
+            self.services_df, recommendation_rules, **self._catalog_table_args()
+        )
         print("Recommendation engine built successfully")
         
         return recommendation_rules
     
     def get_user_service_recommendations(self, user_id, n_recommendations=2):
-        """Get service recommendations for a specific user"""
+        """Get service recommendations for a specific user
+        
+        Served from the materialized recommendation table when it holds an
+        entry for the user; otherwise scored on the fly (and the entry is
+        filled in). Entries computed from an older version of the user's row
+        are treated as missing.
+        """
         if self.master_df is None:
             self.load_and_prepare_data()
         
@@ -514,29 +1197,42 @@ class AdminAnalytics:
         if user_data.empty:
             return {"error": f"User {user_id} not found"}
         
+        store = self.recommendation_store
+        use_store = store is not None and n_recommendations <= store.k
+        if use_store:
+            if self.reload_services_if_changed():
+                self.materialize_recommendations(store.k)
+            fingerprint = row_fingerprints(user_data.iloc[:1], store.key_columns)[0]
+            entry = store.lookup(user_id, self._get_recommendation_tables().fingerprint, fingerprint=fingerprint)
+            if entry is not None and entry['service_ids']:
+                return self._format_stored_recommendations(user_id, entry, n_recommendations)
+        
         user = user_data.iloc[0]
         user_cluster = user['cluster']
         user_provider_id = user['provider_id']
         
-        # Get services from user's insurance provider
-        provider_services = self.services_df[
-            self.services_df['provider_id'] == user_provider_id
-        ].copy()
+        # Score the services of the user's insurance provider from the compiled tables
+        tables = self._get_recommendation_tables()
+        service_index, scores = tables.score_provider_services(user, user_cluster, user_provider_id)
         
-        if provider_services.empty:
+        if len(service_index) == 0:
             return {"error": "No services found for user's insurance provider"}
         
-        # Calculate relevance scores
-        provider_services['relevance_score'] = provider_services.apply(
-            lambda service: self._calculate_service_relevance_score(user, service, user_cluster), 
-            axis=1
-        )
-        
         # Get top recommendations
-        top_services = provider_services.nlargest(n_recommendations, 'relevance_score')
+        top = top_k_positions(scores, n_recommendations)
+        
+        if use_store and store.context == tables.fingerprint:
+            stored = top_k_positions(scores, store.k)
+            store.put(
+                user_id, fingerprint,
+                tables.services_df['service_id'].to_numpy()[service_index[stored]].tolist(),
+                list(scores[stored]),
+                cluster=user_cluster, current_insurance_provider=user['current_insurance_provider']
+            )
         
         recommendations = []
-        for _, service in top_services.iterrows():
+        for position in top:
+            service = tables.services_df.iloc[service_index[position]]
             recommendations.append({
                 "service_id": service['service_id'],
                 "service_name": service['service_name'],
@@ -544,7 +1240,7 @@ class AdminAnalytics:
                 "description": service['description'],
                 "reward_amount": service['reward_amount'],
                 "reward_type": service['reward_type'],
-                "relevance_score": round(service['relevance_score'], 2),
+                "relevance_score": round(scores[position], 2),
                 "eligibility_criteria": service['eligibility_criteria'],
                 "popularity_score": service['popularity_score']
             })
@@ -556,6 +1252,147 @@ class AdminAnalytics:
             "recommendations": recommendations
         }
     
+    def _format_stored_recommendations(self, user_id, entry, n_recommendations):
+        """Build the recommendations response from a materialized table entry"""
+        tables = self._get_recommendation_tables()
+        recommendations = []
+        for service_id, score in list(zip(entry['service_ids'], entry['scores']))[:n_recommendations]:
+            service = tables.service_rows[tables.service_positions[service_id]]
+            recommendations.append({
+                "service_id": service['service_id'],
+                "service_name": service['service_name'],
+                "category": service['category'],
+                "description": service['description'],
+                "reward_amount": service['reward_amount'],
+                "reward_type": service['reward_type'],
+                "relevance_score": round(score, 2),
+                "eligibility_criteria": service['eligibility_criteria'],
+                "popularity_score": service['popularity_score']
+            })
+        
+        return {
+            "user_id": user_id,
+            "user_cluster": entry['cluster'],
+            "insurance_provider": entry['current_insurance_provider'],
+            "recommendations": recommendations
+        }
+    
+    def materialize_recommendations(self, n_recommendations=2, filepath=None):
+        """Precompute every user's top services so requests become table lookups
+        
+        Re-running it only re-scores users whose relevant columns changed
+        (including their cluster after re-clustering); changed rules or a
+        changed services catalog re-score everyone.
+        """
+        if self.master_df is None:
+            self.load_and_prepare_data()
+        self.reload_services_if_changed()
+        
+        store = self.recommendation_store
+        if store is None or store.k != n_recommendations:
+            store = RecommendationStore(k=n_recommendations, key_columns=RECOMMENDATION_KEY_COLUMNS)
+            self.recommendation_store = store
+        
+        tables = self._get_recommendation_tables()
+        has_clusters = 'cluster' in self.master_df.columns
+        result = store.refresh(
+            self.master_df,
+            lambda users: tables.score_all_users(users, users['cluster'].to_numpy() if has_clusters else None),
+            tables.services_df['service_id'],
+            tables.fingerprint,
+            extra_columns=('cluster', 'current_insurance_provider')
+        )
+        print(f"Materialized recommendations: {result['recomputed']} recomputed, "
+              f"{result['reused']} reused, {result['dropped']} dropped")
+        
+        if filepath:
+            store.save(filepath)
+            print(f"Recommendation table saved to {filepath}")
+        return result
+    
+    def load_materialized_recommendations(self, filepath):
+        """Load a saved recommendation table; stale entries are refreshed on demand"""
+        self.recommendation_store = RecommendationStore.load(filepath)
+        print(f"Recommendation table loaded from {filepath}")
+    
+    def _get_eligibility_engine(self):
+        """Parsed eligibility predicates for the current services catalog"""
+        engine = self.eligibility_engine
+        if engine is None or engine.source_services_df is not self.services_df:
+            engine = EligibilityEngine(self.services_df)
+            self.eligibility_engine = engine
+        return engine
+    
+    def get_user_eligibility(self, user_id):
+        """Eligibility and expected annual reward for each of a user's provider services"""
+        if self.master_df is None:
+            self.load_and_prepare_data()
+        
+        user_data = self.master_df[self.master_df['user_id'] == user_id]
+        if user_data.empty:
+            return {"error": f"User {user_id} not found"}
+        
+        self.reload_services_if_changed()
+        services = self._get_eligibility_engine().user_eligibility(user_data)
+        return {
+            "user_id": user_id,
+            "insurance_provider": user_data['current_insurance_provider'].iloc[0],
+            "eligible_services": [service for service in services if service['eligible']],
+            "ineligible_services": [service for service in services if not service['eligible']],
+            "expected_annual_reward": sum(service['expected_annual_reward'] for service in services)
+        }
+    
+    def get_program_eligibility_report(self, provider_id=None):
+        """Eligible members and expected payout per bonus program (optionally one provider)"""
+        if self.master_df is None:
+            self.load_and_prepare_data()
+        
+        self.reload_services_if_changed()
+        report = self._get_eligibility_engine().program_report(self.master_df)
+        if provider_id is not None:
+            report = report[report['provider_id'] == provider_id].reset_index(drop=True)
+        return report
+    
+    def reload_services_if_changed(self):
+        """Pick up insurance_providers.csv / insurance_services.csv changes made on disk"""
+        if self.catalog is None or not self.catalog.reload_if_changed():
+            return False
+        self.services_df = self.catalog.services_df
+        self.insurance_df = self.catalog.providers_df
+        return True
+    
+    def score_all_user_services(self, provider_only=True):
+        """Relevance of every service for every user as a users x services DataFrame
+        
+        Services outside a user's insurance provider score -inf unless
+        provider_only is False.
+        """
+        if self.master_df is None:
+            self.load_and_prepare_data()
+        
+        tables = self._get_recommendation_tables()
+        clusters = self.master_df['cluster'].to_numpy() if 'cluster' in self.master_df.columns else None
+        scores = tables.score_all_users(self.master_df, clusters, provider_only=provider_only)
+        return pd.DataFrame(scores, index=self.master_df['user_id'], columns=tables.services_df['service_id'])
+    
+    def _get_recommendation_tables(self):
+        """Compiled scoring tables for the current rules and services catalog"""
+        rules = getattr(self, 'recommendation_rules', None)
+        tables = self.recommendation_tables
+        if (tables is None or tables.recommendation_rules is not rules
+                or tables.source_services_df is not self.services_df):
+            tables = CompiledRecommendationTables(self.services_df, rules,
+                                                  **self._catalog_table_args())
+            self.recommendation_tables = tables
+        return tables
+    
+    def _catalog_table_args(self):
+        """The catalog's provider slices and parsed arrays, if services_df is the catalog's frame"""
+        if self.catalog is not None and self.catalog.services_df is self.services_df:
+            return {'provider_slices': self.catalog.provider_slices,
+                    'service_arrays': self.catalog.arrays}
+        return {}
+    
     def _calculate_service_relevance_score(self, user, service, user_cluster):
         """Calculate relevance score for a service given user profile"""
         base_score = service['popularity_score']
@@ -589,7 +1426,7 @@ class AdminAnalytics:
             base_score += 1  # Generally applicable
         
         # Digital preference for younger users
-        if service.get('digital_app_required') and user['age'] < 40:
+        if parse_yes_no(service.get('digital_app_required')) and user['age'] < 40:
             base_score += 0.5
         
         # Reward amount consideration
@@ -598,11 +1435,81 @@ class AdminAnalytics:
         
         return base_score
     
-    def generate_admin_dashboard(self, save_path=None):
-        """Generate comprehensive admin dashboard"""
+    def admin_dashboard_data(self):
+        """Series behind the eight admin dashboard panels, answered from the analytics cube"""
         if self.master_df is None:
             self.load_and_prepare_data()
         
+        cube = self._get_analytics_cube()
+        
+        # 1. Demographics Overview
+        age_dist = cube.counts('age_band', {'age_band': AGE_BAND_LABELS})
+        age_dist = age_dist.reindex(AGE_BAND_LABELS, fill_value=0).sort_values(ascending=False, kind='stable')
+        
+        # 2. Activity Distribution
+        step_edges, step_counts = cube.histogram('total_steps')
+        
+        # 3. Health Metrics (BMI distribution by gender)
+        bmi_quantiles = cube.quantiles('bmi', group_by='gender')
+        bmi_stats = cube.aggregate(['gender'], metrics=['bmi']).set_index('gender')
+        genders = list(bmi_quantiles)
+        
+        # 4. Insurance Market Share
+        insurance_dist = cube.counts('provider')
+        
+        # 5. Fitness vs Activity Correlation (mean +/- std per fitness level)
+        fitness_stats = cube.aggregate(
+            ['fitness_level'], metrics=['fitness_level_encoded', 'total_calories_burned']
+        ).sort_values('fitness_level_encoded_mean')
+        
+        # 6. Service Category Popularity
+        service_popularity = self.services_df['category'].value_counts()
+        
+        # 7. Cluster Performance (if clustering is done)
+        cluster_performance = None
+        if self.cluster_labels is not None:
+            performance = cube.aggregate(['cluster'], metrics=['total_calories_burned'])
+            performance = performance[performance['cluster'] != NO_CLUSTER].sort_values('cluster')
+            cluster_performance = {
+                'labels': [f'Cluster {i}' for i in performance['cluster']],
+                'values': performance['total_calories_burned_mean'].tolist()
+            }
+        
+        return {
+            'age_distribution': {'labels': age_dist.index.tolist(), 'values': age_dist.values.tolist()},
+            'steps_histogram': {'edges': step_edges.tolist(), 'counts': step_counts.tolist()},
+            'bmi_by_gender': {
+                'groups': genders,
+                'q1': [bmi_quantiles[g][0.25] for g in genders],
+                'median': [bmi_quantiles[g][0.5] for g in genders],
+                'q3': [bmi_quantiles[g][0.75] for g in genders],
+                'lower': [bmi_quantiles[g]['min'] for g in genders],
+                'upper': [bmi_quantiles[g]['max'] for g in genders],
+                'mean': [float(bmi_stats.loc[g, 'bmi_mean']) for g in genders],
+                'sd': [float(bmi_stats.loc[g, 'bmi_std']) for g in genders]
+            },
+            'provider_share': {'labels': insurance_dist.index.tolist(), 'values': insurance_dist.values.tolist()},
+            'fitness_vs_calories': {
+                'labels': fitness_stats['fitness_level'].tolist(),
+                'x': fitness_stats['fitness_level_encoded_mean'].tolist(),
+                'y': fitness_stats['total_calories_burned_mean'].tolist(),
+                'error': fitness_stats['total_calories_burned_std'].tolist()
+            },
+            'service_categories': {
+                'labels': service_popularity.index.tolist(), 'values': service_popularity.values.tolist()
+            },
+            'cluster_performance': cluster_performance,
+            # User Engagement (mock trend data)
+            'engagement': {
+                'labels': ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun'],
+                'values': [85, 88, 92, 89, 94, 96]
+            }
+        }
+    
+    def generate_admin_dashboard(self, save_path=None):
+        """Generate comprehensive admin dashboard"""
+        data = self.admin_dashboard_data()
+        
         # Create comprehensive dashboard
         fig = make_subplots(
             rows=4, cols=2,
@@ -621,72 +1528,78 @@ class AdminAnalytics:
         )
         
         # 1. Demographics Overview
-        age_groups = pd.cut(self.master_df['age'], bins=[20, 30, 40, 50, 60, 70], labels=['20-30', '30-40', '40-50', '50-60', '60-70'])
-        age_dist = age_groups.value_counts()
-        
+        age_dist = data['age_distribution']
         fig.add_trace(
-            go.Bar(x=age_dist.index, y=age_dist.values, name="Age Distribution"),
+            go.Bar(x=age_dist['labels'], y=age_dist['values'], name="Age Distribution"),
             row=1, col=1
         )
         
         # 2. Activity Distribution
+        step_edges = np.asarray(data['steps_histogram']['edges'])
         fig.add_trace(
-            go.Histogram(x=self.master_df['total_steps'], nbinsx=20, name="Steps Distribution"),
+            go.Bar(
+                x=(step_edges[:-1] + step_edges[1:]) / 2, y=data['steps_histogram']['counts'],
+                width=np.diff(step_edges), name="Steps Distribution"
+            ),
             row=1, col=2
         )
         
         # 3. Health Metrics (BMI distribution by gender)
-        for gender in self.master_df['gender'].unique():
-            gender_data = self.master_df[self.master_df['gender'] == gender]
+        bmi = data['bmi_by_gender']
+        for i, gender in enumerate(bmi['groups']):
             fig.add_trace(
-                go.Box(y=gender_data['bmi'], name=f'{gender} BMI'),
+                go.Box(
+                    q1=[bmi['q1'][i]], median=[bmi['median'][i]], q3=[bmi['q3'][i]],
+                    lowerfence=[bmi['lower'][i]], upperfence=[bmi['upper'][i]],
+                    mean=[bmi['mean'][i]], sd=[bmi['sd'][i]],
+                    name=f'{gender} BMI'
+                ),
                 row=2, col=1
             )
         
         # 4. Insurance Market Share
-        insurance_dist = self.master_df['current_insurance_provider'].value_counts()
+        insurance_dist = data['provider_share']
         fig.add_trace(
-            go.Pie(labels=insurance_dist.index, values=insurance_dist.values, name="Insurance Share"),
+            go.Pie(labels=insurance_dist['labels'], values=insurance_dist['values'], name="Insurance Share"),
             row=2, col=2
         )
         
-        # 5. Fitness vs Activity Correlation
+        # 5. Fitness vs Activity Correlation (mean +/- std per fitness level)
+        fitness_stats = data['fitness_vs_calories']
         fig.add_trace(
             go.Scatter(
-                x=self.master_df['fitness_level_encoded'],
-                y=self.master_df['total_calories_burned'],
+                x=fitness_stats['x'],
+                y=fitness_stats['y'],
+                error_y=dict(type='data', array=fitness_stats['error']),
                 mode='markers',
                 name="Fitness vs Calories",
-                text=self.master_df['fitness_level']
+                text=fitness_stats['labels']
             ),
             row=3, col=1
         )
         
         # 6. Service Category Popularity
-        service_popularity = self.services_df['category'].value_counts()
+        service_popularity = data['service_categories']
         fig.add_trace(
-            go.Bar(x=service_popularity.index, y=service_popularity.values, name="Service Categories"),
+            go.Bar(x=service_popularity['labels'], y=service_popularity['values'], name="Service Categories"),
             row=3, col=2
         )
         
         # 7. Cluster Performance (if clustering is done)
-        if self.cluster_labels is not None:
-            cluster_performance = self.master_df.groupby('cluster')['total_calories_burned'].mean()
+        if data['cluster_performance'] is not None:
             fig.add_trace(
                 go.Bar(
-                    x=[f'Cluster {i}' for i in cluster_performance.index],
-                    y=cluster_performance.values,
+                    x=data['cluster_performance']['labels'],
+                    y=data['cluster_performance']['values'],
                     name="Cluster Performance"
                 ),
                 row=4, col=1
             )
         
-        # 8. User Engagement (mock trend data)
-        months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun']
-        engagement = [85, 88, 92, 89, 94, 96]
-        
+        # 8. User Engagement
         fig.add_trace(
-            go.Scatter(x=months, y=engagement, mode='lines+markers', name="Engagement %"),
+            go.Scatter(x=data['engagement']['labels'], y=data['engagement']['values'],
+                       mode='lines+markers', name="Engagement %"),
             row=4, col=2
         )
         
@@ -703,55 +1616,110 @@ class AdminAnalytics:
         fig.show()
         return fig
     
-    def export_cluster_model(self, filepath='cluster_model.pkl'):
-        """Export trained clustering model for production use"""
+    def cluster_chart_data(self, max_points=DEFAULT_POINT_BUDGET, bins=80):
+        """Cluster scatter series for clients that draw their own charts
+        
+        Users are aggregated into per-cluster density tiles on the PCA grid
+        (coarsened until at most max_points tiles remain) plus a stratified
+        sample of at most max_points individual users in random order.
+        """
+        if self.cluster_labels is None or 'pca_x' not in self.master_df.columns:
+            print("Please run clustering first")
+            return None
+        
+        cluster_ids, counts, x_edges, y_edges = self.cluster_density_tiles(bins)
+        labels = self.master_df['cluster'].to_numpy()
+        sample = stratified_sample_indices(labels, max_points)
+        sample = np.random.default_rng(42).permutation(sample)
+        
+        return {
+            'clusters': {'ids': cluster_ids, 'sizes': counts.sum(axis=(1, 2))},
+            'tiles': coarsen_tiles(density_tiles(cluster_ids, counts, x_edges, y_edges), max_points),
+            'points': {
+                'user_id': self.master_df['user_id'].to_numpy()[sample].tolist(),
+                'cluster': labels[sample],
+                'x': self.master_df['pca_x'].to_numpy()[sample],
+                'y': self.master_df['pca_y'].to_numpy()[sample]
+            }
+        }
+    
+    def export_chart_data(self, filepath='chart_data.json', max_points=DEFAULT_POINT_BUDGET):
+        """Export admin and cluster chart series as compact JSON for the API to serve"""
+        return write_chart_data({
+            'admin': self.admin_dashboard_data(),
+            'clusters': self.cluster_chart_data(max_points)
+        }, filepath)
+    
+    def export_cluster_model(self, filepath='cluster_model'):
+        """Export trained clustering model for production use
+        
+        Writes a versioned artifact directory (.npy arrays + manifest.json)
+        that can be loaded and used for prediction without scikit-learn.
+        """
         if self.clustering_model is None:
             print("No clustering model to export. Please run clustering first.")
             return
         
-        model_data = {
-            'clustering_model': self.clustering_model,
-            'scaler': self.scaler,
-            'pca_model': self.pca_model,
-            'cluster_summary': self.cluster_summary,
-            'recommendation_rules': getattr(self, 'recommendation_rules', None)
-        }
+        data_fingerprint = None
+        if self.master_df is not None:
+            data_fingerprint = frame_fingerprint(self.master_df[self.clustering_features])
         
-        joblib.dump(model_data, filepath)
-        print(f"Clustering model exported to {filepath}")
+        manifest = export_model_artifact(self, filepath, data_fingerprint)
+        print(f"Clustering model exported to {filepath} (version {manifest['model_version']})")
     
-    def load_cluster_model(self, filepath='cluster_model.pkl'):
-        """Load pre-trained clustering model"""
+    def export_cold_start_recommendations(self, filepath='cold_start_recommendations.json'):
+        """Export per-(provider, cluster) ranked services for first-visit users"""
+        if self.clustering_model is None:
+            print("No clustering model to export. Please run clustering first.")
+            return None
+        return export_cold_start_table(self, filepath)
+    
+    def load_cluster_model(self, filepath='cluster_model'):
+        """Load pre-trained clustering model
+        
+        Accepts a model artifact directory, or a legacy joblib .pkl file.
+        """
         try:
-            model_data = joblib.load(filepath)
-            self.clustering_model = model_data['clustering_model']
-            self.scaler = model_data['scaler']
-            self.pca_model = model_data.get('pca_model')
-            self.cluster_summary = model_data.get('cluster_summary')
-            self.recommendation_rules = model_data.get('recommendation_rules')
+            if os.path.isdir(filepath):
+                self.apply_model_artifact(ModelArtifact.load(filepath))
+            else:
+                model_data = joblib.load(filepath)
+                self.clustering_model = model_data['clustering_model']
+                self.scaler = model_data['scaler']
+                self.pca_model = model_data.get('pca_model')
+                self.projected_users = []
+                self.cluster_summary = model_data.get('cluster_summary')
+                self.recommendation_rules = model_data.get('recommendation_rules')
             print(f"Clustering model loaded from {filepath}")
         except FileNotFoundError:
             print(f"Model file {filepath} not found")
         except Exception as e:
             print(f"Error loading model: {e}")
+    
+    def apply_model_artifact(self, artifact):
+        """Use a loaded ModelArtifact for assignment, confidence and PCA projection"""
+        self.clustering_model = artifact.model
+        self.scaler = artifact.scaler
+        self.pca_model = artifact.pca
+        self.projected_users = []
+        self.clustering_features = list(artifact.features)
+        self.feature_means = pd.Series(np.asarray(artifact.feature_fill), index=self.clustering_features)
+        self.cluster_summary = artifact.cluster_summary
+        self.recommendation_rules = artifact.recommendation_rules
+        self.model_version = artifact.version
 
 # Demo and testing functions
 def demo_admin_analytics():
     """Comprehensive demo of admin analytics functionality"""
     admin = AdminAnalytics()
     
-    print("=== LOADING DATA ===")
-    admin.load_and_prepare_data()
-    
-    print("\n=== PERFORMING CLUSTERING ===")
-    cluster_labels, silhouette_score = admin.perform_user_clustering(n_clusters=5)
+    print("=== LOADING DATA, SELECTING CLUSTERS, BUILDING RECOMMENDATIONS (cached stages) ===")
+    pipeline = admin.run_cached_pipeline(k_values=range(3, 9))
+    print(pipeline['comparison'].to_string(index=False))
     
     print("\n=== CLUSTER SUMMARY ===")
     admin.print_cluster_summary()
     
-    print("\n=== BUILDING RECOMMENDATION ENGINE ===")
-    admin.build_recommendation_engine()
-    
     print("\n=== USER RECOMMENDATIONS DEMO ===")
     recommendations = admin.get_user_service_recommendations("USR001")
     print(f"Recommendations for USR001:")
@@ -785,7 +1753,10 @@ def demo_admin_analytics():
     admin.generate_admin_dashboard()
     
     print("\n=== EXPORTING MODEL ===")
-    admin.export_cluster_model()
+    admin.export_cluster_model('cluster_model')
+    admin.export_cold_start_recommendations()
+    admin.export_chart_data()
+    admin.export_percentile_index()
 
 if __name__ == "__main__":
     demo_admin_analytics()
\ No newline at end of file
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Analytics Cube
+Pre-aggregated counts, sums and sums of squares over provider x cluster x age band x
+gender x fitness level, built in one pass and updated incrementally with new users
+"""
+
+import numpy as np
+import pandas as pd
+
+# Cube dimensions: (name, source column)
+CUBE_DIMENSIONS = [
+    ('provider', 'current_insurance_provider'),
+    ('cluster', 'cluster'),
+    ('age_band', 'age'),
+    ('gender', 'gender'),
+    ('fitness_level', 'fitness_level')
+]
+
+# Age bands of the admin dashboard (right-closed, as pd.cut); other ages fall into 'Other'
+AGE_BAND_EDGES = [20, 30, 40, 50, 60, 70]
+AGE_BAND_LABELS = ['20-30', '30-40', '40-50', '50-60', '60-70']
+
+CUBE_METRICS = [
+    'age', 'bmi', 'total_steps', 'total_calories_burned', 'total_active_minutes',
+    'fitness_level_encoded', 'resting_heart_rate', 'sleep_hours_avg', 'stress_level_avg'
+]
+
+# Metrics that also keep a fixed-bin histogram per cell (for distributions and quantiles)
+CUBE_HISTOGRAMS = {'total_steps': 20, 'bmi': 40}
+
+UNKNOWN = 'Unknown'
+NO_CLUSTER = -1
+
+
+def age_bands(ages):
+    """Dashboard age band label per age ('Other' outside 20-70 or missing)"""
+    ages = np.asarray(ages, dtype=float)
+    codes = np.searchsorted(AGE_BAND_EDGES, ages, side='left') - 1
+    valid = (ages > AGE_BAND_EDGES[0]) & (ages <= AGE_BAND_EDGES[-1])
+    labels = np.array(AGE_BAND_LABELS + ['Other'], dtype=object)
+    return labels[np.where(valid, codes, len(AGE_BAND_LABELS))]
+
+
+class AnalyticsCube:
+    """Dense aggregate arrays over every combination of the cube dimensions
+
+    Each cell holds its user count and, per metric, the non-missing count,
+    sum and sum of squares (so means and standard deviations of any slice
+    are derived by summing cells), plus fixed-bin histograms for a few
+    metrics. New users are folded in with add_frame in O(rows); unseen
+    dimension values grow the arrays along that axis.
+    """
+
+    def __init__(self, metrics=CUBE_METRICS, histograms=CUBE_HISTOGRAMS):
+        self.metrics = list(metrics)
+        self.dimensions = [name for name, _ in CUBE_DIMENSIONS]
+        self.categories = {name: [] for name in self.dimensions}
+        self._positions = {name: {} for name in self.dimensions}
+        self.histogram_bins = dict(histograms)
+        self.histogram_edges = {}
+
+        shape = (0,) * len(self.dimensions)
+        self._rows = np.zeros(shape, dtype=np.int64)
+        self._counts = np.zeros(shape + (len(self.metrics),), dtype=np.int64)
+        self._sums = np.zeros(shape + (len(self.metrics),))
+        self._sumsq = np.zeros(shape + (len(self.metrics),))
+        self._histograms = {}
+
+    @classmethod
+    def build(cls, df, metrics=CUBE_METRICS, histograms=CUBE_HISTOGRAMS):
+        """Cube over a user DataFrame in master dataset format, in one pass"""
+        metrics = [m for m in metrics if m in df.columns]
+        cube = cls(metrics, {m: bins for m, bins in histograms.items() if m in metrics})
+        for metric, bins in cube.histogram_bins.items():
+            values = df[metric].to_numpy(dtype=float)
+            values = values[~np.isnan(values)]
+            low, high = (values.min(), values.max()) if len(values) else (0.0, 1.0)
+            cube.histogram_edges[metric] = np.linspace(low, high if high > low else low + 1, bins + 1)
+        return cube.add_frame(df)
+
+    @property
+    def shape(self):
+        return self._rows.shape
+
+    @property
+    def total(self):
+        return int(self._rows.sum())
+
+    def _dimension_values(self, df):
+        """Cell coordinates of each row as one object array per dimension"""
+        values = {}
+        for name, column in CUBE_DIMENSIONS:
+            if name == 'age_band':
+                source = age_bands(df['age']) if 'age' in df.columns else np.full(len(df), 'Other', dtype=object)
+            elif column in df.columns:
+                source = df[column].to_numpy(dtype=object)
+            else:
+                source = np.full(len(df), NO_CLUSTER if name == 'cluster' else UNKNOWN, dtype=object)
+            missing = pd.isna(source)
+            if missing.any():
+                source = np.where(missing, NO_CLUSTER if name == 'cluster' else UNKNOWN, source)
+            if name == 'cluster':
+                source = source.astype(np.int64)
+            values[name] = source
+        return values
+
+    def _codes(self, axis, name, values):
+        """Positions of values along one axis, growing the arrays for unseen values"""
+        positions = self._positions[name]
+        unseen = [value for value in pd.unique(values) if value not in positions]
+        if unseen:
+            for value in unseen:
+                positions[value] = len(self.categories[name])
+                self.categories[name].append(value)
+            self._grow(axis, len(unseen))
+        return pd.Series(values).map(positions).to_numpy(dtype=np.int64)
+
+    def _grow(self, axis, n):
+        def pad(array):
+            widths = [(0, 0)] * array.ndim
+            widths[axis] = (0, n)
+            return np.pad(array, widths)
+        self._rows = pad(self._rows)
+        self._counts = pad(self._counts)
+        self._sums = pad(self._sums)
+        self._sumsq = pad(self._sumsq)
+        self._histograms = {metric: pad(counts) for metric, counts in self._histograms.items()}
+
+    def add_frame(self, df, weight=1):
+        """Fold user rows into their cells with one bincount per measure (weight=-1 removes them)"""
+        if not len(df):
+            return self
+        values = self._dimension_values(df)
+        codes = [self._codes(axis, name, values[name]) for axis, name in enumerate(self.dimensions)]
+        shape = self.shape
+        n_cells = int(np.prod(shape))
+        flat = np.ravel_multi_index(codes, shape)
+
+        self._rows += weight * np.bincount(flat, minlength=n_cells).reshape(shape)
+        for j, metric in enumerate(self.metrics):
+            column = df[metric].to_numpy(dtype=float) if metric in df.columns else np.full(len(df), np.nan)
+            present = ~np.isnan(column)
+            column = np.where(present, column, 0.0)
+            self._counts[..., j] += weight * np.bincount(flat[present], minlength=n_cells).reshape(shape)
+            self._sums[..., j] += weight * np.bincount(flat, weights=column, minlength=n_cells).reshape(shape)
+            self._sumsq[..., j] += weight * np.bincount(flat, weights=column * column,
+                                                        minlength=n_cells).reshape(shape)
+
+        for metric, edges in self.histogram_edges.items():
+            bins = len(edges) - 1
+            if metric not in self._histograms:
+                self._histograms[metric] = np.zeros(shape + (bins,), dtype=np.int64)
+            if metric not in df.columns:
+                continue
+            column = df[metric].to_numpy(dtype=float)
+            present = ~np.isnan(column)
+            # Values outside the build range are counted in the edge bins
+            bin_index = np.clip(np.searchsorted(edges, column[present], side='right') - 1, 0, bins - 1)
+            self._histograms[metric] += weight * np.bincount(
+                flat[present] * bins + bin_index, minlength=n_cells * bins
+            ).reshape(shape + (bins,))
+        return self
+
+    def add(self, record):
+        """Fold one user record (dict or Series) into the cube"""
+        return self.add_frame(pd.DataFrame([dict(record)]))
+
+    def remove(self, record):
+        """Take one previously added user record out of the cube"""
+        return self.add_frame(pd.DataFrame([dict(record)]), weight=-1)
+
+    def _selection(self, filters):
+        """Per-axis position lists for {dimension: value or list of values}"""
+        selection = []
+        for name in self.dimensions:
+            wanted = (filters or {}).get(name)
+            if wanted is None:
+                selection.append(np.arange(len(self.categories[name])))
+                continue
+            if isinstance(wanted, (str, int, np.integer)):
+                wanted = [wanted]
+            selection.append(np.array([self._positions[name][v] for v in wanted if v in self._positions[name]],
+                                      dtype=np.int64))
+        return np.ix_(*selection), selection
+
+    def _reduce(self, array, group_by, filters):
+        """Sum an aggregate array over all axes not in group_by, after filtering"""
+        index, selection = self._selection(filters)
+        array = array[index + (Ellipsis,)] if array.ndim > len(self.dimensions) else array[index]
+        axes = tuple(axis for axis, name in enumerate(self.dimensions) if name not in group_by)
+        return array.sum(axis=axes), selection
+
+    def aggregate(self, group_by=(), filters=None, metrics=None):
+        """Count, mean and standard deviation per group, e.g. aggregate(['cluster'], {'gender': 'Female'})
+
+        Groups without users are left out; rows come in the order the
+        dimension values were first seen.
+        """
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        group_by = [name for name in self.dimensions if name in group_by]
+        metrics = self.metrics if metrics is None else list(metrics)
+        columns = [self.metrics.index(m) for m in metrics]
+
+        rows, selection = self._reduce(self._rows, group_by, filters)
+        counts, _ = self._reduce(self._counts[..., columns], group_by, filters)
+        sums, _ = self._reduce(self._sums[..., columns], group_by, filters)
+        sumsq, _ = self._reduce(self._sumsq[..., columns], group_by, filters)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+            stds = np.sqrt(np.maximum(sumsq / counts - means ** 2, 0))
+
+        group_axes = [axis for axis, name in enumerate(self.dimensions) if name in group_by]
+        group_values = [np.array(self.categories[self.dimensions[axis]], dtype=object)[selection[axis]]
+                        for axis in group_axes]
+        grid = np.meshgrid(*group_values, indexing='ij') if group_values else []
+
+        result = pd.DataFrame({name: values.ravel() for name, values in zip(group_by, grid)})
+        result['count'] = np.ravel(rows)
+        for j, metric in enumerate(metrics):
+            result[f'{metric}_mean'] = means[..., j].ravel()
+            result[f'{metric}_std'] = stds[..., j].ravel()
+        return result[result['count'] > 0].reset_index(drop=True)
+
+    def counts(self, dimension, filters=None):
+        """User count per value of one dimension, largest first (like value_counts)"""
+        counts = self.aggregate([dimension], filters, metrics=[]).set_index(dimension)['count']
+        return counts.sort_values(ascending=False, kind='stable')
+
+    def histogram(self, metric, group_by=(), filters=None):
+        """(bin edges, counts) of a histogram metric; counts gain leading axes for group_by"""
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        counts, _ = self._reduce(self._histograms[metric], group_by, filters)
+        return self.histogram_edges[metric], counts
+
+    def quantiles(self, metric, q=(0.25, 0.5, 0.75), group_by=None, filters=None):
+        """Quantiles interpolated within histogram bins, per value of group_by (or overall)
+
+        Also returns the lower and upper edge of the occupied bins as
+        'min'/'max', for box plot fences.
+        """
+        edges, counts = self.histogram(metric, [group_by] if group_by else (), filters)
+        if group_by is None:
+            groups = {None: counts}
+        else:
+            _, selection = self._selection(filters)
+            axis = self.dimensions.index(group_by)
+            values = np.array(self.categories[group_by], dtype=object)[selection[axis]]
+            groups = dict(zip(values.tolist(), counts))
+
+        result = {}
+        for value, hist in groups.items():
+            total = hist.sum()
+            if total == 0:
+                continue
+            cumulative = np.concatenate([[0], np.cumsum(hist)]) / total
+            occupied = np.flatnonzero(hist)
+            result[value] = {
+                'min': float(edges[occupied[0]]),
+                'max': float(edges[occupied[-1] + 1]),
+                **{quantile: float(np.interp(quantile, cumulative, edges)) for quantile in q}
+            }
+        return result if group_by is not None else result.get(None, {})
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Cached Analytics Pipeline
+Runs the admin analytics pipeline as stages (load -> encode -> scale -> cluster -> stats
+-> recommendations -> cold-start table) whose outputs are cached on disk, keyed by a
+hash of their inputs and parameters
+"""
+
+import hashlib
+import json
+import os
+
+import joblib
+from sklearn.cluster import KMeans
+
+from cluster_selection import sweep_n_clusters
+from cold_start import build_cold_start_table, write_cold_start_table
+
+PIPELINE_CACHE_DIR = 'analytics_cache'
+
+# Inputs of the load stage; insurance_services.csv only feeds the recommendation stage
+USER_DATA_FILES = [
+    'users_demographic.csv', 'users_physical.csv', 'users_activity_weekly.csv',
+    'insurance_providers.csv'
+]
+SERVICES_FILE = 'insurance_services.csv'
+
+# AdminAnalytics attributes produced by the scale, cluster and stats stages
+SCALE_STAGE_ATTRIBUTES = ['clustering_features', 'feature_means', 'scaler', 'pca_model']
+CLUSTER_STAGE_ATTRIBUTES = ['clustering_model', 'cluster_labels', 'cluster_quality']
+STATS_STAGE_ATTRIBUTES = ['cluster_stats', 'cluster_summary']
+
+
+def file_digest(filepath):
+    """SHA-1 of a file's content (None if it does not exist)"""
+    if not os.path.exists(filepath):
+        return None
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StageCache:
+    """On-disk cache of stage outputs, one joblib file per (stage, input key)"""
+
+    def __init__(self, cache_dir=PIPELINE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(stage, *inputs):
+        """Hash of a stage name and its JSON-serializable inputs/parameters"""
+        payload = json.dumps([stage, inputs], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def path(self, stage, key):
+        return os.path.join(self.cache_dir, f'{stage}-{key[:20]}.joblib')
+
+    def run(self, stage, key, compute):
+        """Return (output, cache hit); compute() runs only when no cached output exists"""
+        path = self.path(stage, key)
+        if os.path.exists(path):
+            try:
+                output = joblib.load(path)
+                print(f"Stage '{stage}': cached")
+                return output, True
+            except Exception as e:
+                print(f"Stage '{stage}': cache unreadable ({e}), recomputing")
+
+        output = compute()
+        tmp_path = f'{path}.tmp-{os.getpid()}'
+        joblib.dump(output, tmp_path)
+        os.replace(tmp_path, path)
+        print(f"Stage '{stage}': computed")
+        return output, False
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.joblib'):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+def run_admin_pipeline(admin, n_clusters=5, k_values=None, clustering_features=None,
+                       cache_dir=PIPELINE_CACHE_DIR, random_state=42, cold_start_path=None):
+    """Run the admin analytics pipeline, skipping stages whose inputs are unchanged
+
+    Stages: load (read and merge the CSVs) -> encode (categorical features)
+    -> scale (scaler and visualization PCA) -> cluster (fixed n_clusters, or
+    the parallel sweep over k_values) -> stats (cluster statistics and
+    summary) -> recommendations (rules, which also depend on
+    insurance_services.csv) -> cold_start (the exported table, only when
+    cold_start_path is given). Each stage key chains the key of the stage
+    before it, so a change to the user CSVs re-runs everything while a
+    change to insurance_services.csv only re-runs the last two stages.
+
+    Returns a dict with the sweep comparison (or None), the cluster count and
+    which stages were served from the cache.
+    """
+    from admin_analytics import NEW_USER_ENCODINGS
+
+    cache = StageCache(cache_dir)
+    cached = {}
+
+    # Stage 1: read and merge the user data
+    load_key = cache.key('load', [file_digest(path) for path in USER_DATA_FILES])
+    merged_df, cached['load'] = cache.run('load', load_key, admin.load_datasets)
+    if cached['load']:
+        admin.load_services_catalog()
+
+    # Stage 2: categorical encodings
+    encode_key = cache.key('encode', load_key, NEW_USER_ENCODINGS)
+    master_df, cached['encode'] = cache.run(
+        'encode', encode_key, lambda: admin._encode_categorical_features(merged_df.copy())
+    )
+    admin.master_df = master_df
+    admin.analytics_cube = None
+    admin.percentile_index = None
+    print(f"Master dataset created with {len(master_df)} users and {len(master_df.columns)} features")
+
+    # Stage 3: scaled feature matrix and the visualization PCA
+    scale_key = cache.key('scale', encode_key, clustering_features, admin.pca_solver)
+
+    def scale():
+        X_scaled = admin.prepare_scaled_features(clustering_features)
+        output = {name: getattr(admin, name) for name in SCALE_STAGE_ATTRIBUTES}
+        output['X_scaled'] = X_scaled
+        output['pca'] = admin._fit_visualization_pca(X_scaled)
+        return output
+
+    scaled, cached['scale'] = cache.run('scale', scale_key, scale)
+    for name in SCALE_STAGE_ATTRIBUTES:
+        setattr(admin, name, scaled[name])
+    X_scaled = scaled['X_scaled']
+    admin.master_df['pca_x'] = scaled['pca'][:, 0]
+    admin.master_df['pca_y'] = scaled['pca'][:, 1]
+    admin.projected_users = []
+
+    # Stage 4: fit the clustering model and label the users
+    cluster_key = cache.key(
+        'cluster', scale_key, None if k_values else n_clusters,
+        sorted(k_values) if k_values else None, random_state
+    )
+
+    def cluster():
+        comparison = None
+        if k_values:
+            comparison, _, model = sweep_n_clusters(X_scaled, k_values, random_state=random_state)
+        else:
+            model = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10).fit(X_scaled)
+        admin.label_users(model, X_scaled)
+        output = {name: getattr(admin, name) for name in CLUSTER_STAGE_ATTRIBUTES}
+        output['comparison'] = comparison
+        return output
+
+    clustered, cached['cluster'] = cache.run('cluster', cluster_key, cluster)
+    if cached['cluster']:
+        for name in CLUSTER_STAGE_ATTRIBUTES:
+            setattr(admin, name, clustered[name])
+        admin.master_df['cluster'] = clustered['cluster_labels']
+        admin.analytics_cube = None
+        admin.percentile_index = None
+
+    # Stage 5: per-cluster statistics and summary
+    stats_key = cache.key('stats', cluster_key)
+
+    def stats():
+        admin._create_cluster_summary()
+        return {name: getattr(admin, name) for name in STATS_STAGE_ATTRIBUTES}
+
+    summarized, cached['stats'] = cache.run('stats', stats_key, stats)
+    if cached['stats']:
+        for name in STATS_STAGE_ATTRIBUTES:
+            setattr(admin, name, summarized[name])
+        admin.stats_members = {}
+
+    # Stage 6: recommendation rules (depends on clusters and the services catalog)
+    recommendations_key = cache.key('recommendations', stats_key, file_digest(SERVICES_FILE))
+    rules, cached['recommendations'] = cache.run(
+        'recommendations', recommendations_key, admin.build_recommendation_engine
+    )
+    if cached['recommendations']:
+        admin.recommendation_rules = rules
+    if admin.recommendation_store is not None:
+        admin.materialize_recommendations(admin.recommendation_store.k)
+
+    # Stage 7: cold-start table for the API
+    if cold_start_path:
+        cold_start_key = cache.key('cold_start', recommendations_key)
+        table, cached['cold_start'] = cache.run(
+            'cold_start', cold_start_key, lambda: build_cold_start_table(admin)
+        )
+        if _read_json(cold_start_path) != table:
+            write_cold_start_table(table, cold_start_path)
+
+    return {
+        'comparison': clustered['comparison'],
+        'n_clusters': int(admin.clustering_model.n_clusters),
+        'cached': cached
+    }
+
+
+def _read_json(filepath):
+    """Parsed JSON file, or None if it is missing or unreadable"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Bulk Dashboard Generation
+Renders a headless dashboard for every user across a process pool, writing each file
+atomically so an interrupted job can resume where it stopped
+"""
+
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dashboard_rendering import RENDER_FORMATS, RenderCache
+
+_worker_analytics = None
+
+_UNSAFE_FILENAME = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def dashboard_path(output_dir, user_id, output_format):
+    """Output file of one user's dashboard"""
+    return os.path.join(output_dir, f"{_UNSAFE_FILENAME.sub('_', str(user_id))}.{output_format}")
+
+
+def write_atomic(path, payload):
+    """Write via a temporary file and rename, so readers never see a partial file"""
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    mode = 'wb' if isinstance(payload, bytes) else 'w'
+    with open(tmp_path, mode, **({} if mode == 'wb' else {'encoding': 'utf-8'})) as file:
+        file.write(payload)
+    os.replace(tmp_path, path)
+
+
+def _init_worker(master_df, activity_df):
+    """Attach each worker to the prepared dataset and weekly history once, instead of reloading the CSVs"""
+    global _worker_analytics
+    from user_analytics import UserAnalytics
+
+    _worker_analytics = UserAnalytics()
+    _worker_analytics.master_df = master_df
+    _worker_analytics.activity_df = activity_df
+    _worker_analytics.mark_data_changed()
+    # Every dashboard is rendered once, so caching output would only hold memory
+    _worker_analytics.render_cache = RenderCache(max_entries=0)
+
+
+def _render_batch(user_ids, output_dir, output_format):
+    """Render and write one partition of users; failures are reported, not raised"""
+    rendered, failures = 0, {}
+    for user_id in user_ids:
+        try:
+            payload = _worker_analytics.render_user_dashboard(user_id, output_format)
+            if payload is None:
+                raise KeyError(f"User {user_id} not found")
+            write_atomic(dashboard_path(output_dir, user_id, output_format), payload)
+            rendered += 1
+        except Exception as e:
+            failures[user_id] = f"{type(e).__name__}: {e}"
+    return rendered, failures
+
+
+def generate_dashboards(analytics, output_dir, user_ids=None, output_format='html', n_jobs=None,
+                        batch_size=100, resume=True):
+    """Render dashboards for many users (default: all) into output_dir with a process pool
+
+    The prepared master dataset and weekly activity history are handed to
+    every worker once through the pool initializer; users are partitioned into batches of batch_size.
+    Each file is written atomically, so with resume=True a re-run skips
+    users whose file already exists and only retries missing or failed
+    ones. Returns a report with counts, failures and throughput; raises
+    RuntimeError when users were attempted and none of them rendered.
+    """
+    if output_format not in RENDER_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if analytics.master_df is None:
+        analytics.load_and_prepare_data()
+    os.makedirs(output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    if user_ids is None:
+        user_ids = analytics.master_df['user_id'].drop_duplicates().tolist()
+    user_ids = list(user_ids)
+    pending = user_ids
+    if resume:
+        pending = [u for u in user_ids if not os.path.exists(dashboard_path(output_dir, u, output_format))]
+    skipped = len(user_ids) - len(pending)
+
+    batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+    n_jobs = max(1, min(n_jobs or os.cpu_count() or 1, len(batches) or 1))
+    print(f"Rendering {len(pending)} dashboards ({skipped} already done) with {n_jobs} workers")
+
+    rendered, failures = 0, {}
+    if batches:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(analytics.master_df, analytics.activity_df)) as executor:
+            futures = [executor.submit(_render_batch, batch, output_dir, output_format) for batch in batches]
+            for done, future in enumerate(as_completed(futures), start=1):
+                batch_rendered, batch_failures = future.result()
+                rendered += batch_rendered
+                failures.update(batch_failures)
+                if done % max(1, len(futures) // 10) == 0 or done == len(futures):
+                    elapsed = time.perf_counter() - started
+                    print(f"  {done}/{len(futures)} batches, {rendered} dashboards, "
+                          f"{rendered / max(elapsed, 1e-9):.1f}/s")
+
+    seconds = time.perf_counter() - started
+    report = {
+        'total': len(user_ids),
+        'rendered': rendered,
+        'skipped': skipped,
+        'failed': len(failures),
+        'failures': failures,
+        'seconds': round(seconds, 2),
+        'dashboards_per_second': round(rendered / seconds, 1) if seconds > 0 else None,
+        'n_jobs': n_jobs,
+        'output_dir': output_dir
+    }
+    print(f"Rendered {rendered} dashboards in {report['seconds']}s "
+          f"({report['dashboards_per_second']}/s), {skipped} skipped, {len(failures)} failed")
+    if rendered == 0 and failures:
+        user_id, error = next(iter(failures.items()))
+        raise RuntimeError(f"All {len(failures)} dashboards failed to render (first: {user_id}: {error})")
+    return report
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Chart Data
+The series behind the dashboards for clients that draw their own charts, downsampled
+to a point budget and encoded as compact JSON or a binary columnar format
+"""
+
+import json
+import math
+import os
+import struct
+
+import numpy as np
+
+CHART_FORMATS = {
+    'json': 'application/json',
+    'columnar': 'application/octet-stream'
+}
+CHART_DATA_SCHEMA_VERSION = 1
+DEFAULT_POINT_BUDGET = 2000
+
+# Columnar layout: magic, little-endian uint32 header length, JSON header (space-padded
+# to a multiple of 4 bytes), then the int32/float32 column buffers back to back
+COLUMNAR_MAGIC = b'CHD1'
+COLUMNAR_DTYPES = {'int32': '<i4', 'float32': '<f4'}
+
+
+def lttb_indices(x, y, n_points):
+    """Positions kept by Largest-Triangle-Three-Buckets downsampling to n_points
+
+    The first and last point are always kept; in between, each bucket keeps
+    the point spanning the largest triangle with the previously kept point
+    and the mean of the next bucket, so peaks and dips survive.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    n = len(x)
+    if n <= n_points:
+        return np.arange(n)
+    n_points = max(n_points, 3)
+
+    # n_points - 2 buckets over the interior points
+    edges = np.linspace(1, n - 1, n_points - 1).astype(int)
+    kept = np.empty(n_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_points - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        mean_x = x[next_start:next_stop].mean()
+        mean_y = y[next_start:next_stop].mean()
+        area = np.abs((x[previous] - mean_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (mean_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        kept[i + 1] = previous
+    return kept
+
+
+def downsample_series(series, y_key, x_key=None, n_points=DEFAULT_POINT_BUDGET):
+    """Downsample every parallel list of a series dict with LTTB on (x_key, y_key)
+
+    Without a numeric x_key (e.g. week labels) points are taken as evenly spaced.
+    """
+    y = series[y_key]
+    if len(y) <= n_points:
+        return series
+    x = np.arange(len(y)) if x_key is None else series[x_key]
+    kept = lttb_indices(x, y, n_points)
+    return {key: [values[i] for i in kept] if isinstance(values, (list, tuple, np.ndarray)) and len(values) == len(y)
+            else values
+            for key, values in series.items()}
+
+
+def density_tiles(cluster_ids, counts, x_edges, y_edges):
+    """Occupied tiles of a clusters x bins x bins density grid as parallel arrays"""
+    cluster, x_bin, y_bin = np.nonzero(counts)
+    return {
+        'cluster': np.asarray(cluster_ids)[cluster],
+        'x_bin': x_bin,
+        'y_bin': y_bin,
+        'count': counts[cluster, x_bin, y_bin],
+        'x_edges': np.asarray(x_edges, dtype=float),
+        'y_edges': np.asarray(y_edges, dtype=float)
+    }
+
+
+def _coarser_edges(edges):
+    # Every second edge; an odd trailing bin keeps its own upper edge
+    coarse = edges[::2]
+    return coarse if (len(edges) - 1) % 2 == 0 else np.r_[coarse, edges[-1]]
+
+
+def coarsen_tiles(tiles, max_tiles):
+    """Merge 2 x 2 neighbouring tiles per cluster until at most max_tiles remain
+
+    Counts are summed, so totals per cluster are preserved at any budget.
+    """
+    tiles = {key: np.asarray(values) for key, values in tiles.items()}
+    while len(tiles['count']) > max_tiles and (len(tiles['x_edges']) > 2 or len(tiles['y_edges']) > 2):
+        keys = np.column_stack([tiles['cluster'], tiles['x_bin'] // 2, tiles['y_bin'] // 2])
+        merged, inverse = np.unique(keys, axis=0, return_inverse=True)
+        tiles = {
+            'cluster': merged[:, 0],
+            'x_bin': merged[:, 1],
+            'y_bin': merged[:, 2],
+            'count': np.bincount(inverse.ravel(), weights=tiles['count']).astype(np.int64),
+            'x_edges': _coarser_edges(tiles['x_edges']),
+            'y_edges': _coarser_edges(tiles['y_edges'])
+        }
+    return tiles
+
+
+def limit_cluster_chart(clusters, max_points):
+    """Cluster chart data cut down to a smaller point budget
+
+    Tiles are coarsened and the point sample, stored in random order, is
+    truncated, so any prefix is itself a random sample.
+    """
+    points = clusters['points']
+    n_kept = min(max_points, len(points['cluster']))
+    return {
+        **clusters,
+        'tiles': coarsen_tiles(clusters['tiles'], max_points),
+        'points': {key: values[:n_kept] for key, values in points.items()}
+    }
+
+
+def to_jsonable(value, precision=4):
+    """Plain JSON types for payloads holding numpy arrays and scalars (NaN becomes null)"""
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item, precision) for key, item in value.items()}
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == 'f':
+            value = np.round(value, precision)
+            return np.where(np.isnan(value), None, value.astype(object)).tolist()
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item, precision) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return None if math.isnan(value) else round(value, precision)
+    return value
+
+
+def _flatten(payload, prefix=''):
+    for key, value in payload.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{name}.')
+        else:
+            yield name, value
+
+
+def _numeric_column(values):
+    """values as an int32/float32 array, or None for text columns"""
+    if not isinstance(values, np.ndarray):
+        if not all(item is None or (isinstance(item, (int, float, np.number)) and not isinstance(item, bool))
+                   for item in values):
+            return None
+        values = np.array([np.nan if item is None else item for item in values])
+    if values.dtype.kind in 'biu':
+        return values.astype(COLUMNAR_DTYPES['int32'])
+    if values.dtype.kind == 'f':
+        return values.astype(COLUMNAR_DTYPES['float32'])
+    return None
+
+
+def to_columnar(payload):
+    """Encode a (nested) dict of series as one binary columnar buffer
+
+    Numeric lists and arrays become int32/float32 columns at 4-byte aligned
+    offsets, so a browser can view them directly as typed arrays; text
+    columns and scalars travel in the JSON header. Nested keys are joined
+    with dots ('activity.values').
+    """
+    columns, scalars, buffers, offset = [], {}, [], 0
+    for name, value in _flatten(payload):
+        if not isinstance(value, (list, tuple, np.ndarray)):
+            scalars[name] = to_jsonable(value)
+            continue
+        array = _numeric_column(value)
+        if array is None:
+            columns.append({'name': name, 'dtype': 'str', 'values': to_jsonable(list(value))})
+            continue
+        columns.append({
+            'name': name,
+            'dtype': 'int32' if array.dtype.kind == 'i' else 'float32',
+            'offset': offset,
+            'shape': list(array.shape)
+        })
+        buffers.append(array.tobytes())
+        offset += array.nbytes
+
+    header = json.dumps({'version': CHART_DATA_SCHEMA_VERSION, 'columns': columns, 'scalars': scalars},
+                        separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    header += b' ' * (-len(header) % 4)
+    return COLUMNAR_MAGIC + struct.pack('<I', len(header)) + header + b''.join(buffers)
+
+
+def from_columnar(data):
+    """Decode a to_columnar buffer back into a nested dict (numeric columns as numpy arrays)"""
+    if data[:4] != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar chart payload")
+    (header_length,) = struct.unpack('<I', data[4:8])
+    header = json.loads(data[8:8 + header_length].decode('utf-8'))
+    body = memoryview(data)[8 + header_length:]
+
+    flat = dict(header['scalars'])
+    for column in header['columns']:
+        if column['dtype'] == 'str':
+            flat[column['name']] = column['values']
+            continue
+        dtype = np.dtype(COLUMNAR_DTYPES[column['dtype']])
+        count = int(np.prod(column['shape']))
+        flat[column['name']] = np.frombuffer(body, dtype=dtype, count=count,
+                                             offset=column['offset']).reshape(column['shape'])
+
+    payload = {}
+    for name, value in flat.items():
+        *parents, key = name.split('.')
+        node = payload
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[key] = value
+    return payload
+
+
+def encode_chart_payload(payload, output_format='json'):
+    """(body bytes, mimetype) of a chart payload in one of CHART_FORMATS"""
+    if output_format not in CHART_FORMATS:
+        raise ValueError(f"Unknown chart format: {output_format}")
+    if output_format == 'columnar':
+        body = to_columnar(payload)
+    else:
+        body = json.dumps(to_jsonable(payload), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return body, CHART_FORMATS[output_format]
+
+
+def write_chart_data(payload, filepath='chart_data.json'):
+    """Write exported chart data to a JSON file (atomically)"""
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(to_jsonable({'schema_version': CHART_DATA_SCHEMA_VERSION, **payload}), file,
+                  separators=(',', ':'), ensure_ascii=False)
+    os.replace(tmp_path, filepath)
+    print(f"Chart data exported to {filepath}")
+    return payload
+
+
+def load_chart_data(filepath='chart_data.json'):
+    with open(filepath, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    if data.get('schema_version') != CHART_DATA_SCHEMA_VERSION:
+        raise ValueError(f"Unsupported chart data version: {data.get('schema_version')}")
+    return data
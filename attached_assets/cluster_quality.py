@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Cluster Quality Metrics
+Sampled silhouette estimates and single-pass streaming cluster statistics
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+from sklearn.metrics import silhouette_samples
+
+
+def stratified_sample_indices(labels, sample_size, random_state=42):
+    """Draw row indices with every cluster represented proportionally to its size"""
+    labels = np.asarray(labels)
+    n = len(labels)
+    if sample_size >= n:
+        return np.arange(n)
+
+    rng = np.random.default_rng(random_state)
+    clusters, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+
+    # Proportional allocation, keeping at least two points per cluster where the
+    # budget allows; the minimum is paid for by the largest strata
+    minimum = np.minimum(min(2, sample_size // len(clusters)), counts)
+    allocation = np.maximum(np.floor(counts / n * sample_size).astype(int), minimum)
+    allocation = np.minimum(allocation, counts)
+    for _ in range(int(allocation.sum()) - sample_size):
+        allocation[np.argmax(allocation - minimum)] -= 1
+
+    order = np.argsort(inverse, kind='stable')
+    boundaries = np.concatenate([[0], np.cumsum(counts)])
+    picked = []
+    for i in range(len(clusters)):
+        members = order[boundaries[i]:boundaries[i + 1]]
+        picked.append(rng.choice(members, size=allocation[i], replace=False))
+    return np.sort(np.concatenate(picked))
+
+
+def sampled_silhouette(X, labels, sample_size=5000, confidence=0.95,
+                       population_counts=None, random_state=42):
+    """Estimate the silhouette score on a stratified sample with a confidence interval
+
+    Cost is O(sample_size^2) distance evaluations instead of O(N^2). When the
+    sample covers every row the exact score is returned with a zero-width
+    interval. population_counts ({cluster: size}) weights the strata when X is
+    itself already a sample of a larger population.
+    """
+    X = np.asarray(X)
+    labels = np.asarray(labels)
+    idx = stratified_sample_indices(labels, sample_size, random_state)
+    X_sample, labels_sample = X[idx], labels[idx]
+
+    clusters = np.unique(labels_sample)
+    if len(clusters) < 2:
+        return {'silhouette': float('nan'), 'ci_low': float('nan'), 'ci_high': float('nan'),
+                'confidence': confidence, 'sample_size': len(idx), 'exact': False}
+
+    values = silhouette_samples(X_sample, labels_sample)
+    exact = population_counts is None and len(idx) == len(labels)
+
+    if population_counts is None:
+        all_clusters, all_counts = np.unique(labels, return_counts=True)
+        population = dict(zip(all_clusters, all_counts))
+    else:
+        population = population_counts
+    total = sum(population.values())
+
+    # Stratified mean and its standard error
+    estimate = 0.0
+    variance = 0.0
+    for cluster in clusters:
+        stratum = values[labels_sample == cluster]
+        weight = population.get(cluster, len(stratum)) / total
+        estimate += weight * stratum.mean()
+        if len(stratum) > 1 and not exact:
+            # Finite population correction for strata sampled without replacement
+            fpc = max(0.0, 1 - len(stratum) / max(population.get(cluster, len(stratum)), 1))
+            variance += weight ** 2 * stratum.var(ddof=1) / len(stratum) * fpc
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    margin = z * np.sqrt(variance)
+    return {
+        'silhouette': float(estimate),
+        'ci_low': float(estimate - margin),
+        'ci_high': float(estimate + margin),
+        'confidence': confidence,
+        'sample_size': len(idx),
+        'exact': exact
+    }
+
+
+class StreamingClusterMetrics:
+    """Accumulate Calinski-Harabasz, Davies-Bouldin and inertia in one pass over chunks
+
+    All statistics are kept as per-cluster counts, sums and sums of squares
+    so chunks can arrive in any order and memory stays O(clusters x features).
+    Distances for Davies-Bouldin and inertia are measured to the supplied
+    centers (the fitted KMeans centers).
+    """
+
+    def __init__(self, centers, max_rows=None):
+        self.centers = np.asarray(centers, dtype=float)
+        self.max_rows = max_rows
+        n_clusters, n_features = self.centers.shape
+        self.counts = np.zeros(n_clusters, dtype=np.int64)
+        self.sums = np.zeros((n_clusters, n_features))
+        self.sq_norms = np.zeros(n_clusters)
+        self.center_sq_dist = np.zeros(n_clusters)
+        self.center_dist = np.zeros(n_clusters)
+        self.rows_seen = 0
+        self.truncated = False
+
+    @property
+    def exhausted(self):
+        return self.max_rows is not None and self.rows_seen >= self.max_rows
+
+    def update(self, X_chunk, labels_chunk):
+        """Fold one chunk of scaled features and their labels into the totals"""
+        X_chunk = np.asarray(X_chunk, dtype=float)
+        labels_chunk = np.asarray(labels_chunk)
+        if self.max_rows is not None:
+            remaining = self.max_rows - self.rows_seen
+            if len(labels_chunk) > remaining:
+                self.truncated = True
+                X_chunk, labels_chunk = X_chunk[:remaining], labels_chunk[:remaining]
+        if len(labels_chunk) == 0:
+            return self
+
+        n_clusters = len(self.centers)
+        self.counts += np.bincount(labels_chunk, minlength=n_clusters)
+        np.add.at(self.sums, labels_chunk, X_chunk)
+        self.sq_norms += np.bincount(labels_chunk, weights=np.einsum('ij,ij->i', X_chunk, X_chunk),
+                                     minlength=n_clusters)
+
+        sq_dist = np.einsum('ij,ij->i', X_chunk - self.centers[labels_chunk],
+                            X_chunk - self.centers[labels_chunk])
+        self.center_sq_dist += np.bincount(labels_chunk, weights=sq_dist, minlength=n_clusters)
+        self.center_dist += np.bincount(labels_chunk, weights=np.sqrt(sq_dist), minlength=n_clusters)
+        self.rows_seen += len(labels_chunk)
+        return self
+
+    def merge(self, other):
+        """Add the totals of another accumulator over the same centers (e.g. from another shard)"""
+        if not np.array_equal(other.centers, self.centers):
+            raise ValueError("Cannot merge cluster metrics measured against different centers")
+        self.counts += other.counts
+        self.sums += other.sums
+        self.sq_norms += other.sq_norms
+        self.center_sq_dist += other.center_sq_dist
+        self.center_dist += other.center_dist
+        self.rows_seen += other.rows_seen
+        self.truncated = self.truncated or other.truncated
+        return self
+
+    def result(self):
+        """Return the accumulated metrics as a dictionary"""
+        n = self.counts.sum()
+        occupied = self.counts > 0
+        k = int(occupied.sum())
+
+        means = np.zeros_like(self.sums)
+        means[occupied] = self.sums[occupied] / self.counts[occupied, None]
+        overall_mean = self.sums.sum(axis=0) / max(n, 1)
+
+        # Within-cluster dispersion about the cluster means
+        within = float(np.sum(self.sq_norms[occupied]
+                              - np.einsum('ij,ij->i', self.sums[occupied], self.sums[occupied])
+                              / self.counts[occupied]))
+        between = float(np.sum(self.counts[occupied]
+                               * np.sum((means[occupied] - overall_mean) ** 2, axis=1)))
+        if k > 1 and n > k and within > 0:
+            calinski_harabasz = (between / (k - 1)) / (within / (n - k))
+        else:
+            calinski_harabasz = float('nan')
+
+        # Davies-Bouldin from mean distance to centers and center separation
+        centers = self.centers[occupied]
+        scatter = self.center_dist[occupied] / self.counts[occupied]
+        if k > 1:
+            separation = np.linalg.norm(centers[:, None, :] - centers[None, :, :], axis=2)
+            np.fill_diagonal(separation, np.inf)
+            ratios = (scatter[:, None] + scatter[None, :]) / separation
+            davies_bouldin = float(np.mean(np.max(ratios, axis=1)))
+        else:
+            davies_bouldin = float('nan')
+
+        return {
+            'n_rows': int(n),
+            'calinski_harabasz': float(calinski_harabasz),
+            'davies_bouldin': davies_bouldin,
+            'inertia': float(self.center_sq_dist.sum()),
+            'inertia_per_cluster': {int(c): float(v) for c, v in enumerate(self.center_sq_dist)},
+            'cluster_sizes': {int(c): int(v) for c, v in enumerate(self.counts)},
+            'complete': not self.truncated
+        }
+
+
+def evaluate_cluster_quality(X, labels, centers=None, sample_size=5000, max_rows=None,
+                             chunk_size=50000, confidence=0.95, random_state=42):
+    """Compute sampled silhouette plus streaming full-data metrics for in-memory data
+
+    sample_size bounds the silhouette cost (O(sample_size^2)); max_rows bounds
+    how many rows the streaming metrics read. Pass centers to measure
+    inertia and Davies-Bouldin against the fitted model centers.
+    """
+    X = np.asarray(X, dtype=float)
+    labels = np.asarray(labels)
+    if centers is None:
+        n_clusters = labels.max() + 1
+        centers = np.zeros((n_clusters, X.shape[1]))
+        np.add.at(centers, labels, X)
+        centers /= np.maximum(np.bincount(labels, minlength=n_clusters), 1)[:, None]
+
+    metrics = StreamingClusterMetrics(centers, max_rows=max_rows)
+    for start in range(0, len(X), chunk_size):
+        if metrics.truncated:
+            break
+        metrics.update(X[start:start + chunk_size], labels[start:start + chunk_size])
+
+    report = metrics.result()
+    report.update(sampled_silhouette(X, labels, sample_size, confidence, random_state=random_state))
+    return report
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Cluster Count Selection
+Sweeps K-means over a range of cluster counts in parallel and keeps the best model
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from sklearn.cluster import KMeans, kmeans_plusplus
+
+from cluster_quality import evaluate_cluster_quality
+
+# Metrics where a lower value means better clustering
+LOWER_IS_BETTER = {'davies_bouldin', 'inertia'}
+
+_worker_X = None
+
+
+def _init_worker(X_scaled):
+    """Keep one copy of the scaled matrix per worker process"""
+    global _worker_X
+    _worker_X = X_scaled
+
+
+def _fit_candidate(n_clusters, init_centers, sample_size, random_state):
+    """Fit and score one cluster count inside a worker process"""
+    started = time.perf_counter()
+    model = KMeans(n_clusters=n_clusters, init=init_centers, n_init=1, random_state=random_state)
+    labels = model.fit_predict(_worker_X)
+    quality = evaluate_cluster_quality(
+        _worker_X, labels, centers=model.cluster_centers_,
+        sample_size=sample_size, random_state=random_state
+    )
+    quality['fit_seconds'] = time.perf_counter() - started
+    return n_clusters, model, quality
+
+
+def sweep_n_clusters(X_scaled, k_values=range(2, 11), metric='silhouette', n_jobs=None, sample_size=5000,
+                     random_state=42, final_n_init=10):
+    """Fit and score every k in k_values on a scaled feature matrix and pick the best
+
+    All candidates are warm-started from one k-means++ seeding computed for
+    the largest k, whose first k centers are a valid k-means++ seeding for
+    any smaller k, and fitted in a process pool sharing one copy of X_scaled.
+    Each candidate is scored with the sampled quality metrics. The winning k
+    by `metric` is refitted with final_n_init k-means++ initializations (the
+    single warm start is kept if it has the lower inertia).
+
+    Returns (comparison DataFrame, best k, fitted model for best k).
+    """
+    k_values = sorted(set(k_values))
+    seeds, _ = kmeans_plusplus(X_scaled, n_clusters=max(k_values), random_state=random_state)
+
+    n_jobs = n_jobs or min(len(k_values), os.cpu_count() or 1)
+    rows = []
+    models = {}
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                             initargs=(X_scaled,)) as pool:
+        futures = [
+            pool.submit(_fit_candidate, k, seeds[:k], sample_size, random_state)
+            for k in k_values
+        ]
+        for future in futures:
+            k, model, quality = future.result()
+            models[k] = model
+            rows.append({
+                'n_clusters': k,
+                'silhouette': quality['silhouette'],
+                'silhouette_ci_low': quality['ci_low'],
+                'silhouette_ci_high': quality['ci_high'],
+                'calinski_harabasz': quality['calinski_harabasz'],
+                'davies_bouldin': quality['davies_bouldin'],
+                'inertia': quality['inertia'],
+                'fit_seconds': round(quality['fit_seconds'], 3)
+            })
+
+    comparison = pd.DataFrame(rows).sort_values('n_clusters').reset_index(drop=True)
+    if metric in LOWER_IS_BETTER:
+        best_k = int(comparison.loc[comparison[metric].idxmin(), 'n_clusters'])
+    else:
+        best_k = int(comparison.loc[comparison[metric].idxmax(), 'n_clusters'])
+    comparison['selected'] = comparison['n_clusters'] == best_k
+
+    print(f"Selected {best_k} clusters by {metric}")
+    model = models[best_k]
+    if final_n_init > 1:
+        refit = KMeans(n_clusters=best_k, n_init=final_n_init, random_state=random_state).fit(X_scaled)
+        if refit.inertia_ < model.inertia_:
+            model = refit
+    return comparison, best_k, model
+
+
+def select_n_clusters(admin, k_values=range(2, 11), clustering_features=None, metric='silhouette',
+                      n_jobs=None, sample_size=5000, model_path='cluster_model', random_state=42,
+                      final_n_init=10):
+    """Choose the number of clusters for an AdminAnalytics instance
+
+    Features are scaled once and swept with sweep_n_clusters; the chosen
+    model is applied to `admin` (labels, summary, PCA) and exported to
+    model_path unless it is None.
+
+    Returns (comparison DataFrame, best k).
+    """
+    X_scaled = admin.prepare_scaled_features(clustering_features)
+    comparison, best_k, model = sweep_n_clusters(
+        X_scaled, k_values, metric=metric, n_jobs=n_jobs, sample_size=sample_size,
+        random_state=random_state, final_n_init=final_n_init
+    )
+    admin.apply_clustering_model(model, X_scaled, silhouette_sample_size=sample_size)
+    if model_path:
+        admin.export_cluster_model(model_path)
+
+    return comparison, best_k
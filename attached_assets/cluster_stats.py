@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Cluster Statistics Engine
+Computes every per-cluster statistic in one grouped pass and builds cluster summaries from it
+"""
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# Numeric columns aggregated per cluster (summaries, recommendation rules, dashboards)
+NUMERIC_STAT_COLUMNS = [
+    'age', 'bmi', 'resting_heart_rate', 'sleep_hours_avg', 'total_steps',
+    'total_calories_burned', 'total_active_minutes', 'exercise_sessions',
+    'fitness_level_encoded', 'has_medical_condition'
+]
+
+# Categorical columns counted per cluster, with how many top values the summary keeps
+CATEGORICAL_STAT_COLUMNS = {
+    'gender': None,
+    'fitness_level': None,
+    'city': 3,
+    'medical_conditions': 3,
+    'current_insurance_provider': None
+}
+
+
+class ClusterStats:
+    """Mergeable per-cluster aggregates: sizes, counts, sums, sums of squares and value counters
+
+    Means and variances are derived on demand, so adding, removing or merging
+    users only touches O(features) numbers and never rescans the dataset.
+    """
+
+    def __init__(self, numeric_columns, categorical_columns):
+        self.numeric_columns = list(numeric_columns)
+        self.categorical_columns = list(categorical_columns)
+        self.cluster_ids = []
+        self._positions = {}
+        n_features = len(self.numeric_columns)
+        self._sizes = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros((0, n_features), dtype=np.int64)
+        self._sums = np.zeros((0, n_features))
+        self._sumsq = np.zeros((0, n_features))
+        self._categorical = {}
+
+    def _position(self, cluster_id):
+        """Row of a cluster in the aggregate arrays, growing them for unseen clusters"""
+        if cluster_id not in self._positions:
+            self._positions[cluster_id] = len(self.cluster_ids)
+            self.cluster_ids.append(cluster_id)
+            n_features = len(self.numeric_columns)
+            self._sizes = np.append(self._sizes, 0)
+            self._counts = np.vstack([self._counts, np.zeros((1, n_features), dtype=np.int64)])
+            self._sums = np.vstack([self._sums, np.zeros((1, n_features))])
+            self._sumsq = np.vstack([self._sumsq, np.zeros((1, n_features))])
+        return self._positions[cluster_id]
+
+    @property
+    def sizes(self):
+        return pd.Series(self._sizes, index=self.cluster_ids)
+
+    @property
+    def total(self):
+        return int(self._sizes.sum())
+
+    @property
+    def sums(self):
+        return pd.DataFrame(self._sums, index=self.cluster_ids, columns=self.numeric_columns)
+
+    @property
+    def counts(self):
+        return pd.DataFrame(self._counts, index=self.cluster_ids, columns=self.numeric_columns)
+
+    @property
+    def means(self):
+        """Cluster x column means (NaNs excluded, as in DataFrame.mean)"""
+        return self.sums / self.counts
+
+    @property
+    def variances(self):
+        """Cluster x column population variances"""
+        counts = self.counts
+        means = self.sums / counts
+        return (self._sumsq / counts) - means ** 2
+
+    def cluster_means(self, cluster_id):
+        """Mean of every numeric column within one cluster"""
+        row = self._positions[cluster_id]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = self._sums[row] / self._counts[row]
+        return pd.Series(values, index=self.numeric_columns)
+
+    def top_counts(self, cluster_id, column, k=None):
+        """Value counts for one categorical column within a cluster, largest first
+
+        Ties are broken alphabetically, so top-k selections are deterministic.
+        """
+        counter = self._categorical.get((cluster_id, column))
+        if not counter:
+            return {}
+        items = sorted(counter.items(), key=lambda item: (-item[1], str(item[0])))
+        if k is not None:
+            items = items[:k]
+        return {value: int(count) for value, count in items}
+
+    def add(self, record, cluster_id, weight=1):
+        """Fold one user record (a dict or Series) into a cluster in O(features)"""
+        row = self._position(cluster_id)
+        self._sizes[row] += weight
+        for j, column in enumerate(self.numeric_columns):
+            value = record.get(column)
+            if value is None or pd.isna(value):
+                continue
+            self._counts[row, j] += weight
+            self._sums[row, j] += weight * value
+            self._sumsq[row, j] += weight * value * value
+        for column in self.categorical_columns:
+            value = record.get(column)
+            if value is None or pd.isna(value):
+                continue
+            counter = self._categorical.setdefault((cluster_id, column), Counter())
+            counter[value] += weight
+            if counter[value] <= 0:
+                del counter[value]
+        return self
+
+    def add_frame(self, df, labels):
+        """Fold many user records into their clusters with vectorized updates"""
+        labels = np.asarray(labels)
+        cluster_ids, inverse = np.unique(labels, return_inverse=True)
+        rows = np.array([self._position(c) for c in cluster_ids.tolist()])[inverse]
+
+        values = df.reindex(columns=self.numeric_columns).to_numpy(dtype=float)
+        present = ~np.isnan(values)
+        values = np.where(present, values, 0.0)
+        np.add.at(self._sizes, rows, 1)
+        np.add.at(self._counts, rows, present.astype(np.int64))
+        np.add.at(self._sums, rows, values)
+        np.add.at(self._sumsq, rows, values * values)
+
+        for column in self.categorical_columns:
+            if column not in df.columns:
+                continue
+            counts = pd.Series(df[column].to_numpy()).groupby(labels).value_counts()
+            for (cluster_id, value), count in counts.items():
+                self._categorical.setdefault((cluster_id, column), Counter())[value] += int(count)
+        return self
+
+    def remove(self, record, cluster_id):
+        """Take one previously added user record out of a cluster in O(features)"""
+        if cluster_id not in self._positions:
+            raise KeyError(f"Unknown cluster: {cluster_id}")
+        return self.add(record, cluster_id, weight=-1)
+
+    def merge(self, other):
+        """Add another ClusterStats over the same columns into this one"""
+        if other.numeric_columns != self.numeric_columns:
+            raise ValueError("Cannot merge cluster statistics over different numeric columns")
+        for cluster_id in other.cluster_ids:
+            row = self._position(cluster_id)
+            other_row = other._positions[cluster_id]
+            self._sizes[row] += other._sizes[other_row]
+            self._counts[row] += other._counts[other_row]
+            self._sums[row] += other._sums[other_row]
+            self._sumsq[row] += other._sumsq[other_row]
+        for key, counter in other._categorical.items():
+            self._categorical.setdefault(key, Counter()).update(counter)
+        return self
+
+
+def compute_cluster_stats(df, cluster_col='cluster', numeric_columns=None, categorical_columns=None):
+    """Aggregate all per-cluster statistics in O(N), independent of the cluster count
+
+    Numeric columns and their squares are reduced with a single groupby;
+    categorical columns are stacked into long form and counted with a single
+    crosstab.
+    """
+    if numeric_columns is None:
+        numeric_columns = [c for c in NUMERIC_STAT_COLUMNS if c in df.columns]
+    if categorical_columns is None:
+        categorical_columns = [c for c in CATEGORICAL_STAT_COLUMNS if c in df.columns]
+
+    numeric = df[numeric_columns].astype(float)
+    squared = (numeric ** 2).add_suffix('__sq')
+    aggregated = pd.concat([numeric, squared], axis=1).groupby(df[cluster_col]).agg(['sum', 'count'])
+    sums = aggregated.xs('sum', axis=1, level=1)
+    counts = aggregated.xs('count', axis=1, level=1)
+    sizes = df.groupby(cluster_col).size()
+
+    long = df[[cluster_col] + categorical_columns].melt(
+        id_vars=cluster_col, var_name='column', value_name='value'
+    )
+    categorical_counts = pd.crosstab([long[cluster_col], long['column']], long['value'])
+
+    stats = ClusterStats(numeric_columns, categorical_columns)
+    for cluster_id in sizes.index:
+        stats._position(cluster_id)
+    order = list(sizes.index)
+    stats._sizes = sizes.to_numpy(dtype=np.int64, copy=True)
+    stats._counts = counts.loc[order, numeric_columns].to_numpy(dtype=np.int64, copy=True)
+    stats._sums = sums.loc[order, numeric_columns].to_numpy(dtype=float, copy=True)
+    stats._sumsq = sums.loc[order, [f'{c}__sq' for c in numeric_columns]].to_numpy(dtype=float, copy=True)
+    for (cluster_id, column), row in categorical_counts.iterrows():
+        row = row[row > 0]
+        stats._categorical[(cluster_id, column)] = Counter(dict(zip(row.index, row.to_numpy().tolist())))
+
+    return stats
+
+
+def build_cluster_summary(stats, describe=None, cluster_ids=None):
+    """Turn ClusterStats into the AdminAnalytics cluster_summary dictionary
+
+    Pass cluster_ids to rebuild only the entries of clusters that changed.
+    """
+    sizes = stats.sizes
+    total = stats.total
+    cluster_summary = {}
+
+    if cluster_ids is None:
+        cluster_ids = sorted(sizes.index)
+
+    for cluster_id in cluster_ids:
+        size = int(sizes[cluster_id])
+        if size <= 0:
+            continue
+        cluster_means = stats.cluster_means(cluster_id)
+
+        summary = {
+            'size': size,
+            'percentage': round(size / total * 100, 1),
+            'demographics': {
+                'avg_age': round(cluster_means['age'], 1),
+                'gender_distribution': stats.top_counts(cluster_id, 'gender'),
+                'fitness_level_distribution': stats.top_counts(cluster_id, 'fitness_level'),
+                'top_cities': stats.top_counts(cluster_id, 'city', CATEGORICAL_STAT_COLUMNS['city'])
+            },
+            'health_metrics': {
+                'avg_bmi': round(cluster_means['bmi'], 1),
+                'avg_resting_hr': round(cluster_means['resting_heart_rate'], 1),
+                'medical_conditions': stats.top_counts(
+                    cluster_id, 'medical_conditions', CATEGORICAL_STAT_COLUMNS['medical_conditions']
+                ),
+                'avg_sleep_hours': round(cluster_means['sleep_hours_avg'], 1)
+            },
+            'activity_metrics': {
+                'avg_steps': int(cluster_means['total_steps']),
+                'avg_calories': int(cluster_means['total_calories_burned']),
+                'avg_active_minutes': int(cluster_means['total_active_minutes']),
+                'avg_exercise_sessions': round(cluster_means['exercise_sessions'], 1)
+            },
+            'insurance_distribution': stats.top_counts(cluster_id, 'current_insurance_provider')
+        }
+
+        if describe is not None:
+            summary['description'] = describe(summary)
+
+        cluster_summary[f'Cluster_{cluster_id}'] = summary
+
+    return cluster_summary
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Cold-Start Recommendations
+Precomputed ranked service lists per (insurance provider, cluster) so that a user
+who just signed up gets recommendations from a small JSON table, without pandas
+or scikit-learn in the request path
+"""
+
+import json
+import os
+from datetime import datetime
+
+COLD_START_SCHEMA_VERSION = 1
+
+# Scalar versions of the user predicates in recommendation_tables.ADMIN_SCORE_ADJUSTMENTS,
+# in the same order (the flag index is the adjustment index)
+USER_FLAGS = [
+    ('fitness_intermediate_or_advanced',
+     lambda user: str(user.get('fitness_level', '')).title() in ('Intermediate', 'Advanced')),
+    ('steps_over_50000', lambda user: _number(user.get('total_steps')) > 50000),
+    ('age_over_40', lambda user: _number(user.get('age')) > 40),
+    ('has_medical_condition', lambda user: _has_medical_condition(user)),
+    ('stress_over_4', lambda user: _number(user.get('stress_level_avg')) > 4),
+    ('sleep_under_7', lambda user: _number(user.get('sleep_hours_avg'), float('inf')) < 7),
+    ('everyone', lambda user: True),
+    ('age_under_40', lambda user: _number(user.get('age'), float('inf')) < 40),
+    ('everyone', lambda user: True)
+]
+
+# Fields copied from insurance_services.csv into every recommendation
+SERVICE_FIELDS = [
+    'service_name', 'category', 'description', 'reward_amount', 'reward_type',
+    'eligibility_criteria', 'popularity_score'
+]
+
+
+def _number(value, default=0.0):
+    """Parse numbers coming from CSV rows or JSON payloads; missing values get default"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return default if number != number else number
+
+
+def _has_medical_condition(user):
+    if 'has_medical_condition' in user:
+        return bool(_number(user['has_medical_condition']))
+    return user.get('medical_conditions') not in (None, '', 'None')
+
+
+def _plain(value):
+    """NumPy scalars to plain Python values for JSON"""
+    return value.item() if hasattr(value, 'item') else value
+
+
+def provider_aliases(insurance_df):
+    """Map provider names and short insurer names to provider_id
+
+    The onboarding API stores short names ('TK', 'AOK', 'IKK'); they are
+    matched against the website stem (tk.de -> TK, ikk-classic.de -> IKK).
+    The first provider wins when several share a stem.
+    """
+    aliases = {}
+    for provider in insurance_df.itertuples(index=False):
+        stem = str(provider.website).split('.')[0].split('-')[0].upper()
+        aliases.setdefault(stem, provider.provider_id)
+    for provider in insurance_df.itertuples(index=False):
+        aliases[str(provider.provider_name).upper()] = provider.provider_id
+        aliases[str(provider.provider_id).upper()] = provider.provider_id
+    return aliases
+
+
+def build_cold_start_table(admin):
+    """Build the cold-start table from a clustered AdminAnalytics instance
+
+    For every (provider, cluster) the provider's services are stored with
+    their cluster-level score (popularity after the cluster multipliers) and
+    the bonuses each user flag adds, so a request only sums a few numbers.
+    """
+    if admin.clustering_model is None:
+        raise ValueError("Clustering must be run before building the cold-start table")
+
+    from admin_analytics import DEFAULT_CLUSTERING_FEATURES, NEW_USER_ENCODINGS
+
+    tables = admin._get_recommendation_tables()
+    if len(USER_FLAGS) != len(tables.adjustments):
+        raise ValueError("USER_FLAGS is out of sync with the score adjustments")
+
+    clusters = sorted(int(c) for c in range(admin.clustering_model.n_clusters))
+    base_scores = tables.cluster_base_scores(clusters)
+    bonuses = tables.adjustment_bonus
+    service_ids = tables.services_df['service_id'].tolist()
+
+    lists = {}
+    for provider_id in tables.provider_services:
+        service_index = tables.provider_positions(provider_id)
+        provider_lists = {}
+        for row, cluster_id in enumerate(clusters):
+            provider_lists[str(cluster_id)] = [
+                [service_ids[j], float(base_scores[row, j]),
+                 [[flag, float(bonuses[flag, j])] for flag in range(len(USER_FLAGS)) if bonuses[flag, j] != 0]]
+                for j in service_index
+            ]
+        lists[str(provider_id)] = provider_lists
+
+    services = {
+        service['service_id']: {field: _plain(service[field]) for field in SERVICE_FIELDS}
+        for _, service in tables.services_df.iterrows()
+    }
+
+    features = list(admin.clustering_features or DEFAULT_CLUSTERING_FEATURES)
+    feature_means = admin._get_feature_means()
+    cluster_model = {
+        'features': features,
+        'fill': [float(feature_means[feature]) for feature in features],
+        'mean': admin.scaler.mean_.tolist(),
+        'scale': admin.scaler.scale_.tolist(),
+        'centers': admin.clustering_model.cluster_centers_.tolist(),
+        'encodings': [
+            [source, target, {str(k).lower(): v for k, v in mapping.items()}, default]
+            for source, target, mapping, default in NEW_USER_ENCODINGS
+        ]
+    }
+
+    descriptions = {
+        str(cluster_id): (admin.cluster_summary or {}).get(f'Cluster_{cluster_id}', {}).get('description', '')
+        for cluster_id in clusters
+    }
+
+    return {
+        'schema_version': COLD_START_SCHEMA_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'recommendations_fingerprint': tables.fingerprint,
+        'flags': [name for name, _ in USER_FLAGS],
+        'providers': provider_aliases(admin.insurance_df),
+        'services': services,
+        'cluster_descriptions': descriptions,
+        'cluster_model': cluster_model,
+        'lists': lists
+    }
+
+
+def export_cold_start_table(admin, filepath='cold_start_recommendations.json'):
+    """Write the cold-start table to a JSON file (atomically)"""
+    return write_cold_start_table(build_cold_start_table(admin), filepath)
+
+
+def write_cold_start_table(table, filepath='cold_start_recommendations.json'):
+    """Write a built cold-start table to a JSON file (atomically)"""
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(table, file, ensure_ascii=False)
+    os.replace(tmp_path, filepath)
+    print(f"Cold-start recommendations exported to {filepath}")
+    return table
+
+
+class ColdStartRecommender:
+    """Serve first-visit recommendations from an exported cold-start table
+
+    Only the standard library is used: the user record is encoded and
+    assigned to the nearest cluster center in plain Python, then the
+    provider/cluster list is re-ranked with the user's flags.
+    """
+
+    def __init__(self, table):
+        if table.get('schema_version') != COLD_START_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported cold-start table version: {table.get('schema_version')}")
+        self.table = table
+        self.providers = table['providers']
+        self.services = table['services']
+        self.lists = table['lists']
+        self.model = table['cluster_model']
+
+    @classmethod
+    def load(cls, filepath='cold_start_recommendations.json'):
+        with open(filepath, 'r', encoding='utf-8') as file:
+            return cls(json.load(file))
+
+    def resolve_provider(self, provider):
+        """provider_id for a provider name, short insurer name or id (None if unknown)"""
+        if provider is None:
+            return None
+        return self.providers.get(str(provider).strip().upper())
+
+    def has_cluster(self, cluster):
+        """Whether cluster is one of the exported model's cluster ids"""
+        try:
+            cluster = int(cluster)
+        except (TypeError, ValueError):
+            return False
+        return 0 <= cluster < len(self.model['centers'])
+
+    def assign_cluster(self, user):
+        """Nearest cluster center for a raw user record (CSV row or API payload)"""
+        encoded = dict(user)
+        for source, target, mapping, default in self.model['encodings']:
+            if source in encoded and target not in encoded:
+                encoded[target] = mapping.get(str(encoded[source]).lower(), default)
+        if 'has_medical_condition' not in encoded and 'medical_conditions' in encoded:
+            encoded['has_medical_condition'] = 1 if _has_medical_condition(encoded) else 0
+
+        scaled = [
+            (_number(encoded.get(feature), fill) - mean) / scale
+            for feature, fill, mean, scale in zip(
+                self.model['features'], self.model['fill'], self.model['mean'], self.model['scale']
+            )
+        ]
+
+        best_cluster, best_distance = 0, float('inf')
+        for cluster_id, center in enumerate(self.model['centers']):
+            distance = sum((x - c) * (x - c) for x, c in zip(scaled, center))
+            if distance < best_distance:
+                best_cluster, best_distance = cluster_id, distance
+        return best_cluster
+
+    def recommend(self, user, n_recommendations=2, cluster=None):
+        """Ranked services for a user record; cluster is assigned when not given
+
+        Raises ValueError for a cluster the exported model does not have.
+        """
+        if cluster is not None and not self.has_cluster(cluster):
+            raise ValueError(f"Unknown cluster: {cluster}")
+        provider_id = self.resolve_provider(user.get('provider_id') or user.get('current_insurance_provider'))
+        if provider_id is None or provider_id not in self.lists:
+            return {"error": "No services found for user's insurance provider"}
+
+        cluster = self.assign_cluster(user) if cluster is None else int(cluster)
+        flags = [predicate(user) for _, predicate in USER_FLAGS]
+
+        scored = []
+        for position, (service_id, score, bonuses) in enumerate(self.lists[provider_id][str(cluster)]):
+            for flag, bonus in bonuses:
+                if flags[flag]:
+                    score += bonus
+            scored.append((-score, position, service_id, score))
+        scored.sort()
+
+        recommendations = []
+        for _, _, service_id, score in scored[:n_recommendations]:
+            service = self.services[service_id]
+            recommendations.append({
+                "service_id": service_id,
+                "service_name": service['service_name'],
+                "category": service['category'],
+                "description": service['description'],
+                "reward_amount": service['reward_amount'],
+                "reward_type": service['reward_type'],
+                "relevance_score": round(score, 2),
+                "eligibility_criteria": service['eligibility_criteria'],
+                "popularity_score": service['popularity_score']
+            })
+
+        return {
+            "user_id": user.get('user_id'),
+            "user_cluster": cluster,
+            "cluster_description": self.table['cluster_descriptions'].get(str(cluster), ''),
+            "insurance_provider_id": provider_id,
+            "cold_start": True,
+            "recommendations": recommendations
+        }
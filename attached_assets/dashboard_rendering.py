@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Headless Dashboard Rendering
+Display-free HTML/JSON/PNG output for the user dashboards, with a render cache keyed
+by a hash of the user data each output was drawn from
+"""
+
+import hashlib
+import io
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+RENDER_FORMATS = ('html', 'json', 'png')
+
+# master_df columns the user dashboard is drawn from; a change to any of them re-renders
+DASHBOARD_COLUMNS = [
+    'age', 'gender', 'city', 'fitness_level', 'bmi', 'resting_heart_rate',
+    'blood_pressure_systolic', 'blood_pressure_diastolic', 'medical_conditions',
+    'current_insurance_provider', 'total_steps', 'total_calories_burned',
+    'total_active_minutes', 'exercise_sessions', 'sleep_hours_total', 'sleep_hours_avg',
+    'exercise_frequency_per_week', 'walking_distance_km', 'running_distance_km',
+    'cycling_distance_km'
+]
+
+
+def row_fingerprint(*rows, columns=DASHBOARD_COLUMNS):
+    """Content hash of one or more user rows (Series) over the given columns"""
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(repr([row.get(column) for column in columns]).encode())
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """LRU cache of rendered outputs, each stored with the fingerprint of its input data
+
+    get() only returns an entry whose fingerprint matches the current data,
+    so an edited user row is re-rendered on the next request without any
+    explicit invalidation; invalidate_user() drops a user's entries eagerly.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, fingerprint):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != fingerprint:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, fingerprint, payload):
+        self.entries[key] = (fingerprint, payload)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return payload
+
+    def invalidate_user(self, user_id):
+        """Drop every cached output of one user (keys are (kind, user_id, ...))"""
+        for key in [key for key in self.entries if key[1] == user_id]:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def figure_bytes(fig, output_format='png', dpi=100):
+    """Render a matplotlib Figure (created without pyplot) to image bytes"""
+    FigureCanvasAgg(fig)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=output_format, dpi=dpi)
+    return buffer.getvalue()
+
+
+def draw_user_dashboard(data):
+    """The six user dashboard panels as a pyplot-free matplotlib Figure"""
+    fig = Figure(figsize=(12, 12))
+    fig.suptitle(f"User Dashboard - {data['user_id']}", fontsize=14)
+
+    ax = fig.add_subplot(3, 2, 1)
+    ax.bar(data['activity']['labels'], data['activity']['values'], color='steelblue')
+    ax.set_title('Weekly Activity Overview')
+
+    radar = data['health_radar']
+    angles = np.linspace(0, 2 * np.pi, len(radar['categories']), endpoint=False)
+    ax = fig.add_subplot(3, 2, 2, projection='polar')
+    ax.fill(np.r_[angles, angles[:1]], np.r_[radar['scores'], radar['scores'][:1]], alpha=0.4)
+    ax.set_xticks(angles)
+    ax.set_xticklabels(radar['categories'])
+    ax.set_ylim(0, 100)
+    ax.set_title('Health Metrics Radar')
+
+    ax = fig.add_subplot(3, 2, 3)
+    breakdown = data['activity_breakdown']
+    if sum(breakdown['values']) > 0:
+        ax.pie(breakdown['values'], labels=breakdown['labels'], autopct='%1.0f%%')
+    ax.set_title('Activity Breakdown')
+
+    ax = fig.add_subplot(3, 2, 4)
+    ax.plot(data['trend']['weeks'], data['trend']['steps'], marker='o')
+    ax.set_title('Progress Trends')
+    ax.grid(True, alpha=0.3)
+
+    ax = fig.add_subplot(3, 2, 5)
+    score = data['fitness_score']
+    for low, high, color in [(0, 50, 'lightgray'), (50, 80, 'yellow'), (80, 100, 'green')]:
+        ax.barh(0, high - low, left=low, height=0.5, color=color)
+    ax.barh(0, score, height=0.2, color='darkblue')
+    ax.axvline(90, color='red', linewidth=3)
+    ax.set_xlim(0, 100)
+    ax.set_yticks([])
+    ax.set_title(f'Fitness Score: {score}')
+
+    ax = fig.add_subplot(3, 2, 6)
+    ax.bar(data['sleep']['labels'], data['sleep']['values'], color='slateblue')
+    ax.set_title('Sleep & Recovery')
+
+    fig.tight_layout()
+    return fig
+
+
+def draw_user_comparison(fig, user_id, comparison_data, similar_data):
+    """Draw the user vs similar users bar panels onto a matplotlib Figure"""
+    fig.suptitle(f'User {user_id} vs Similar Users Comparison', fontsize=16)
+    axes = fig.subplots(2, 2)
+
+    # (panel title, key in the comparison records)
+    metrics_to_plot = [
+        ('Steps', 'Steps'),
+        ('Calories', 'Calories'),
+        ('Active Minutes', 'Active_Min'),
+        ('Fitness Score', 'Fitness_Score')
+    ]
+
+    for idx, (title, key) in enumerate(metrics_to_plot):
+        row, col = idx // 2, idx % 2
+        ax = axes[row, col]
+
+        # Plot similar users
+        similar_values = [data[key] for data in similar_data]
+        user_value = comparison_data[key]
+
+        ax.bar(range(len(similar_values)), similar_values, alpha=0.7, color='lightblue', label='Similar Users')
+        ax.axhline(y=user_value, color='red', linestyle='--', linewidth=2, label=f'Your {title}')
+
+        ax.set_title(f'{title} Comparison')
+        ax.set_ylabel(title)
+        ax.set_xlabel('Similar Users')
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Eligibility Engine
+Parses the free-text requirements of insurance bonus programs into typed predicates
+and evaluates eligibility and expected annual rewards for all users at once
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Measurable activity requirements: (pattern, user column). The user columns hold
+# weekly totals, so thresholds are converted to per-week values with PER_WEEK.
+ACTIVITY_REQUIREMENT_PATTERNS = [
+    (re.compile(r'([\d.,]+)\s*steps?\s*/\s*(day|week|month)', re.I), 'total_steps'),
+    (re.compile(r'([\d.,]+)\s*km\s*/\s*(day|week|month)', re.I), 'total_distance_km'),
+    (re.compile(r'([\d.,]+)\s*(?:active\s*)?min(?:ute)?s?\s*/\s*(day|week|month)', re.I), 'total_active_minutes'),
+    (re.compile(r'([\d.,]+)\s*(?:exercise\s*)?workouts?\s*/\s*(day|week|month)', re.I), 'exercise_sessions')
+]
+
+PER_WEEK = {'day': 7.0, 'week': 1.0, 'month': 12 / 52}
+
+_AGE_RANGE = re.compile(r'(\d+)\s*[-–]\s*(\d+)')
+_AGE_UNDER = re.compile(r'(?:under|below|<)\s*(\d+)', re.I)
+_AGE_OVER = re.compile(r'(?:over|above|>)\s*(\d+)|(\d+)\s*\+', re.I)
+
+
+def _text_or_none(value):
+    return value if isinstance(value, str) else None
+
+
+def parse_activity_requirement(text):
+    """'10000 steps/week' -> ('total_steps', 10000.0)
+
+    Requirements that cannot be checked against tracked data (courses,
+    check-ups, program participation) return (None, nan) and do not restrict
+    eligibility.
+    """
+    if not isinstance(text, str):
+        return None, np.nan
+    for pattern, column in ACTIVITY_REQUIREMENT_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            amount = float(match.group(1).replace(',', ''))
+            return column, amount * PER_WEEK[match.group(2).lower()]
+    return None, np.nan
+
+
+def parse_age_restriction(text):
+    """Age bounds (inclusive, whole years): NaN/'None' -> (0, inf), 'Under 18' -> (0, 17), '18-45' -> (18, 45)"""
+    if not isinstance(text, str) or text.strip().lower() in ('', 'none', 'nan'):
+        return 0.0, np.inf
+    match = _AGE_RANGE.search(text)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    match = _AGE_UNDER.search(text)
+    if match:
+        return 0.0, float(match.group(1)) - 1
+    match = _AGE_OVER.search(text)
+    if match:
+        bound = match.group(1) or match.group(2)
+        return float(bound) + (1 if match.group(1) else 0), np.inf
+    return 0.0, np.inf
+
+
+class EligibilityEngine:
+    """Typed, array-backed eligibility predicates for every service
+
+    A user is eligible for a service when it belongs to their insurance
+    provider, their age is inside the age restriction and they meet any
+    measurable activity requirement. The expected annual reward is the
+    reward amount capped at max_annual_benefit for eligible pairs.
+    """
+
+    def __init__(self, services_df):
+        self.source_services_df = services_df
+        self.services_df = services_df.reset_index(drop=True)
+        n_services = len(self.services_df)
+
+        self.provider_ids = self.services_df['provider_id'].to_numpy()
+
+        requirements = [
+            parse_activity_requirement(text)
+            for text in self.services_df.get('activity_requirement', pd.Series([None] * n_services))
+        ]
+        self.requirement_columns = [column for column, _ in requirements]
+        self.requirement_thresholds = np.array([threshold for _, threshold in requirements], dtype=float)
+
+        ages = [
+            parse_age_restriction(text)
+            for text in self.services_df.get('age_restriction', pd.Series([None] * n_services))
+        ]
+        self.age_min = np.array([low for low, _ in ages], dtype=float)
+        self.age_max = np.array([high for _, high in ages], dtype=float)
+
+        reward = pd.to_numeric(self.services_df['reward_amount'], errors='coerce').fillna(0).to_numpy(dtype=float)
+        if 'max_annual_benefit' in self.services_df.columns:
+            cap = pd.to_numeric(self.services_df['max_annual_benefit'], errors='coerce').to_numpy(dtype=float)
+            reward = np.where(np.isnan(cap), reward, np.minimum(reward, cap))
+        self.annual_reward = reward
+
+    def evaluate(self, users_df, provider_only=True):
+        """Eligibility mask and expected annual reward, both users x services"""
+        n_users = len(users_df)
+        ages = users_df['age'].to_numpy(dtype=float)[:, None]
+        eligible = (ages >= self.age_min[None, :]) & (ages <= self.age_max[None, :])
+
+        if provider_only:
+            eligible &= users_df['provider_id'].to_numpy()[:, None] == self.provider_ids[None, :]
+
+        for column in {c for c in self.requirement_columns if c is not None}:
+            services = np.array([c == column for c in self.requirement_columns])
+            if column in users_df.columns:
+                values = users_df[column].to_numpy(dtype=float)[:, None]
+                met = values >= self.requirement_thresholds[None, services]
+            else:
+                met = np.zeros((n_users, int(services.sum())), dtype=bool)
+            eligible[:, services] &= met
+
+        expected_reward = np.where(eligible, self.annual_reward[None, :], 0.0)
+        return eligible, expected_reward
+
+    def user_eligibility(self, user_row):
+        """Per-service eligibility for one user (a single-row DataFrame or Series)"""
+        users_df = user_row.to_frame().T if isinstance(user_row, pd.Series) else user_row
+        eligible, expected_reward = self.evaluate(users_df.iloc[:1], provider_only=True)
+        provider_id = users_df['provider_id'].iloc[0]
+
+        results = []
+        for j in np.flatnonzero(self.provider_ids == provider_id):
+            service = self.services_df.iloc[j]
+            results.append({
+                "service_id": service['service_id'],
+                "service_name": service['service_name'],
+                "eligible": bool(eligible[0, j]),
+                "expected_annual_reward": float(expected_reward[0, j]),
+                "activity_requirement": _text_or_none(service.get('activity_requirement')),
+                "age_restriction": _text_or_none(service.get('age_restriction'))
+            })
+        return results
+
+    def program_report(self, users_df, chunk_size=100000):
+        """Eligible members and expected payout per program, evaluated in user chunks"""
+        members = np.zeros(len(self.services_df), dtype=np.int64)
+        eligible_members = np.zeros(len(self.services_df), dtype=np.int64)
+        expected_payout = np.zeros(len(self.services_df))
+
+        provider_ids = users_df['provider_id'].to_numpy()
+        for start in range(0, len(users_df), chunk_size):
+            chunk = users_df.iloc[start:start + chunk_size]
+            eligible, expected_reward = self.evaluate(chunk, provider_only=True)
+            members += (provider_ids[start:start + chunk_size, None] == self.provider_ids[None, :]).sum(axis=0)
+            eligible_members += eligible.sum(axis=0)
+            expected_payout += expected_reward.sum(axis=0)
+
+        report = self.services_df[['provider_id', 'service_id', 'service_name', 'category']].copy()
+        report['members'] = members
+        report['eligible_members'] = eligible_members
+        report['eligible_share'] = np.round(
+            np.divide(eligible_members, members, out=np.zeros(len(members)), where=members > 0) * 100, 1
+        )
+        report['annual_reward'] = self.annual_reward
+        report['expected_annual_payout'] = expected_payout
+        return report
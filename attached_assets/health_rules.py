@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Health and Activity Rules
+The activity and health recommendation rules as vectorized masks over the master
+dataset, giving every user a compact bitset of triggered recommendations
+"""
+
+import numpy as np
+import pandas as pd
+
+RULE_GROUPS = ('activity_recommendations', 'health_recommendations')
+
+# (group, type, trigger over the users frame, message, target); bit i of a user's
+# bitset is rule i, and decoded lists keep this order within each group
+RECOMMENDATION_RULES = [
+    ('activity_recommendations', 'steps',
+     lambda users: users['total_steps'] < 40000,
+     "Try to increase daily steps by 2000. Consider taking walking breaks every hour.",
+     "45000+ steps per week"),
+    ('activity_recommendations', 'exercise',
+     lambda users: users['exercise_sessions'] < 3,
+     "Add 1-2 more exercise sessions per week for better fitness.",
+     "4-5 sessions per week"),
+    ('activity_recommendations', 'activity',
+     lambda users: users['total_active_minutes'] < 150,
+     "Increase active minutes to meet WHO recommendations.",
+     "150+ minutes per week"),
+    ('health_recommendations', 'weight',
+     lambda users: users['bmi'] > 25,
+     "Consider consulting a nutritionist for healthy weight management.",
+     "BMI 18.5-24.9"),
+    ('health_recommendations', 'cardio',
+     lambda users: users['resting_heart_rate'] > 80,
+     "Focus on cardiovascular exercises to improve heart health.",
+     "Resting HR 60-75 bpm"),
+    ('health_recommendations', 'sleep',
+     lambda users: users['sleep_hours_avg'] < 7,
+     "Prioritize sleep hygiene for better recovery and health.",
+     "7-9 hours per night")
+]
+
+RULE_TYPES = [rule_type for _, rule_type, _, _, _ in RECOMMENDATION_RULES]
+
+
+def bitset_dtype(n_rules):
+    """Smallest unsigned integer type holding one bit per rule"""
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if n_rules <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError(f"Too many rules for a bitset: {n_rules}")
+
+
+def evaluate_rules(users_df, rules=RECOMMENDATION_RULES):
+    """Bitset of triggered rules per user, one vectorized mask per rule
+
+    Missing values never trigger a rule, as in the scalar comparisons.
+    """
+    dtype = bitset_dtype(len(rules))
+    bits = np.zeros(len(users_df), dtype=dtype)
+    for i, (_, _, trigger, _, _) in enumerate(rules):
+        fired = np.asarray(trigger(users_df), dtype=bool)
+        bits |= fired.astype(dtype) << dtype(i)
+    return bits
+
+
+def rule_mask(rule_types, rules=RECOMMENDATION_RULES):
+    """Bitset with the bits of the given rule types set"""
+    types = [rule_type for _, rule_type, _, _, _ in rules]
+    mask = 0
+    for rule_type in ([rule_types] if isinstance(rule_types, str) else rule_types):
+        if rule_type not in types:
+            raise KeyError(f"Unknown recommendation rule: {rule_type}")
+        mask |= 1 << types.index(rule_type)
+    return mask
+
+
+def decode_rules(bits, rules=RECOMMENDATION_RULES):
+    """Recommendation lists per group for one user's bitset"""
+    bits = int(bits)
+    recommendations = {group: [] for group in RULE_GROUPS}
+    for i, (group, rule_type, _, message, target) in enumerate(rules):
+        if bits >> i & 1:
+            recommendations.setdefault(group, []).append({
+                "type": rule_type,
+                "message": message,
+                "target": target
+            })
+    return recommendations
+
+
+def rule_counts(bits, groups=None, rules=RECOMMENDATION_RULES):
+    """Users triggering each rule, overall or per group value (e.g. insurance provider)
+
+    Counts come from the bitsets with one bincount per rule; the 'users'
+    column holds the group sizes.
+    """
+    bits = np.asarray(bits)
+    if groups is None:
+        codes, labels = np.zeros(len(bits), dtype=np.int64), pd.Index(['All'])
+    else:
+        codes, labels = pd.factorize(np.asarray(groups), sort=True)
+        labels = pd.Index(labels)
+        # Users without a group value are left out
+        bits, codes = bits[codes >= 0], codes[codes >= 0]
+
+    counts = {'users': np.bincount(codes, minlength=len(labels))}
+    for i, (_, rule_type, _, _, _) in enumerate(rules):
+        counts[rule_type] = np.bincount(codes, weights=(bits >> i) & 1, minlength=len(labels)).astype(np.int64)
+    return pd.DataFrame(counts, index=labels)
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Weekly Step Leaderboard
+Global, per-city and per-provider standings of the league kept in order-statistics
+trees, so updates, top-K pages and a user's own rank cost O(log n)
+"""
+
+import csv
+import os
+import random
+from collections import deque
+from datetime import date, datetime, timedelta
+
+BOARDS = ('global', 'city', 'provider')
+
+ARCHIVE_COLUMNS = ['user_id', 'total_steps', 'city', 'provider', 'global_rank', 'city_rank', 'provider_rank']
+
+
+class _Node:
+    __slots__ = ('key', 'priority', 'size', 'left', 'right')
+
+    def __init__(self, key, priority):
+        self.key = key
+        self.priority = priority
+        self.size = 1
+        self.left = None
+        self.right = None
+
+    def update(self):
+        self.size = 1 + _size(self.left) + _size(self.right)
+
+
+def _size(node):
+    return node.size if node is not None else 0
+
+
+def _split(node, key):
+    """(keys < key, keys >= key)"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        left, right = _split(node.right, key)
+        node.right = left
+        node.update()
+        return node, right
+    left, right = _split(node.left, key)
+    node.left = right
+    node.update()
+    return left, node
+
+
+def _merge(left, right):
+    """Join two treaps where every key of left is smaller than every key of right"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.update()
+        return left
+    right.left = _merge(left, right.left)
+    right.update()
+    return right
+
+
+def _erase(node, key):
+    if node is None:
+        return None, False
+    if key < node.key:
+        node.left, found = _erase(node.left, key)
+    elif node.key < key:
+        node.right, found = _erase(node.right, key)
+    else:
+        return _merge(node.left, node.right), True
+    if found:
+        node.size -= 1
+    return node, found
+
+
+class OrderStatisticsTree:
+    """Treap of unique keys with subtree sizes
+
+    Random priorities keep the expected depth O(log n), so insert, remove,
+    rank (keys smaller than a key) and select (k-th smallest key) are all
+    O(log n); a page of K keys from any offset costs O(log n + K).
+    """
+
+    def __init__(self, keys=(), seed=None):
+        self._random = random.Random(seed)
+        self.root = self._build(sorted(keys))
+
+    def _build(self, keys):
+        """Balanced treap from sorted keys in O(n): priorities descend level by level"""
+        if not keys:
+            return None
+
+        def build(low, high):
+            if low >= high:
+                return None
+            middle = (low + high) // 2
+            node = _Node(keys[middle], 0.0)
+            node.left = build(low, middle)
+            node.right = build(middle + 1, high)
+            node.update()
+            return node
+
+        root = build(0, len(keys))
+        priorities = sorted((self._random.random() for _ in keys), reverse=True)
+        queue = deque([root])
+        for priority in priorities:
+            node = queue.popleft()
+            node.priority = priority
+            queue.extend(child for child in (node.left, node.right) if child is not None)
+        return root
+
+    def __len__(self):
+        return _size(self.root)
+
+    def insert(self, key):
+        left, right = _split(self.root, key)
+        self.root = _merge(_merge(left, _Node(key, self._random.random())), right)
+
+    def remove(self, key):
+        """Remove a key; returns False if it was not present"""
+        self.root, found = _erase(self.root, key)
+        return found
+
+    def rank(self, key):
+        """Number of keys smaller than key"""
+        count, node = 0, self.root
+        while node is not None:
+            if node.key < key:
+                count += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return count
+
+    def select(self, k):
+        """The k-th smallest key (0-based)"""
+        node = self.root
+        while node is not None:
+            left = _size(node.left)
+            if k < left:
+                node = node.left
+            elif k == left:
+                return node.key
+            else:
+                k -= left + 1
+                node = node.right
+        raise IndexError(k)
+
+    def slice(self, offset, limit):
+        """Up to limit keys in order, starting at the offset-th smallest"""
+        # Path to the offset-th node, keeping the ancestors that come after it
+        stack, node, k = [], self.root, offset
+        while node is not None:
+            left = _size(node.left)
+            if k < left:
+                stack.append(node)
+                node = node.left
+            elif k == left:
+                stack.append(node)
+                break
+            else:
+                k -= left + 1
+                node = node.right
+        else:
+            return []
+
+        keys = []
+        while stack and len(keys) < limit:
+            node = stack.pop()
+            keys.append(node.key)
+            child = node.right
+            while child is not None:
+                stack.append(child)
+                child = child.left
+        return keys
+
+    def __iter__(self):
+        return iter(self.slice(0, len(self)))
+
+
+def week_start(value):
+    """'YYYY-MM-DD' of the Monday starting the ISO week of a date, datetime or ISO date string
+
+    Raises ValueError for anything that is not a valid date.
+    """
+    if isinstance(value, datetime):
+        value = value.date()
+    elif not isinstance(value, date):
+        value = date.fromisoformat(str(value))
+    return (value - timedelta(days=value.weekday())).isoformat()
+
+
+def _standing_key(user_id, total_steps):
+    # Most steps first; user_id breaks ties so every key is unique
+    return (-total_steps, user_id)
+
+
+class Leaderboard:
+    """One week's standings by total steps: global, per city and per provider
+
+    Each (board, scope) pair has its own order-statistics tree. Ranks use
+    competition ranking (users with equal steps share a rank); pages list
+    tied users by user_id.
+    """
+
+    def __init__(self, week=None):
+        self.week = week
+        self.entries = {}
+        self.trees = {}
+
+    @staticmethod
+    def _scopes(entry):
+        scopes = [('global', None)]
+        for board in ('city', 'provider'):
+            if entry.get(board):
+                scopes.append((board, entry[board]))
+        return scopes
+
+    @classmethod
+    def bulk(cls, week, rows):
+        """Leaderboard from (user_id, total_steps, city, provider) rows, one sort per tree"""
+        leaderboard = cls(week)
+        keys = {}
+        for user_id, total_steps, city, provider in rows:
+            entry = {'total_steps': total_steps, 'city': city, 'provider': provider}
+            if user_id in leaderboard.entries:
+                continue
+            leaderboard.entries[user_id] = entry
+            for scope in cls._scopes(entry):
+                keys.setdefault(scope, []).append(_standing_key(user_id, total_steps))
+        leaderboard.trees = {scope: OrderStatisticsTree(scope_keys) for scope, scope_keys in keys.items()}
+        return leaderboard
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, user_id, total_steps, city=None, provider=None):
+        """Set a user's steps for the week (city/provider default to the previous entry), O(log n)"""
+        previous = self.entries.get(user_id)
+        if previous is not None:
+            city = previous['city'] if city is None else city
+            provider = previous['provider'] if provider is None else provider
+            self.remove(user_id)
+
+        entry = {'total_steps': total_steps, 'city': city, 'provider': provider}
+        self.entries[user_id] = entry
+        for scope in self._scopes(entry):
+            self.trees.setdefault(scope, OrderStatisticsTree()).insert(_standing_key(user_id, total_steps))
+        return entry
+
+    def remove(self, user_id):
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return False
+        for scope in self._scopes(entry):
+            tree = self.trees[scope]
+            tree.remove(_standing_key(user_id, entry['total_steps']))
+            if not len(tree):
+                del self.trees[scope]
+        return True
+
+    def _competition_rank(self, tree, total_steps):
+        # Users with strictly more steps, plus one ('' sorts before every user_id)
+        return tree.rank(_standing_key('', total_steps)) + 1
+
+    def top(self, board='global', scope=None, offset=0, limit=10):
+        """One page of standings: [{'rank', 'user_id', 'total_steps'}, ...]"""
+        if board not in BOARDS:
+            raise ValueError(f"Unknown board: {board}")
+        tree = self.trees.get((board, None if board == 'global' else scope))
+        if tree is None:
+            return []
+        page = []
+        for negative_steps, user_id in tree.slice(max(offset, 0), limit):
+            page.append({
+                'rank': self._competition_rank(tree, -negative_steps),
+                'user_id': user_id,
+                'total_steps': -negative_steps
+            })
+        return page
+
+    def rank(self, user_id, board='global'):
+        """A user's rank on one board (their own city/provider), or None if not ranked"""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        scope = None if board == 'global' else entry.get(board)
+        tree = self.trees.get((board, scope))
+        if tree is None:
+            return None
+        return {
+            'board': board,
+            'scope': scope,
+            'rank': self._competition_rank(tree, entry['total_steps']),
+            'out_of': len(tree),
+            'total_steps': entry['total_steps']
+        }
+
+    def user_ranks(self, user_id):
+        """A user's rank on every board, or None if the user has no steps this week"""
+        if user_id not in self.entries:
+            return None
+        return {board: self.rank(user_id, board) for board in BOARDS if self.rank(user_id, board)}
+
+
+class ArchivedWeek:
+    """A finished week's standings read from its archive CSV, indexed for lookups
+
+    Holds each (board, scope) page list in rank order and every user's
+    ranks with their board sizes, so archived pages and ranks are answered
+    from memory.
+    """
+
+    def __init__(self, week, rows):
+        self.week = week
+        self.pages = {}
+        for row in rows:
+            for board in BOARDS:
+                if not row[f'{board}_rank']:
+                    continue
+                scope = None if board == 'global' else row[board]
+                # Rows are stored in global order, which is also the order within a city or provider
+                self.pages.setdefault((board, scope), []).append(
+                    {'rank': int(row[f'{board}_rank']), 'user_id': row['user_id'],
+                     'total_steps': int(row['total_steps'])}
+                )
+
+        self.ranks = {}
+        for (board, scope), page in self.pages.items():
+            for entry in page:
+                self.ranks.setdefault(entry['user_id'], {})[board] = {
+                    'board': board,
+                    'scope': scope,
+                    'rank': entry['rank'],
+                    'out_of': len(page),
+                    'total_steps': entry['total_steps']
+                }
+
+    @classmethod
+    def read(cls, week, path):
+        with open(path, 'r', newline='', encoding='utf-8') as file:
+            return cls(week, list(csv.DictReader(file)))
+
+    def top(self, board='global', scope=None, offset=0, limit=10):
+        page = self.pages.get((board, None if board == 'global' else scope), [])
+        return page[max(offset, 0):max(offset, 0) + limit]
+
+
+class WeeklyLeague:
+    """The current week's Leaderboard plus an archive of finished weeks
+
+    Weeks are identified by their Monday (see week_start), so any date
+    within a week records into that week. Steps recorded for a later week
+    roll the league over: the finished week's standings are written to
+    archive_dir/<week>.csv and a new, empty leaderboard starts. Steps for
+    already archived weeks are rejected.
+
+    Archived weeks are read into memory once and re-read only when their
+    file changes; checking for changes costs one stat of archive_dir.
+    """
+
+    def __init__(self, archive_dir='leaderboard_archive', week=None):
+        self.archive_dir = archive_dir
+        self.current = Leaderboard(None if week is None else week_start(week))
+        # week -> (file stamp, ArchivedWeek), and user -> latest archived week with them
+        self._archived = {}
+        self._latest_archived_week = {}
+        self._archive_stamp = None
+
+    @classmethod
+    def from_csv_files(cls, activity_path, demographic_path=None, physical_path=None,
+                       archive_dir='leaderboard_archive'):
+        """League for the latest week of the weekly activity CSV, with city and provider per user
+
+        Earlier weeks of the CSV are archived (unless already archived), so
+        their standings stay available.
+        """
+        cities = _read_column(demographic_path, 'city')
+        providers = _read_column(physical_path, 'current_insurance_provider')
+
+        rows_by_week = {}
+        with open(activity_path, 'r', newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                try:
+                    total_steps = int(float(row['total_steps']))
+                    week = week_start(row['week_start_date'])
+                except (TypeError, ValueError):
+                    continue
+                rows_by_week.setdefault(week, []).append((row['user_id'], total_steps))
+
+        league = cls(archive_dir)
+        for week in sorted(rows_by_week):
+            # A later row of the same user and week wins
+            latest = {user_id: total_steps for user_id, total_steps in rows_by_week[week]}
+            leaderboard = Leaderboard.bulk(week, [
+                (user_id, total_steps, cities.get(user_id), providers.get(user_id))
+                for user_id, total_steps in latest.items()
+            ])
+            if week < max(rows_by_week):
+                if not os.path.exists(league._archive_path(week)):
+                    league.archive(leaderboard)
+            else:
+                league.current = leaderboard
+        return league
+
+    @property
+    def week(self):
+        return self.current.week
+
+    def record(self, user_id, week, total_steps, city=None, provider=None):
+        """Record a user's weekly steps, rolling over first if week is newer; False if rejected
+
+        week may be any date within the week; a ValueError is raised if it is not a date.
+        """
+        week = week_start(week)
+        if self.current.week is None:
+            self.current.week = week
+        if week > self.current.week:
+            self.rollover(week)
+        elif week < self.current.week:
+            print(f"Ignoring steps of {user_id} for archived week {week} (current week {self.current.week})")
+            return False
+        self.current.update(user_id, total_steps, city, provider)
+        return True
+
+    def rollover(self, new_week):
+        """Archive the current standings and start an empty leaderboard for new_week"""
+        path = self.archive() if len(self.current) else None
+        self.current = Leaderboard(week_start(new_week))
+        return path
+
+    def _archive_path(self, week):
+        # File names only ever come from a normalized week, never from raw input
+        return os.path.join(self.archive_dir, f"{week_start(week)}.csv")
+
+    def archive(self, leaderboard=None):
+        """Write a week's full standings (default: the current week's) to archive_dir/<week>.csv (atomically)"""
+        leaderboard = self.current if leaderboard is None else leaderboard
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = self._archive_path(leaderboard.week)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=ARCHIVE_COLUMNS)
+            writer.writeheader()
+            for entry in leaderboard.top('global', offset=0, limit=len(leaderboard)):
+                user_id = entry['user_id']
+                standing = leaderboard.entries[user_id]
+                ranks = leaderboard.user_ranks(user_id)
+                writer.writerow({
+                    'user_id': user_id,
+                    'total_steps': standing['total_steps'],
+                    'city': standing['city'] or '',
+                    'provider': standing['provider'] or '',
+                    **{f'{board}_rank': ranks[board]['rank'] if board in ranks else '' for board in BOARDS}
+                })
+        os.replace(tmp_path, path)
+        self._archive_stamp = None
+        print(f"Leaderboard for week {leaderboard.week} archived to {path}")
+        return path
+
+    def _load_archive(self):
+        """Archived weeks in memory; files are re-read only when the archive directory changed"""
+        stamp = _stat_stamp(self.archive_dir)
+        if stamp == self._archive_stamp:
+            return self._archived
+
+        names = sorted(os.listdir(self.archive_dir)) if stamp is not None else []
+        archived = {}
+        for week in (name[:-4] for name in names if name.endswith('.csv')):
+            path = os.path.join(self.archive_dir, f'{week}.csv')
+            file_stamp = _stat_stamp(path)
+            cached = self._archived.get(week)
+            if cached is not None and cached[0] == file_stamp:
+                archived[week] = cached
+            elif file_stamp is not None:
+                archived[week] = (file_stamp, ArchivedWeek.read(week, path))
+
+        latest = {}
+        for week in sorted(archived):
+            for user_id in archived[week][1].ranks:
+                latest[user_id] = week
+        self._archived = archived
+        self._latest_archived_week = latest
+        self._archive_stamp = stamp
+        return archived
+
+    def archived_weeks(self):
+        return sorted(self._load_archive())
+
+    def archived_top(self, week, board='global', scope=None, offset=0, limit=10):
+        """One page of an archived week's standings (None if the week was not archived)"""
+        if board not in BOARDS:
+            raise ValueError(f"Unknown board: {board}")
+        archived = self._archived_week(week)
+        if archived is None:
+            return None
+        return archived.top(board, scope, offset, limit)
+
+    def archived_user_ranks(self, user_id):
+        """(week, ranks) of the latest archived week the user took part in, or None
+
+        ranks has the shape of Leaderboard.user_ranks.
+        """
+        self._load_archive()
+        week = self._latest_archived_week.get(user_id)
+        if week is None:
+            return None
+        return week, self._archived[week][1].ranks[user_id]
+
+    def _archived_week(self, week):
+        """An archived week's standings (None if the week was not archived)"""
+        try:
+            week = week_start(week)
+        except (TypeError, ValueError):
+            return None
+        # Only weeks listed in the archive, so a week can never point outside it
+        archived = self._load_archive().get(week)
+        return None if archived is None else archived[1]
+
+
+def _stat_stamp(path):
+    """Modification time and size of a file or directory (None if it does not exist)"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def _read_column(path, column):
+    """user_id -> column value from a user CSV (empty if the file is missing)"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        return {row['user_id']: row.get(column) or None for row in csv.DictReader(file)}
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Cluster Model Artifact
+Versioned on-disk format for the clustering model: raw .npy arrays (memory-mappable)
+plus a JSON manifest. Loading and predicting need only NumPy, not scikit-learn.
+
+The artifact path is a symlink to a version directory next to it
+(cluster_model -> cluster_model.v<version>); exporting writes a new version
+directory and re-points the link with one rename.
+"""
+
+import json
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+
+ARTIFACT_SCHEMA_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+
+# Version directories kept next to the link: the active one and its predecessor,
+# which readers that resolved the link just before a swap may still be loading
+KEPT_VERSIONS = 2
+
+
+def _feature_value(value):
+    """Numeric feature from a CSV row or JSON payload; None for missing or non-numeric values"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if number != number else number
+
+
+def _json_default(value):
+    """JSON encoder hook for NumPy scalars and arrays"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ArtifactScaler:
+    """StandardScaler stand-in: transform() with the stored mean and scale"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+        self.n_features_in_ = len(mean)
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=float) - self.mean_) / self.scale_
+
+
+class ArtifactKMeans:
+    """KMeans stand-in: nearest-center predict() with the stored centers"""
+
+    def __init__(self, centers):
+        self.cluster_centers_ = centers
+        self.n_clusters = len(centers)
+
+    def transform(self, X):
+        """Euclidean distance from every row to every center"""
+        X = np.asarray(X, dtype=float)
+        squared = (
+            np.einsum('ij,ij->i', X, X)[:, None]
+            - 2 * X @ self.cluster_centers_.T
+            + np.einsum('ij,ij->i', self.cluster_centers_, self.cluster_centers_)[None, :]
+        )
+        return np.sqrt(np.maximum(squared, 0))
+
+    def predict(self, X):
+        return self.transform(X).argmin(axis=1)
+
+
+class ArtifactPCA:
+    """PCA stand-in: transform() with the stored components and mean"""
+
+    def __init__(self, components, mean):
+        self.components_ = components
+        self.mean_ = mean
+        self.n_components_ = len(components)
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=float) - self.mean_) @ self.components_.T
+
+
+class ModelArtifact:
+    """A loaded cluster model artifact
+
+    Arrays are memory-mapped read-only by default, so loading costs a
+    manifest read and a few file opens; the scaler, model and pca
+    attributes are NumPy-only adapters with the scikit-learn method names.
+    """
+
+    def __init__(self, path, manifest, arrays):
+        self.path = path
+        self.manifest = manifest
+        self.arrays = arrays
+        self.version = manifest.get('model_version')
+        self.features = manifest['features']
+        # Categories are matched case-insensitively, as in the cold-start table
+        self.encodings = [
+            (source, target, {str(key).lower(): value for key, value in mapping.items()}, default)
+            for source, target, mapping, default in manifest.get('encodings', [])
+        ]
+
+        self.scaler = ArtifactScaler(arrays['scaler_mean'], arrays['scaler_scale'])
+        self.model = ArtifactKMeans(arrays['centers'])
+        self.pca = ArtifactPCA(arrays['pca_components'], arrays['pca_mean']) if 'pca_components' in arrays else None
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        # Resolve the link once, so the manifest and arrays come from the same version
+        path = os.path.realpath(path)
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        schema_version = manifest.get('schema_version')
+        if schema_version is None or schema_version > ARTIFACT_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported model artifact schema version: {schema_version}")
+
+        arrays = {}
+        for name, spec in manifest['arrays'].items():
+            array = np.load(os.path.join(path, spec['file']), mmap_mode='r' if mmap else None)
+            if list(array.shape) != spec['shape']:
+                raise ValueError(f"Array {name} has shape {array.shape}, manifest says {spec['shape']}")
+            arrays[name] = array
+        return cls(path, manifest, arrays)
+
+    @property
+    def feature_fill(self):
+        """Values used for missing features (training means)"""
+        return self.arrays['feature_fill']
+
+    @property
+    def cluster_summary(self):
+        return self.manifest.get('cluster_summary')
+
+    @property
+    def recommendation_rules(self):
+        rules = self.manifest.get('recommendation_rules')
+        if rules is None:
+            return None
+        return {int(cluster_id): [tuple(rule) for rule in cluster_rules]
+                for cluster_id, cluster_rules in rules.items()}
+
+    def encode(self, records):
+        """Feature matrix for raw user records (dicts), with categorical encodings and mean fill
+        
+        Categories match case-insensitively; empty strings (as in CSV rows)
+        and non-numeric values count as missing and get the training mean.
+        """
+        X = np.tile(np.asarray(self.feature_fill, dtype=float), (len(records), 1))
+        positions = {feature: j for j, feature in enumerate(self.features)}
+        for i, record in enumerate(records):
+            encoded = dict(record)
+            for source, target, mapping, default in self.encodings:
+                if target in encoded or encoded.get(source) in (None, ''):
+                    continue
+                encoded[target] = mapping.get(str(encoded[source]).lower(), default)
+            if 'has_medical_condition' not in encoded and 'medical_conditions' in encoded:
+                encoded['has_medical_condition'] = 0 if encoded['medical_conditions'] in (None, '', 'None') else 1
+            for feature, j in positions.items():
+                value = _feature_value(encoded.get(feature))
+                if value is not None:
+                    X[i, j] = value
+        return X
+
+    def predict(self, records):
+        """Cluster for each raw user record"""
+        return self.model.predict(self.scaler.transform(self.encode(records)))
+
+
+def export_model_artifact(admin, path, data_fingerprint=None):
+    """Write an AdminAnalytics clustering model as a versioned artifact directory
+
+    The version directory is written next to the target, then the target
+    symlink is re-pointed with a single rename, so the path always resolves
+    to a complete artifact.
+    """
+    features = list(admin.clustering_features)
+    arrays = {
+        'centers': np.asarray(admin.clustering_model.cluster_centers_, dtype=float),
+        'scaler_mean': np.asarray(admin.scaler.mean_, dtype=float),
+        'scaler_scale': np.asarray(admin.scaler.scale_, dtype=float),
+        'feature_fill': np.asarray(admin._get_feature_means()[features], dtype=float)
+    }
+    if admin.pca_model is not None:
+        arrays['pca_components'] = np.asarray(admin.pca_model.components_, dtype=float)
+        arrays['pca_mean'] = np.asarray(admin.pca_model.mean_, dtype=float)
+
+    from admin_analytics import NEW_USER_ENCODINGS
+
+    created_at = datetime.now()
+    manifest = {
+        'schema_version': ARTIFACT_SCHEMA_VERSION,
+        'model_version': created_at.strftime('%Y%m%d%H%M%S%f'),
+        'created_at': created_at.isoformat(timespec='seconds'),
+        'data_fingerprint': data_fingerprint,
+        'n_clusters': int(len(arrays['centers'])),
+        'features': features,
+        'encodings': [[source, target, mapping, default]
+                      for source, target, mapping, default in NEW_USER_ENCODINGS],
+        'arrays': {
+            name: {'file': f'{name}.npy', 'shape': list(array.shape), 'dtype': str(array.dtype)}
+            for name, array in arrays.items()
+        },
+        'cluster_summary': admin.cluster_summary,
+        'recommendation_rules': {
+            str(cluster_id): [list(rule) for rule in rules]
+            for cluster_id, rules in (getattr(admin, 'recommendation_rules', None) or {}).items()
+        } or None
+    }
+
+    path = os.path.normpath(path)
+    version_dir = f"{path}.v{manifest['model_version']}"
+    staging = f"{version_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, f'{name}.npy'), array)
+    with open(os.path.join(staging, MANIFEST_FILE), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, default=_json_default, ensure_ascii=False, indent=2)
+    os.replace(staging, version_dir)
+
+    _switch_link(path, version_dir)
+    _prune_versions(path)
+    return manifest
+
+
+def _switch_link(path, version_dir):
+    """Point the artifact path at version_dir with one rename"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        # Artifacts exported before versioned directories: move the old one aside once
+        shutil.rmtree(f"{path}.legacy", ignore_errors=True)
+        os.replace(path, f"{path}.legacy")
+    link = f"{path}.link-{os.getpid()}"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(version_dir), link)
+    os.replace(link, path)
+    shutil.rmtree(f"{path}.legacy", ignore_errors=True)
+
+
+def _prune_versions(path):
+    """Remove version directories beyond the newest KEPT_VERSIONS"""
+    directory = os.path.dirname(path) or '.'
+    prefix = f"{os.path.basename(path)}.v"
+    versions = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith(prefix) and '.tmp-' not in name
+    )
+    active = os.path.basename(os.path.realpath(path))
+    for name in versions[:-KEPT_VERSIONS]:
+        if name != active:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Model Registry
+Watches a cluster model artifact directory, loads and validates new versions in a
+background thread and swaps the active model atomically
+"""
+
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from model_artifact import MANIFEST_FILE, ModelArtifact
+
+
+def validate_artifact(artifact):
+    """Basic consistency checks before a model goes live; raises ValueError"""
+    centers = np.asarray(artifact.model.cluster_centers_)
+    n_features = len(artifact.features)
+    if centers.ndim != 2 or centers.shape[1] != n_features or len(centers) == 0:
+        raise ValueError(f"Centers shape {centers.shape} does not match {n_features} features")
+    for name in ('scaler_mean', 'scaler_scale', 'feature_fill'):
+        if len(artifact.arrays[name]) != n_features:
+            raise ValueError(f"{name} has {len(artifact.arrays[name])} values, expected {n_features}")
+    if not np.isfinite(centers).all() or not np.all(np.asarray(artifact.arrays['scaler_scale']) > 0):
+        raise ValueError("Model arrays contain non-finite centers or non-positive scales")
+
+    # Smoke prediction on the training means must land on a valid cluster
+    cluster = artifact.model.predict(artifact.scaler.transform([np.asarray(artifact.feature_fill)]))[0]
+    if not 0 <= cluster < len(centers):
+        raise ValueError("Smoke prediction returned an invalid cluster")
+
+
+class ModelRegistry:
+    """Serve the newest valid model artifact without blocking requests
+
+    Requests read `registry.active` once and keep using that object, so a
+    swap never changes the model under an in-flight request. New versions
+    are detected by the manifest's modification time, loaded and validated
+    off the request path, and only then published with a single reference
+    assignment. A failed load keeps the previous model active.
+    """
+
+    def __init__(self, path, poll_interval=5.0, validate=validate_artifact):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.validate = validate
+        self._active = None
+        self._manifest_stamp = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.loaded_at = None
+        self.last_error = None
+        self.reloads = 0
+
+    @property
+    def active(self):
+        """The current ModelArtifact (None until one has loaded)"""
+        return self._active
+
+    @property
+    def version(self):
+        active = self._active
+        return active.version if active is not None else None
+
+    def _current_stamp(self):
+        try:
+            stat = os.stat(os.path.join(self.path, MANIFEST_FILE))
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def check_now(self):
+        """Load the artifact if it changed since the last check; returns True on a swap"""
+        with self._lock:
+            stamp = self._current_stamp()
+            if stamp is None or stamp == self._manifest_stamp:
+                return False
+            try:
+                artifact = ModelArtifact.load(self.path, mmap=False)
+                if self.validate is not None:
+                    self.validate(artifact)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                self._manifest_stamp = stamp
+                print(f"Model reload failed, keeping version {self.version}: {self.last_error}")
+                return False
+
+            self._active = artifact
+            self._manifest_stamp = stamp
+            self.loaded_at = datetime.now().isoformat(timespec='seconds')
+            self.last_error = None
+            self.reloads += 1
+            print(f"Activated cluster model version {artifact.version}")
+            return True
+
+    def _watch(self):
+        while not self._stop.is_set():
+            self.check_now()
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """Start the background watcher (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name='model-registry', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self):
+        """Summary for health checks"""
+        return {
+            'model_version': self.version,
+            'model_path': self.path,
+            'loaded_at': self.loaded_at,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+            'watching': self._thread is not None and self._thread.is_alive()
+        }
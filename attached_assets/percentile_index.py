@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Percentile Index
+Sorted arrays of key metrics, overall and per cohort, so "top X% for steps among people
+your age" is a pair of binary searches instead of a scan over every user
+"""
+
+import io
+import json
+import os
+from bisect import bisect_left, bisect_right, insort
+
+import numpy as np
+import pandas as pd
+
+from analytics_cube import age_bands
+from progress_tracking import FITNESS_PROFILE_COLUMNS, fitness_scores
+
+# Ranked metrics: name -> True when a higher value is better
+PERCENTILE_METRICS = {
+    'total_steps': True,
+    'total_calories_burned': True,
+    'total_active_minutes': True,
+    'fitness_score': True,
+    'resting_heart_rate': False
+}
+
+# Cohort dimensions: name -> source column ('all' is the whole population)
+COHORT_DIMENSIONS = {
+    'age_band': 'age',
+    'gender': 'gender',
+    'provider': 'current_insurance_provider',
+    'cluster': 'cluster'
+}
+
+ALL_USERS = 'all'
+
+
+def metric_columns(df):
+    """The ranked metrics of a user frame, deriving the fitness score from its inputs"""
+    values = {}
+    for metric in PERCENTILE_METRICS:
+        if metric == 'fitness_score':
+            inputs = ['total_steps'] + FITNESS_PROFILE_COLUMNS
+            if all(column in df.columns for column in inputs):
+                values[metric] = fitness_scores(*(pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+                                                  for column in inputs))
+        elif metric in df.columns:
+            values[metric] = pd.to_numeric(df[metric], errors='coerce').to_numpy(dtype=float)
+    return values
+
+
+def cohort_columns(df):
+    """Cohort value of each user per dimension (missing values are left out of that cohort)"""
+    cohorts = {ALL_USERS: np.full(len(df), ALL_USERS, dtype=object)}
+    for dimension, column in COHORT_DIMENSIONS.items():
+        if column not in df.columns:
+            continue
+        if dimension == 'age_band':
+            cohorts[dimension] = age_bands(pd.to_numeric(df[column], errors='coerce'))
+        elif dimension == 'cluster':
+            cohorts[dimension] = pd.to_numeric(df[column], errors='coerce').astype('Int64').to_numpy(dtype=object)
+        else:
+            cohorts[dimension] = df[column].to_numpy(dtype=object)
+    return cohorts
+
+
+class _SortedValues:
+    """One sorted float32 array plus small sorted buffers of later additions and removals
+
+    Counts below/at a value combine a binary search in each part; the
+    buffers are merged into the array once they outgrow merge_threshold,
+    which costs O(n) instead of re-sorting.
+    """
+
+    def __init__(self, values, merge_threshold):
+        self.values = np.sort(np.asarray(values, dtype=np.float32))
+        self.added = []
+        self.removed = []
+        self.merge_threshold = merge_threshold
+
+    def __len__(self):
+        return len(self.values) + len(self.added) - len(self.removed)
+
+    def count_below(self, value, side='left'):
+        search = bisect_left if side == 'left' else bisect_right
+        return (int(np.searchsorted(self.values, value, side=side))
+                + search(self.added, value) - search(self.removed, value))
+
+    def add(self, value):
+        insort(self.added, float(np.float32(value)))
+        self._merge_if_full()
+
+    def remove(self, value):
+        insort(self.removed, float(np.float32(value)))
+        self._merge_if_full()
+
+    def _merge_if_full(self):
+        if len(self.added) + len(self.removed) > self.merge_threshold:
+            self.merge()
+
+    def merge(self):
+        values = self.values
+        if self.added:
+            added = np.asarray(self.added, dtype=np.float32)
+            values = np.insert(values, np.searchsorted(values, added), added)
+        if self.removed:
+            removed = np.asarray(self.removed, dtype=np.float32)
+            # Drop one stored occurrence per removed value; values that are not
+            # stored (or removed more often than stored) are ignored
+            first = np.searchsorted(values, removed)
+            positions = first + (np.arange(len(removed)) - np.searchsorted(removed, removed))
+            present = positions < len(values)
+            present[present] = values[positions[present]] == removed[present]
+            values = np.delete(values, positions[present])
+        self.values = values
+        self.added, self.removed = [], []
+
+
+class PercentileIndex:
+    """Sorted metric arrays for every (metric, cohort dimension, cohort value)
+
+    A user's percentile is the share of the cohort with a worse value plus
+    half of the ties; lookups are binary searches. Users are folded in (or
+    out) incrementally through small sorted buffers.
+    """
+
+    def __init__(self, arrays=None, merge_threshold=1024):
+        self.merge_threshold = merge_threshold
+        self.arrays = {}
+        for key, values in (arrays or {}).items():
+            self.arrays[key] = _SortedValues(values, merge_threshold)
+
+    @classmethod
+    def build(cls, df, merge_threshold=1024):
+        """Index over a user frame in master dataset format, one sort per array"""
+        metrics = metric_columns(df)
+        cohorts = cohort_columns(df)
+        arrays = {}
+        for metric, values in metrics.items():
+            present = ~np.isnan(values)
+            for dimension, labels in cohorts.items():
+                keep = present & ~pd.isna(labels)
+                codes, uniques = pd.factorize(labels[keep])
+                metric_values = values[keep]
+                order = np.lexsort((metric_values, codes))
+                boundaries = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+                for i, cohort in enumerate(uniques):
+                    arrays[(metric, dimension, cohort)] = metric_values[order[boundaries[i]:boundaries[i + 1]]]
+        return cls(arrays, merge_threshold)
+
+    def _fold(self, df, remove=False):
+        metrics = metric_columns(df)
+        cohorts = cohort_columns(df)
+        for metric, values in metrics.items():
+            for dimension, labels in cohorts.items():
+                for value, cohort in zip(values, labels):
+                    if np.isnan(value) or pd.isna(cohort):
+                        continue
+                    key = (metric, dimension, cohort)
+                    if key not in self.arrays:
+                        if remove:
+                            continue
+                        self.arrays[key] = _SortedValues([], self.merge_threshold)
+                    if remove:
+                        self.arrays[key].remove(value)
+                    else:
+                        self.arrays[key].add(value)
+        return self
+
+    def add_frame(self, df):
+        """Fold new users into every array they belong to"""
+        return self._fold(df)
+
+    def add(self, record):
+        return self._fold(pd.DataFrame([dict(record)]))
+
+    def remove(self, record):
+        """Take one previously added user record out of the index"""
+        return self._fold(pd.DataFrame([dict(record)]), remove=True)
+
+    def cohorts(self, dimension):
+        """Values of a cohort dimension that have any users"""
+        return sorted({key[2] for key in self.arrays if key[1] == dimension}, key=str)
+
+    def rank(self, metric, value, dimension=ALL_USERS, cohort=ALL_USERS):
+        """Percentile of a value within one cohort (None if the cohort is empty)"""
+        array = self.arrays.get((metric, dimension, cohort))
+        if array is None or len(array) == 0 or value is None or np.isnan(value):
+            return None
+        value = float(np.float32(value))
+        n = len(array)
+        below = array.count_below(value, 'left')
+        ties = array.count_below(value, 'right') - below
+        worse = below if PERCENTILE_METRICS[metric] else n - below - ties
+        percentile = (worse + ties / 2) / n * 100
+        return {
+            'percentile': round(percentile, 1),
+            'top_percent': round(100 - percentile, 1),
+            'cohort_size': n
+        }
+
+    def user_percentiles(self, record, metrics=None, dimensions=None):
+        """Percentiles of one user record for each metric, overall and within each of its cohorts"""
+        frame = pd.DataFrame([dict(record)])
+        values = metric_columns(frame)
+        cohorts = cohort_columns(frame)
+        metrics = list(values) if metrics is None else [m for m in metrics if m in values]
+        dimensions = list(cohorts) if dimensions is None else [d for d in dimensions if d in cohorts]
+
+        result = {}
+        for metric in metrics:
+            value = float(values[metric][0])
+            ranks = {}
+            for dimension in dimensions:
+                cohort = cohorts[dimension][0]
+                if pd.isna(cohort):
+                    continue
+                rank = self.rank(metric, value, dimension, cohort)
+                if rank is not None:
+                    ranks[dimension] = {'cohort': cohort, **rank}
+            result[metric] = {'value': None if np.isnan(value) else value, 'ranks': ranks}
+        return result
+
+    def save(self, filepath='percentile_index.npz'):
+        """Write all arrays (buffers merged) to one .npz file, atomically"""
+        keys = []
+        arrays = {}
+        for i, (key, values) in enumerate(self.arrays.items()):
+            values.merge()
+            keys.append([key[0], key[1], key[2]])
+            arrays[f'a{i}'] = values.values
+        manifest = json.dumps({'keys': keys}, ensure_ascii=False, default=int)
+
+        buffer = io.BytesIO()
+        np.savez(buffer, manifest=np.array(manifest), **arrays)
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(buffer.getvalue())
+        os.replace(tmp_path, filepath)
+        print(f"Percentile index saved to {filepath} ({len(keys)} arrays)")
+
+    @classmethod
+    def load(cls, filepath='percentile_index.npz', merge_threshold=1024):
+        with np.load(filepath, allow_pickle=False) as data:
+            manifest = json.loads(str(data['manifest']))
+            arrays = {tuple(key): data[f'a{i}'] for i, key in enumerate(manifest['keys'])}
+        return cls(arrays, merge_threshold)
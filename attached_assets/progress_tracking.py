@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Progress Tracking
+Rolling means, week-over-week changes, streaks and fitness score trajectories over each
+user's real weekly activity history, answered from cumulative-sum arrays
+"""
+
+import numpy as np
+import pandas as pd
+
+# Tracked series: name -> column of the weekly activity data
+PROGRESS_METRICS = {
+    'steps': 'total_steps',
+    'calories': 'total_calories_burned',
+    'active_minutes': 'total_active_minutes',
+    'exercise_sessions': 'exercise_sessions',
+    'sleep_hours': 'sleep_hours_total'
+}
+
+# Master dataset columns the fitness score needs besides total steps
+FITNESS_PROFILE_COLUMNS = ['bmi', 'resting_heart_rate', 'sleep_hours_avg', 'exercise_frequency_per_week']
+
+# Weekly series standing in for the profile's sleep and exercise averages in
+# the weekly fitness score: profile column -> (metric, divisor)
+WEEKLY_FITNESS_INPUTS = {
+    'sleep_hours_avg': ('sleep_hours', 7),
+    'exercise_frequency_per_week': ('exercise_sessions', 1)
+}
+
+TREND_LABELS = ('declining', 'stable', 'improving')
+
+
+def fitness_scores(total_steps, bmi, resting_heart_rate, sleep_hours_avg, exercise_frequency_per_week):
+    """Fitness score (0-100) for scalars or whole arrays of users/weeks
+
+    Activity counts 40%, BMI and resting heart rate 30%, sleep and exercise
+    frequency 30%.
+    """
+    steps_score = np.minimum(np.asarray(total_steps, dtype=float) / 70000 * 40, 40)
+    bmi_score = np.where((18.5 <= bmi) & (bmi <= 24.9), 30, 15)
+    hr_score = np.where((60 <= resting_heart_rate) & (resting_heart_rate <= 75), 30, 15)
+    sleep_score = np.where((7 <= sleep_hours_avg) & (sleep_hours_avg <= 9), 15, 7)
+    exercise_score = np.minimum(np.asarray(exercise_frequency_per_week, dtype=float) / 5 * 15, 15)
+    return np.round(steps_score + (bmi_score + hr_score) / 2 + sleep_score + exercise_score, 1)
+
+
+class WeeklyHistory:
+    """Every user's weekly series in one block sorted by (user, week)
+
+    User u owns rows starts[u]:ends[u]. Per metric, prefix[i] is the sum of
+    the first i rows, so the sum over any run of a user's weeks is the
+    difference of two prefix entries: window queries are O(1) after one
+    O(rows) pass, and population-wide statistics are a few array operations.
+    """
+
+    def __init__(self, activity_df, profile_df=None):
+        df = activity_df.sort_values(['user_id', 'week_start_date'], kind='stable')
+        self.user_ids = df['user_id'].to_numpy()
+        self.weeks = df['week_start_date'].astype(str).to_numpy()
+
+        users, starts, counts = np.unique(self.user_ids, return_index=True, return_counts=True)
+        self.users = users
+        self.starts = starts
+        self.ends = starts + counts
+        self._positions = dict(zip(users.tolist(), range(len(users))))
+        # Start row of each row's user, for resetting runs at user boundaries
+        self._row_starts = np.repeat(starts, counts)
+
+        self.values = {name: df[column].to_numpy(dtype=float)
+                       for name, column in PROGRESS_METRICS.items() if column in df.columns}
+        if profile_df is not None and 'steps' in self.values:
+            # BMI and resting heart rate come from the profile; sleep and
+            # exercise from the week itself when the activity data has them
+            profile = profile_df.drop_duplicates('user_id').set_index('user_id')
+            profile = profile[FITNESS_PROFILE_COLUMNS].reindex(self.user_ids)
+            inputs = []
+            for column in FITNESS_PROFILE_COLUMNS:
+                metric, divisor = WEEKLY_FITNESS_INPUTS.get(column, (None, 1))
+                if metric in self.values:
+                    inputs.append(self.values[metric] / divisor)
+                else:
+                    inputs.append(profile[column].to_numpy(dtype=float))
+            self.values['fitness_score'] = fitness_scores(self.values['steps'], *inputs)
+
+        # Missing weeks' values count as zero in sums
+        self.prefix = {name: np.concatenate([[0.0], np.cumsum(np.nan_to_num(values))])
+                       for name, values in self.values.items()}
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def user_rows(self, user_id):
+        """(start, end) rows of a user's weeks, or None if the user has no history"""
+        position = self._positions.get(user_id)
+        if position is None:
+            return None
+        return int(self.starts[position]), int(self.ends[position])
+
+    def window_mean(self, user_id, metric, weeks, end=None):
+        """Mean of metric over the `weeks` weeks before week index `end` (default: latest), in O(1)"""
+        rows = self.user_rows(user_id)
+        if rows is None:
+            return None
+        start, stop = rows
+        stop = stop if end is None else start + min(end, stop - start)
+        first = max(start, stop - weeks)
+        if stop <= first:
+            return None
+        prefix = self.prefix[metric]
+        return float((prefix[stop] - prefix[first]) / (stop - first))
+
+    def _rows(self, rows):
+        return np.arange(len(self)) if rows is None else np.asarray(rows)
+
+    def rolling_means(self, metric, window, rows=None):
+        """Trailing mean over up to `window` weeks at each row (default: all rows), shorter at a user's start"""
+        rows = self._rows(rows)
+        first = np.maximum(self._row_starts[rows], rows + 1 - window)
+        prefix = self.prefix[metric]
+        return (prefix[rows + 1] - prefix[first]) / (rows + 1 - first)
+
+    def changes(self, metric, rows=None):
+        """Week-over-week change at each row (NaN at a user's first week)"""
+        rows = self._rows(rows)
+        values = self.values[metric]
+        return np.where(rows > self._row_starts[rows], values[rows] - values[rows - 1], np.nan)
+
+    def streaks(self, metric, goal, rows=None):
+        """Consecutive weeks up to each row with metric >= goal, within each user
+
+        rows must cover each user's weeks from their first week on.
+        """
+        rows = self._rows(rows)
+        # A missed week (or the row before a user's first week) resets the run
+        last_reset = np.where(self.values[metric][rows] >= goal, self._row_starts[rows] - 1, rows)
+        return rows - np.maximum.accumulate(last_reset)
+
+    def trends(self, metric='steps', window=4, threshold=0.05):
+        """Recent vs previous window mean per user, flagged improving, declining or stable
+
+        The window shrinks to half a user's history when it is shorter;
+        users with a single week are 'insufficient_history'. A relative
+        change beyond +/- threshold counts as improving/declining.
+        """
+        prefix = self.prefix[metric]
+        weeks = self.ends - self.starts
+        span = np.minimum(window, weeks // 2)
+        has_history = span > 0
+        span = np.maximum(span, 1)
+
+        recent = (prefix[self.ends] - prefix[self.ends - span]) / span
+        previous = (prefix[self.ends - span] - prefix[np.maximum(self.ends - 2 * span, self.starts)]) / span
+        with np.errstate(invalid='ignore', divide='ignore'):
+            change = np.where(previous != 0, (recent - previous) / np.abs(previous), np.nan)
+
+        trend = np.array(TREND_LABELS, dtype=object)[1 + (change > threshold) - (change < -threshold)]
+        trend[~has_history] = 'insufficient_history'
+        return pd.DataFrame({
+            'user_id': self.users,
+            'weeks': weeks,
+            'window': np.where(has_history, span, 0),
+            f'{metric}_recent_mean': np.where(has_history, recent, np.nan),
+            f'{metric}_previous_mean': np.where(has_history, previous, np.nan),
+            f'{metric}_change_pct': np.where(has_history, change * 100, np.nan),
+            'trend': trend
+        })
+
+    def user_progress(self, user_id, weeks_back=4, window=4, step_goal=70000):
+        """A user's last weeks_back + 1 weeks with rolling means, changes and step streaks"""
+        rows = self.user_rows(user_id)
+        if rows is None:
+            return None
+        start, stop = rows
+        first = max(start, stop - weeks_back - 1)
+        selected = np.arange(first, stop)
+
+        rolling_steps = self.rolling_means('steps', window, selected)
+        step_changes = self.changes('steps', selected)
+        step_streaks = self.streaks('steps', step_goal, np.arange(start, stop))[first - start:]
+        fitness = self.values.get('fitness_score')
+
+        def count(metric, row):
+            # Missing weeks' values are None rather than an int
+            value = self.values[metric][row]
+            return None if np.isnan(value) else int(value)
+
+        progress = []
+        for i, row in enumerate(selected):
+            progress.append({
+                'week': self.weeks[row],
+                'steps': count('steps', row),
+                'calories': count('calories', row),
+                'active_minutes': count('active_minutes', row),
+                'fitness_score': None if fitness is None or np.isnan(fitness[row]) else float(fitness[row]),
+                'steps_rolling_mean': round(float(rolling_steps[i]), 1),
+                'steps_change': None if np.isnan(step_changes[i]) else int(step_changes[i]),
+                'step_goal_streak': int(step_streaks[i])
+            })
+        return progress
@@ -19,10 +19,10 @@ def main_demo():
     user_analytics = UserAnalytics()
     admin = AdminAnalytics()
     
-    # Load and prepare data
+    # Load and prepare data (admin pipeline stages are cached on disk)
     print("\n📂 Loading and Preparing Data...")
     try:
-        admin.load_and_prepare_data()
+        pipeline = admin.run_cached_pipeline(k_values=range(3, 9))
         user_analytics.load_and_prepare_data()
         print(f"✅ Successfully loaded {len(admin.master_df)} users")
     except Exception as e:
@@ -34,9 +34,11 @@ def main_demo():
     print("🎯 PART 1: USER CLUSTERING ANALYSIS")
     print("="*60)
     
-    print("\n🔄 Performing K-means clustering...")
-    cluster_labels, silhouette_score = admin.perform_user_clustering(n_clusters=5)
-    print(f"✅ Clustering completed with silhouette score: {silhouette_score:.3f}")
+    print("\n🔄 K-means cluster count sweep:")
+    comparison, best_k = pipeline['comparison'], pipeline['n_clusters']
+    print(comparison.to_string(index=False))
+    silhouette_score = admin.cluster_quality['silhouette']
+    print(f"✅ Clustering completed with {best_k} clusters, silhouette score: {silhouette_score:.3f}")
     
     print("\n📋 CLUSTER SUMMARY:")
     admin.print_cluster_summary()
@@ -196,11 +198,11 @@ def main_demo():
     print("="*60)
     
     print("\n💾 Exporting clustering model...")
-    admin.export_cluster_model('demo_cluster_model.pkl')
+    admin.export_cluster_model('demo_cluster_model')
     
     print("\n📂 Loading clustering model...")
     new_admin = AdminAnalytics()
-    new_admin.load_cluster_model('demo_cluster_model.pkl')
+    new_admin.load_cluster_model('demo_cluster_model')
     print("   ✅ Model loaded successfully!")
     
     # PART 7: PERFORMANCE SUMMARY
@@ -245,7 +247,7 @@ def main_demo():
     print("="*60)
     
     print("\n✅ What was demonstrated:")
-    print("   🎯 User clustering with 5 distinct groups")
+    print(f"   🎯 User clustering with {best_k} distinct groups")
     print("   👤 New user assignment to clusters")
     print("   🎯 Insurance service recommendation engine")
     print("   📊 Individual user analytics and tracking")
@@ -259,7 +261,7 @@ def main_demo():
     print("   Comprehensive user insights and admin dashboards")
     
     print("\n📁 Files created:")
-    print("   - demo_cluster_model.pkl (trained model)")
+    print("   - demo_cluster_model/ (trained model artifact)")
     print("   - cluster_analysis_demo.html (cluster visualization)")
     print("   - admin_dashboard_demo.html (admin insights)")
     print("   - user_dashboard_demo.html (user analytics)")
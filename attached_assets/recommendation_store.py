@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Materialized Recommendation Store
+Per-user top-k service recommendations computed in bulk, persisted to disk and
+invalidated selectively when user rows, cluster rules or the services catalog change
+"""
+
+import hashlib
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+
+def file_fingerprint(filepath):
+    """Cheap change marker for a file: modification time and size"""
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def frame_fingerprint(df):
+    """Content hash of a whole DataFrame"""
+    hashed = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha1(hashed.tobytes()).hexdigest()
+
+
+def row_fingerprints(df, columns):
+    """One 64-bit content hash per row over the given columns"""
+    columns = [c for c in columns if c in df.columns]
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+class RecommendationStore:
+    """Per-user top-k recommendation table keyed by user_id
+
+    Each entry remembers the fingerprint of the user row it was computed
+    from. refresh() recomputes only rows whose fingerprint changed (plus new
+    users) unless the context fingerprint (rules, services catalog) changed,
+    which invalidates everything. Online requests are then a dict lookup.
+    """
+
+    def __init__(self, k=2, key_columns=None):
+        self.k = k
+        self.key_columns = list(key_columns or [])
+        self.context = None
+        self.entries = {}
+
+    def refresh(self, users_df, score_fn, service_ids, context, extra_columns=()):
+        """Bring the table up to date with users_df
+
+        score_fn(users_subset) must return a users x services score matrix
+        (-inf for services a user cannot get); service_ids labels its columns.
+        extra_columns are copied from the user row into each entry.
+        Returns counts of recomputed, reused and dropped entries.
+        """
+        if context != self.context:
+            self.entries = {}
+            self.context = context
+
+        user_ids = users_df['user_id'].to_numpy()
+        fingerprints = row_fingerprints(users_df, self.key_columns)
+
+        stale = np.array([
+            (self.entries.get(user_id) or {}).get('fingerprint') != fingerprint
+            for user_id, fingerprint in zip(user_ids, fingerprints)
+        ], dtype=bool)
+
+        current = set(user_ids.tolist())
+        dropped = [user_id for user_id in self.entries if user_id not in current]
+        for user_id in dropped:
+            del self.entries[user_id]
+
+        if stale.any():
+            stale_users = users_df[stale]
+            scores = score_fn(stale_users)
+            service_ids = np.asarray(service_ids)
+            order = np.argsort(-scores, axis=1, kind='stable')[:, :self.k]
+            extras = {column: stale_users[column].to_numpy() for column in extra_columns
+                      if column in stale_users.columns}
+            for i, (user_id, fingerprint) in enumerate(zip(user_ids[stale], fingerprints[stale])):
+                top = [j for j in order[i] if np.isfinite(scores[i, j])]
+                self.entries[user_id] = {
+                    'fingerprint': fingerprint,
+                    'service_ids': service_ids[top].tolist(),
+                    'scores': list(scores[i, top]),
+                    **{column: values[i] for column, values in extras.items()}
+                }
+
+        return {'recomputed': int(stale.sum()), 'reused': int((~stale).sum()), 'dropped': len(dropped)}
+
+    def put(self, user_id, fingerprint, service_ids, scores, **extras):
+        """Store one freshly computed entry (used to fill misses on demand)"""
+        self.entries[user_id] = {
+            'fingerprint': fingerprint,
+            'service_ids': list(service_ids)[:self.k],
+            'scores': list(scores)[:self.k],
+            **extras
+        }
+
+    def lookup(self, user_id, context=None, fingerprint=None):
+        """Stored entry for a user, or None if missing or stale
+
+        An entry is stale when it was computed under another context or, if
+        fingerprint is given, from a different version of the user row.
+        """
+        if context is not None and context != self.context:
+            return None
+        entry = self.entries.get(user_id)
+        if entry is None or (fingerprint is not None and entry['fingerprint'] != fingerprint):
+            return None
+        return entry
+
+    def invalidate_user(self, user_id):
+        """Drop one user's entry, e.g. after their row changed"""
+        self.entries.pop(user_id, None)
+
+    def invalidate_all(self):
+        self.entries = {}
+        self.context = None
+
+    def save(self, filepath):
+        joblib.dump({'k': self.k, 'key_columns': self.key_columns,
+                     'context': self.context, 'entries': self.entries}, filepath)
+
+    @classmethod
+    def load(cls, filepath):
+        data = joblib.load(filepath)
+        store = cls(k=data['k'], key_columns=data['key_columns'])
+        store.context = data['context']
+        store.entries = data['entries']
+        return store
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Compiled Recommendation Tables
+Turns cluster recommendation rules and per-user score adjustments into numeric tables
+so service relevance can be scored for one user or the whole population with NumPy
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from services_catalog import parse_service_arrays
+
+
+# Service masks take the services frame and its parsed field arrays
+def _category_is(category):
+    return lambda services, arrays: (services['category'] == category).to_numpy()
+
+
+def _every_service(services, arrays):
+    return np.ones(len(services), dtype=bool)
+
+
+def _every_user(users):
+    return np.ones(len(users), dtype=bool)
+
+
+def _digital_service(services, arrays):
+    # 'Yes'/'No' parsed to bool, like parse_yes_no in the scalar scorers
+    return arrays['digital_app_required']
+
+
+def _high_reward(services, arrays):
+    return arrays['reward_amount'] > 200
+
+
+# Additive adjustments of AdminAnalytics._calculate_service_relevance_score, in the
+# order the scalar implementation applies them: (service mask, user mask, bonus)
+ADMIN_SCORE_ADJUSTMENTS = [
+    (_category_is('Fitness'),
+     lambda users: users['fitness_level'].isin(['Intermediate', 'Advanced']).to_numpy(), 2),
+    (_category_is('Fitness'), lambda users: (users['total_steps'] > 50000).to_numpy(), 1),
+    (_category_is('Prevention'), lambda users: (users['age'] > 40).to_numpy(), 2),
+    (_category_is('Prevention'), lambda users: (users['has_medical_condition'] != 0).to_numpy(), 1.5),
+    (_category_is('Mental Health'), lambda users: (users['stress_level_avg'] > 4).to_numpy(), 2),
+    (_category_is('Mental Health'), lambda users: (users['sleep_hours_avg'] < 7).to_numpy(), 1),
+    (_category_is('Wellness'), _every_user, 1),
+    (_digital_service, lambda users: (users['age'] < 40).to_numpy(), 0.5),
+    (_high_reward, _every_user, 0.5)
+]
+
+
+# Additive adjustments of UserAnalytics._calculate_service_relevance (no reward bonus)
+USER_SCORE_ADJUSTMENTS = [
+    (_category_is('Fitness'),
+     lambda users: users['fitness_level'].isin(['Intermediate', 'Advanced']).to_numpy(), 2),
+    (_category_is('Fitness'), lambda users: (users['total_steps'] > 50000).to_numpy(), 1),
+    (_category_is('Prevention'), lambda users: (users['age'] > 40).to_numpy(), 2),
+    (_category_is('Prevention'), lambda users: (users['has_medical_condition'] != 0).to_numpy(), 1.5),
+    (_category_is('Mental Health'), lambda users: (users['stress_level_avg'] > 4).to_numpy(), 2),
+    (_category_is('Mental Health'), lambda users: (users['sleep_hours_avg'] < 7).to_numpy(), 1),
+    (_category_is('Wellness'), _every_user, 1),
+    (_category_is('Family Health'), lambda users: (users['age'] < 45).to_numpy(), 1.5),
+    (_digital_service, lambda users: (users['age'] < 40).to_numpy(), 0.5)
+]
+
+
+class CompiledRecommendationTables:
+    """Cluster x category multiplier tables plus vectorized user-adjustment masks
+
+    Scores equal the scalar rule walk bit for bit: cluster multipliers are
+    applied as a stack of per-rule factors in rule order, then additive
+    adjustments are applied in the scalar order (adding 0 where a rule does
+    not fire).
+
+    Popularity, reward and digital-app fields come from the catalog's parsed,
+    read-only arrays when given (provider scoring reads views of them through
+    the provider slices); any other frame is parsed the same way here.
+    """
+
+    def __init__(self, services_df, recommendation_rules=None, adjustments=None, provider_slices=None,
+                 service_arrays=None):
+        self.source_services_df = services_df
+        self.services_df = services_df.reset_index(drop=True)
+        self.recommendation_rules = recommendation_rules
+        self.adjustments = ADMIN_SCORE_ADJUSTMENTS if adjustments is None else adjustments
+
+        if service_arrays is None:
+            service_arrays = parse_service_arrays(self.services_df)
+        self.service_arrays = service_arrays
+        self.popularity = service_arrays['popularity_score']
+        self.categories = list(pd.unique(self.services_df['category']))
+        category_index = {category: i for i, category in enumerate(self.categories)}
+        self.service_category = self.services_df['category'].map(category_index).to_numpy()
+
+        self.service_positions = {
+            service_id: i for i, service_id in enumerate(self.services_df['service_id'])
+        }
+        # Row Series per service, for building responses without repeated iloc
+        self.service_rows = [service for _, service in self.services_df.iterrows()]
+
+        # provider_id -> rows of its services: the catalog's contiguous slices when
+        # given (scored through views), otherwise position arrays
+        if provider_slices is not None:
+            self.provider_services = dict(provider_slices)
+        else:
+            provider_ids = self.services_df['provider_id'].to_numpy()
+            self.provider_services = {
+                provider_id: np.flatnonzero(provider_ids == provider_id)
+                for provider_id in pd.unique(provider_ids)
+            }
+
+        self._compile_cluster_factors()
+        self._compile_adjustments()
+
+        # Identifies what scores were computed from (catalog content, rules and the
+        # per-service bonuses, so a change in how fields are parsed re-scores too)
+        catalog_hash = pd.util.hash_pandas_object(self.services_df, index=False).to_numpy()
+        rules_repr = repr(sorted((recommendation_rules or {}).items()))
+        self.fingerprint = hashlib.sha1(
+            catalog_hash.tobytes() + rules_repr.encode() + self.adjustment_bonus.tobytes()
+        ).hexdigest()
+
+    def _compile_cluster_factors(self):
+        """Build factors[cluster_row, rule_position, category] from the cluster rules"""
+        rules = self.recommendation_rules or {}
+        self.cluster_rows = {cluster_id: i + 1 for i, cluster_id in enumerate(rules)}
+        max_rules = max((len(r) for r in rules.values()), default=0)
+
+        # Row 0 is the neutral row for users without cluster rules
+        factors = np.ones((len(rules) + 1, max_rules, len(self.categories)))
+        lowered = [category.lower() for category in self.categories]
+        for cluster_id, cluster_rules in rules.items():
+            row = self.cluster_rows[cluster_id]
+            for position, (rule_category, multiplier) in enumerate(cluster_rules):
+                for j, category in enumerate(lowered):
+                    if rule_category.lower() in category:
+                        factors[row, position, j] = multiplier
+        self.cluster_factors = factors
+
+    @property
+    def multiplier_matrix(self):
+        """Combined cluster x category multiplier (row 0: no cluster rules)"""
+        return self.cluster_factors.prod(axis=1)
+
+    def _compile_adjustments(self):
+        """Evaluate the service side of every adjustment once: rules x services bonuses"""
+        self.adjustment_bonus = np.array([
+            np.where(service_mask(self.services_df, self.service_arrays), bonus, 0.0)
+            for service_mask, _, bonus in self.adjustments
+        ]).reshape(len(self.adjustments), len(self.services_df))
+
+    def user_masks(self, users_df):
+        """users x rules boolean matrix of which user predicates fire"""
+        return np.column_stack([
+            user_mask(users_df) for _, user_mask, _ in self.adjustments
+        ]).reshape(len(users_df), len(self.adjustments))
+
+    def cluster_base_scores(self, cluster_ids):
+        """Popularity after cluster multipliers, clusters x services (no user adjustments)"""
+        rows = np.array([self.cluster_rows.get(c, 0) for c in cluster_ids], dtype=int)
+        scores = np.broadcast_to(self.popularity, (len(rows), len(self.popularity))).copy()
+        for position in range(self.cluster_factors.shape[1]):
+            scores *= self.cluster_factors[rows[:, None], position, self.service_category[None, :]]
+        return scores
+
+    def score(self, users_df, clusters=None, service_index=None):
+        """Relevance scores, users x services (all services unless service_index, positions or a slice, is given)"""
+        if service_index is None:
+            service_index = slice(None)
+        n_users = len(users_df)
+        if clusters is None:
+            clusters = users_df['cluster'].to_numpy() if 'cluster' in users_df.columns else [None] * n_users
+        cluster_rows = np.array([self.cluster_rows.get(c, 0) for c in clusters], dtype=int)
+
+        popularity = self.popularity[service_index]
+        scores = np.broadcast_to(popularity, (n_users, len(popularity))).copy()
+        categories = self.service_category[service_index]
+        for position in range(self.cluster_factors.shape[1]):
+            scores *= self.cluster_factors[cluster_rows[:, None], position, categories[None, :]]
+
+        masks = self.user_masks(users_df)
+        bonuses = self.adjustment_bonus[:, service_index]
+        for r in range(len(self.adjustments)):
+            scores += np.where(masks[:, r:r + 1], bonuses[r][None, :], 0.0)
+        return scores
+
+    def provider_positions(self, provider_id):
+        """Row positions in services_df of a provider's services"""
+        rows = self.provider_services.get(provider_id, slice(0, 0))
+        if isinstance(rows, slice):
+            return np.arange(*rows.indices(len(self.services_df)))
+        return rows
+
+    def score_provider_services(self, user, cluster, provider_id):
+        """Score one user (Series or dict) against their provider's services
+
+        Returns (row positions in services_df, scores).
+        """
+        rows = self.provider_services.get(provider_id, slice(0, 0))
+        user_frame = pd.DataFrame([dict(user)])
+        return self.provider_positions(provider_id), self.score(user_frame, [cluster], rows)[0]
+
+    def score_all_users(self, users_df, clusters=None, provider_only=True):
+        """users x services score matrix; other providers' services are -inf when provider_only"""
+        scores = self.score(users_df, clusters)
+        if provider_only:
+            allowed = (users_df['provider_id'].to_numpy()[:, None]
+                       == self.services_df['provider_id'].to_numpy()[None, :])
+            scores[~allowed] = -np.inf
+        return scores
+
+
+def top_k_positions(scores, k):
+    """Indices of the k largest scores, ties kept in service order (like nlargest)"""
+    order = np.argsort(-scores, kind='stable')
+    return order[:k]
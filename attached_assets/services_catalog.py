@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Services Catalog
+Insurance providers and services loaded once, grouped by provider into contiguous
+read-only arrays, and reloaded when the CSV files change on disk
+"""
+
+import numbers
+import re
+
+import numpy as np
+import pandas as pd
+
+from recommendation_store import file_fingerprint
+
+PROVIDERS_CSV = 'insurance_providers.csv'
+SERVICES_CSV = 'insurance_services.csv'
+
+# Services columns parsed into typed arrays
+NUMERIC_SERVICE_COLUMNS = ['reward_amount', 'max_annual_benefit', 'popularity_score']
+
+_NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def parse_number(value):
+    """First number in a CSV field ('1,500 EUR' -> 1500.0); NaN when there is none"""
+    if isinstance(value, numbers.Number):
+        return float(value)
+    match = _NUMBER_PATTERN.search(str(value).replace(',', ''))
+    return float(match.group()) if match else np.nan
+
+
+def parse_yes_no(value):
+    """'Yes'/'No' (and booleans) to bool; anything else is False"""
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    return str(value).strip().lower() in ('yes', 'y', 'true', '1')
+
+
+def _read_only(array):
+    array = np.ascontiguousarray(array)
+    array.flags.writeable = False
+    return array
+
+
+def parse_service_arrays(services_df):
+    """Numeric and yes/no service columns parsed into read-only arrays"""
+    arrays = {
+        column: _read_only(services_df[column].map(parse_number).to_numpy(dtype=float))
+        for column in NUMERIC_SERVICE_COLUMNS if column in services_df.columns
+    }
+    if 'digital_app_required' in services_df.columns:
+        arrays['digital_app_required'] = _read_only(
+            services_df['digital_app_required'].map(parse_yes_no).to_numpy(dtype=bool)
+        )
+    return arrays
+
+
+class ServicesCatalog:
+    """Provider-keyed view of insurance_providers.csv and insurance_services.csv
+
+    Services are stored sorted by provider (stable, so each provider keeps its
+    CSV order), which makes every provider's services one contiguous slice:
+    selecting them is a view, not a boolean-mask copy. Numeric and yes/no
+    fields are parsed once into read-only arrays, which the compiled
+    recommendation tables score through those slices.
+    """
+
+    def __init__(self, providers_path=PROVIDERS_CSV, services_path=SERVICES_CSV):
+        self.providers_path = providers_path
+        self.services_path = services_path
+        self.file_stamps = None
+        self.load()
+
+    def load(self):
+        """(Re)read both files and rebuild the provider index"""
+        providers_df = pd.read_csv(self.providers_path)
+        services_df = pd.read_csv(self.services_path)
+
+        services_df = services_df.sort_values('provider_id', kind='stable').reset_index(drop=True)
+        provider_ids = services_df['provider_id'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, provider_ids[1:] != provider_ids[:-1]])[:len(provider_ids)]
+        stops = np.r_[starts[1:], len(provider_ids)]
+        self.provider_slices = {
+            provider_ids[start]: slice(int(start), int(stop)) for start, stop in zip(starts, stops)
+        }
+        self.arrays = parse_service_arrays(services_df)
+
+        self.providers_df = providers_df
+        self.services_df = services_df
+        self.insurance_mapping = providers_df.set_index('provider_name')['provider_id'].to_dict()
+        self.file_stamps = self._current_stamps()
+        return self
+
+    def _current_stamps(self):
+        return (file_fingerprint(self.providers_path), file_fingerprint(self.services_path))
+
+    def reload_if_changed(self):
+        """Reload when either CSV changed on disk; returns True if it did"""
+        if self._current_stamps() == self.file_stamps:
+            return False
+        self.load()
+        print("Services catalog changed on disk, reloaded")
+        return True
+
+    def provider_slice(self, provider_id):
+        """Row range of a provider's services in services_df (empty if unknown)"""
+        return self.provider_slices.get(provider_id, slice(0, 0))
+
+    def provider_services(self, provider_id):
+        """A provider's services as a DataFrame slice (no boolean-mask copy)"""
+        return self.services_df.iloc[self.provider_slice(provider_id)]
+
+    def provider_arrays(self, provider_id):
+        """A provider's parsed fields as read-only array views"""
+        rows = self.provider_slice(provider_id)
+        return {column: values[rows] for column, values in self.arrays.items()}
+
+    def provider_id_for(self, provider_name):
+        return self.insurance_mapping.get(provider_name)
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Sharded Clustering
+Map-reduce scaler, K-means and PCA fitting over CSV/Parquet shards of the master
+dataset with a local process pool, for populations that do not fit in memory
+"""
+
+import glob
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, kmeans_plusplus
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import StandardScaler
+
+from cluster_quality import StreamingClusterMetrics, sampled_silhouette
+from cluster_stats import CATEGORICAL_STAT_COLUMNS, NUMERIC_STAT_COLUMNS, build_cluster_summary, compute_cluster_stats
+from model_artifact import export_model_artifact
+from recommendation_store import file_fingerprint
+
+SHARD_EXTENSIONS = ('.csv', '.parquet')
+
+
+def resolve_shards(shards):
+    """Shard file list from a directory, a glob pattern or an explicit list of paths"""
+    if isinstance(shards, str):
+        if os.path.isdir(shards):
+            return sorted(os.path.join(shards, name) for name in os.listdir(shards)
+                          if name.endswith(SHARD_EXTENSIONS))
+        return sorted(glob.glob(shards))
+    return list(shards)
+
+
+def write_shards(df, output_dir, n_shards, file_format='csv'):
+    """Split a DataFrame in master dataset format into n_shards files"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i, rows in enumerate(np.array_split(np.arange(len(df)), n_shards)):
+        path = os.path.join(output_dir, f'part-{i:05d}.{file_format}')
+        if file_format == 'parquet':
+            df.iloc[rows].to_parquet(path, index=False)
+        else:
+            df.iloc[rows].to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def _derived_columns():
+    """{encoded column: (source column, encoder)} for features derivable from raw columns"""
+    from admin_analytics import NEW_USER_ENCODINGS
+
+    derived = {target: (source, mapping.get) for source, target, mapping, _ in NEW_USER_ENCODINGS}
+    derived['has_medical_condition'] = ('medical_conditions', lambda value: int(value != 'None'))
+    return derived
+
+
+def _shard_columns(path):
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(path).names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def _read_shard(path, columns, chunk_size):
+    """Yield chunks of a shard holding `columns`, deriving encoded columns the file lacks"""
+    derived = _derived_columns()
+    available = set(_shard_columns(path))
+    missing = [c for c in columns if c not in available and c in derived and derived[c][0] in available]
+    read_columns = list(dict.fromkeys(
+        [c for c in columns if c in available] + [derived[c][0] for c in missing]
+    ))
+
+    if path.endswith('.parquet'):
+        frame = pd.read_parquet(path, columns=read_columns)
+        chunks = (frame.iloc[start:start + chunk_size] for start in range(0, len(frame), chunk_size))
+    else:
+        chunks = pd.read_csv(path, usecols=read_columns, chunksize=chunk_size)
+
+    for chunk in chunks:
+        chunk = chunk.copy()
+        for column in missing:
+            source, encode = derived[column]
+            # Same semantics as the training encoder: unknown categories become NaN
+            chunk[column] = pd.to_numeric(chunk[source].map(encode), errors='coerce')
+        yield chunk
+
+
+def _scaled(chunk, features, params):
+    """Fill with the global means and standardize one chunk of features"""
+    X = chunk[features].to_numpy(dtype=float, copy=True)
+    missing = np.isnan(X)
+    if missing.any():
+        X[missing] = np.take(params['mean'], np.nonzero(missing)[1])
+    return (X - params['mean']) / params['scale']
+
+
+# --- map steps (run in worker processes, one call per shard) ---
+
+def feature_moments(X):
+    """Rows, non-missing counts, sums and sums of squares per column of a feature block"""
+    X = np.asarray(X, dtype=float)
+    present = ~np.isnan(X)
+    X = np.where(present, X, 0.0)
+    return len(X), present.sum(axis=0), X.sum(axis=0), (X * X).sum(axis=0)
+
+
+def _map_moments(path, features, chunk_size):
+    """Rows, non-missing counts, sums and sums of squares per feature"""
+    n_rows = 0
+    counts = np.zeros(len(features), dtype=np.int64)
+    sums = np.zeros(len(features))
+    sumsq = np.zeros(len(features))
+    for chunk in _read_shard(path, features, chunk_size):
+        rows, chunk_counts, chunk_sums, chunk_sumsq = feature_moments(chunk[features])
+        n_rows += rows
+        counts += chunk_counts
+        sums += chunk_sums
+        sumsq += chunk_sumsq
+    return n_rows, counts, sums, sumsq
+
+
+def _map_sample_and_covariance(path, seed, features, chunk_size, params, sample_rate):
+    """Uniform row sample for center seeding, plus scaled sums and cross products for PCA"""
+    rng = np.random.default_rng(seed)
+    n_features = len(features)
+    sums = np.zeros(n_features)
+    cross = np.zeros((n_features, n_features))
+    sample = []
+    for chunk in _read_shard(path, features, chunk_size):
+        X = _scaled(chunk, features, params)
+        sums += X.sum(axis=0)
+        cross += X.T @ X
+        sample.append(X[rng.random(len(X)) < sample_rate])
+    return np.vstack(sample) if sample else np.zeros((0, n_features)), sums, cross
+
+
+def _assign(X, centers):
+    """Nearest-center labels and squared distances for a stack of (n_init, k, f) centers"""
+    squared = (
+        np.einsum('ij,ij->i', X, X)[None, :, None]
+        - 2 * np.einsum('ij,rkj->rik', X, centers)
+        + np.einsum('rkj,rkj->rk', centers, centers)[:, None, :]
+    )
+    labels = squared.argmin(axis=2)
+    distances = np.maximum(np.take_along_axis(squared, labels[:, :, None], axis=2)[:, :, 0], 0)
+    return labels, distances
+
+
+def _map_lloyd(path, features, chunk_size, params, centers):
+    """Per-run, per-cluster feature sums, counts and inertia against the current centers"""
+    n_runs, n_clusters, n_features = centers.shape
+    sums = np.zeros((n_runs, n_clusters, n_features))
+    counts = np.zeros((n_runs, n_clusters), dtype=np.int64)
+    inertia = np.zeros(n_runs)
+    for chunk in _read_shard(path, features, chunk_size):
+        X = _scaled(chunk, features, params)
+        labels, distances = _assign(X, centers)
+        for run in range(n_runs):
+            np.add.at(sums[run], labels[run], X)
+            counts[run] += np.bincount(labels[run], minlength=n_clusters)
+        inertia += distances.sum(axis=1)
+    return sums, counts, inertia
+
+
+def _map_summarize(path, seed, features, chunk_size, params, centers, stat_columns, sample_rate,
+                   labels_dir):
+    """Label a shard with the final model: cluster statistics, quality metrics and a silhouette sample"""
+    rng = np.random.default_rng(seed)
+    numeric_columns, categorical_columns = stat_columns
+    available = set(_shard_columns(path))
+    columns = list(dict.fromkeys(
+        features + numeric_columns + categorical_columns + (['user_id'] if 'user_id' in available else [])
+    ))
+
+    stats = None
+    metrics = StreamingClusterMetrics(centers)
+    sample_X, sample_labels, assignments = [], [], []
+    for chunk in _read_shard(path, columns, chunk_size):
+        X = _scaled(chunk, features, params)
+        labels, _ = _assign(X, centers[None])
+        labels = labels[0]
+        metrics.update(X, labels)
+
+        chunk = chunk.reset_index(drop=True)
+        chunk['cluster'] = labels
+        chunk_stats = compute_cluster_stats(chunk, numeric_columns=numeric_columns,
+                                            categorical_columns=categorical_columns)
+        stats = chunk_stats if stats is None else stats.merge(chunk_stats)
+
+        keep = rng.random(len(labels)) < sample_rate
+        sample_X.append(X[keep])
+        sample_labels.append(labels[keep])
+
+        if labels_dir is not None:
+            X_pca = (X - params['pca_mean']) @ params['pca_components'].T
+            assignment = pd.DataFrame({'cluster': labels, 'pca_x': X_pca[:, 0], 'pca_y': X_pca[:, 1]})
+            if 'user_id' in chunk.columns:
+                assignment.insert(0, 'user_id', chunk['user_id'])
+            assignments.append(assignment)
+
+    if labels_dir is not None and assignments:
+        name = os.path.splitext(os.path.basename(path))[0]
+        pd.concat(assignments).to_csv(os.path.join(labels_dir, f'{name}.clusters.csv'), index=False)
+
+    if not sample_X:
+        return stats, metrics, np.zeros((0, len(features))), np.zeros(0, dtype=int)
+    return stats, metrics, np.vstack(sample_X), np.concatenate(sample_labels)
+
+
+# --- reduce steps and model construction ---
+
+def scaler_from_moments(n_rows, counts, sums, sumsq):
+    """StandardScaler equivalent to fitting on the mean-filled feature matrix
+    
+    A feature with no values at all gets mean 0 and unit scale.
+    """
+    mean = np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+    # Filled values sit at the mean, so they add rows but no squared deviation
+    var = np.maximum(sumsq - counts * mean ** 2, 0) / n_rows
+
+    scaler = StandardScaler()
+    scaler.mean_ = mean
+    scaler.var_ = var
+    scaler.scale_ = np.where(var > 0, np.sqrt(var), 1.0)
+    scaler.n_features_in_ = len(mean)
+    scaler.n_samples_seen_ = np.int64(n_rows)
+    return scaler
+
+
+def _build_pca(n_rows, sums, cross, n_components=2):
+    """PCA from the global scaled covariance (eigenvectors with scikit-learn's sign convention)"""
+    mean = sums / n_rows
+    covariance = (cross - n_rows * np.outer(mean, mean)) / max(n_rows - 1, 1)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    order = np.argsort(eigenvalues)[::-1]
+    eigenvalues = np.maximum(eigenvalues[order], 0)
+    components = eigenvectors[:, order].T
+    signs = np.sign(components[np.arange(len(components)), np.abs(components).argmax(axis=1)])
+    components *= signs[:, None]
+
+    pca = PCA(n_components=n_components)
+    pca.components_ = components[:n_components]
+    pca.mean_ = mean
+    pca.explained_variance_ = eigenvalues[:n_components]
+    pca.explained_variance_ratio_ = eigenvalues[:n_components] / max(eigenvalues.sum(), np.finfo(float).tiny)
+    pca.singular_values_ = np.sqrt(eigenvalues[:n_components] * max(n_rows - 1, 1))
+    pca.noise_variance_ = float(eigenvalues[n_components:].mean()) if len(eigenvalues) > n_components else 0.0
+    pca.n_components_ = n_components
+    pca.n_features_in_ = len(mean)
+    pca.n_samples_ = n_rows
+    return pca
+
+
+def _build_kmeans(centers, inertia, n_iter, random_state):
+    """A fitted scikit-learn KMeans whose centers are exactly the map-reduce centers
+
+    Fitting on the centers themselves with init=centers converges immediately
+    (every center is its own cluster), which sets all fitted attributes; the
+    centers, inertia and iteration count are then taken from the sharded fit.
+    """
+    model = KMeans(n_clusters=len(centers), init=centers, n_init=1, max_iter=1, random_state=random_state)
+    model.fit(centers)
+    model.cluster_centers_ = centers.copy()
+    model.inertia_ = float(inertia)
+    model.n_iter_ = n_iter
+    return model
+
+
+def resolve_shard_features(path, clustering_features):
+    """Clustering features present in (or derivable from) a shard"""
+    available = set(_shard_columns(path))
+    derived = _derived_columns()
+    return [f for f in clustering_features
+            if f in available or (f in derived and derived[f][0] in available)]
+
+
+def fit_sharded_clustering(admin, shards, n_clusters=5, clustering_features=None, n_jobs=None,
+                           chunk_size=100000, n_init=3, max_iter=100, tol=1e-4,
+                           init_sample_size=100000, silhouette_sample_size=10000,
+                           labels_dir=None, model_path=None, init=None, random_state=42):
+    """Fit the AdminAnalytics clustering model over shards without loading them together
+
+    Every pass maps over the shards in a process pool and reduces small
+    per-shard aggregates; a worker holds at most chunk_size rows at a time.
+
+      1. moments: counts, sums and sums of squares -> scaler and fill means
+      2. sample + covariance: a uniform sample for k-means++ seeding and the
+         scaled cross products for an exact PCA
+      3. Lloyd iterations: per-cluster sums and counts -> global center update,
+         for n_init seedings at once, until the center shift is below tol
+      4. summarize: cluster statistics, quality metrics and a silhouette sample
+         from the final assignment (and per-shard label files in labels_dir)
+
+    The fitted scikit-learn StandardScaler, KMeans and PCA objects, the
+    cluster statistics, summary and quality report are set on `admin` as the
+    in-memory path would; admin.master_df is not touched. With model_path the
+    model is also exported as an artifact, fingerprinted by the shard files.
+    init, initial centers in scaled feature space ((n_clusters, n_features),
+    or one set per run), replaces the k-means++ seeding.
+    Empty clusters keep their previous center.
+    """
+    from admin_analytics import DEFAULT_CLUSTERING_FEATURES
+
+    started = time.perf_counter()
+    shards = resolve_shards(shards)
+    if not shards:
+        raise ValueError("No shards to cluster")
+
+    features = resolve_shard_features(shards[0], clustering_features or DEFAULT_CLUSTERING_FEATURES)
+    n_jobs = n_jobs or min(len(shards), os.cpu_count() or 1)
+    print(f"Sharded clustering of {len(shards)} shards with {n_jobs} workers using features: {features}")
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        def map_shards(func, *per_shard, **shared):
+            """Run func(shard, *per_shard values, features, chunk_size, **shared) over all shards"""
+            task = partial(func, features=features, chunk_size=chunk_size, **shared)
+            return list(executor.map(task, shards, *per_shard))
+
+        # Pass 1: scaler
+        moments = map_shards(_map_moments)
+        n_rows = sum(m[0] for m in moments)
+        scaler = scaler_from_moments(n_rows, *(sum(m[i] for m in moments) for i in (1, 2, 3)))
+        params = {'mean': scaler.mean_, 'scale': scaler.scale_}
+
+        # Pass 2: seeding sample and PCA covariance
+        sample_rate = min(1.0, init_sample_size / max(n_rows, 1))
+        seeds = [random_state + i for i in range(len(shards))]
+        covariance_parts = map_shards(_map_sample_and_covariance, seeds, params=params, sample_rate=sample_rate)
+        sample = np.vstack([part[0] for part in covariance_parts])
+        pca = _build_pca(n_rows, sum(part[1] for part in covariance_parts),
+                         sum(part[2] for part in covariance_parts))
+        if len(sample) < n_clusters:
+            raise ValueError(f"Need at least {n_clusters} users to form {n_clusters} clusters")
+
+        if init is not None:
+            centers = np.array(init, dtype=float).reshape(-1, n_clusters, len(features))
+            n_init = len(centers)
+        else:
+            rng = np.random.RandomState(random_state)
+            centers = np.stack([
+                kmeans_plusplus(sample, n_clusters, random_state=rng.randint(np.iinfo(np.int32).max))[0]
+                for _ in range(n_init)
+            ])
+
+        # Pass 3: Lloyd iterations (tolerance relative to the mean feature variance, as in KMeans)
+        threshold = tol * float(np.mean(scaler.var_ / scaler.scale_ ** 2))
+        converged = np.zeros(n_init, dtype=bool)
+        inertia = np.full(n_init, np.inf)
+        n_iter = 0
+        while n_iter < max_iter and not converged.all():
+            parts = map_shards(_map_lloyd, params=params, centers=centers)
+            sums = sum(part[0] for part in parts)
+            counts = sum(part[1] for part in parts)
+            inertia = sum(part[2] for part in parts)
+
+            occupied = counts > 0
+            updated = np.where(occupied[:, :, None], sums / np.maximum(counts, 1)[:, :, None], centers)
+            shift = ((updated - centers) ** 2).sum(axis=(1, 2))
+            converged |= shift <= threshold
+            centers = updated
+            n_iter += 1
+
+        best = int(np.argmin(inertia))
+        final_centers = centers[best]
+
+        # Pass 4: statistics, quality and labels for the chosen run
+        if labels_dir is not None:
+            os.makedirs(labels_dir, exist_ok=True)
+            params = dict(params, pca_mean=pca.mean_, pca_components=pca.components_)
+        header = set(_shard_columns(shards[0])) | set(features)
+        derived = _derived_columns()
+        stat_columns = (
+            [c for c in NUMERIC_STAT_COLUMNS
+             if c in header or (c in derived and derived[c][0] in header)],
+            [c for c in CATEGORICAL_STAT_COLUMNS if c in header]
+        )
+        summary_rate = min(1.0, silhouette_sample_size / max(n_rows, 1))
+        summaries = map_shards(_map_summarize, seeds, params=params, centers=final_centers,
+                               stat_columns=stat_columns, sample_rate=summary_rate, labels_dir=labels_dir)
+
+    stats, metrics = None, StreamingClusterMetrics(final_centers)
+    for shard_stats, shard_metrics, _, _ in summaries:
+        if shard_stats is not None:
+            stats = shard_stats if stats is None else stats.merge(shard_stats)
+        metrics.merge(shard_metrics)
+
+    admin.clustering_features = features
+    admin.scaler = scaler
+    admin.feature_means = pd.Series(scaler.mean_, index=features)
+    admin.clustering_model = _build_kmeans(final_centers, metrics.result()['inertia'], n_iter, random_state)
+    admin.pca_model = pca
+    admin.projected_users = []
+    admin.cluster_labels = None
+    admin.analytics_cube = None
+    admin.cluster_stats = stats
+    admin.stats_members = {}
+    admin.cluster_summary = build_cluster_summary(stats, admin._generate_cluster_description)
+    admin.cluster_quality = metrics.result()
+    admin.cluster_quality.update(sampled_silhouette(
+        np.vstack([s[2] for s in summaries]), np.concatenate([s[3] for s in summaries]),
+        silhouette_sample_size, population_counts=admin.cluster_quality['cluster_sizes'],
+        random_state=random_state
+    ))
+
+    print(f"Sharded clustering completed with {n_clusters} clusters over {n_rows} users "
+          f"({n_iter} iterations, {'converged' if converged[best] else 'max_iter reached'})")
+    admin._print_cluster_quality()
+
+    if model_path is not None:
+        digest = hashlib.sha1(repr([file_fingerprint(path) for path in shards]).encode()).hexdigest()
+        export_model_artifact(admin, model_path, data_fingerprint=digest)
+
+    return {
+        'n_users': int(n_rows),
+        'n_shards': len(shards),
+        'n_iter': n_iter,
+        'converged': bool(converged[best]),
+        'inertia': admin.cluster_quality['inertia'],
+        'silhouette': admin.cluster_quality['silhouette'],
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+
+def check_in_memory_equivalence(master_df, work_dir, n_shards=3, n_clusters=3, clustering_features=None,
+                                max_iter=100, n_jobs=1, random_state=42):
+    """Fit one dataset in memory and from shards from the same seeds, and compare the models
+
+    master_df (master dataset format, encoded) is split into n_shards CSV
+    files under work_dir. Both paths start Lloyd iterations from the same
+    k-means++ centers (seeded with random_state, tol=0), so they must reach
+    the same centers and labels; the scaler, PCA (up to component sign) and
+    cluster sizes are compared too. Returns {check: passed} plus
+    'equivalent' for all of them together.
+    """
+    from admin_analytics import AdminAnalytics
+
+    in_memory = AdminAnalytics()
+    in_memory.master_df = master_df.copy()
+    features = in_memory._resolve_clustering_features(clustering_features)
+    X_scaled = in_memory.prepare_scaled_features(features)
+    seeds = kmeans_plusplus(X_scaled, n_clusters, random_state=random_state)[0]
+    model = KMeans(n_clusters=n_clusters, init=seeds, n_init=1, max_iter=max_iter, tol=0,
+                   algorithm='lloyd', random_state=random_state)
+    in_memory.apply_clustering_model(model.fit(X_scaled), X_scaled)
+
+    shards = write_shards(master_df, os.path.join(work_dir, 'shards'), n_shards)
+    labels_dir = os.path.join(work_dir, 'labels')
+    sharded = AdminAnalytics()
+    fit_sharded_clustering(sharded, shards, n_clusters=n_clusters, clustering_features=features,
+                           n_jobs=n_jobs, init=seeds, max_iter=max_iter, tol=0,
+                           labels_dir=labels_dir, random_state=random_state)
+    shard_labels = np.concatenate([
+        pd.read_csv(os.path.join(labels_dir, os.path.splitext(os.path.basename(path))[0] + '.clusters.csv'))
+        ['cluster'].to_numpy()
+        for path in shards
+    ])
+
+    memory_pca, shard_pca = in_memory.pca_model.components_, sharded.pca_model.components_
+    signs = np.sign((memory_pca * shard_pca).sum(axis=1))
+    report = {
+        'features': sharded.clustering_features == features,
+        'scaler': (np.allclose(in_memory.scaler.mean_, sharded.scaler.mean_)
+                   and np.allclose(in_memory.scaler.scale_, sharded.scaler.scale_)),
+        'centers': np.allclose(in_memory.clustering_model.cluster_centers_,
+                               sharded.clustering_model.cluster_centers_),
+        'labels': np.array_equal(in_memory.cluster_labels, shard_labels),
+        'cluster_sizes': (np.bincount(in_memory.cluster_labels, minlength=n_clusters).tolist()
+                          == [sharded.cluster_quality['cluster_sizes'].get(c, 0) for c in range(n_clusters)]),
+        'pca': np.allclose(memory_pca, shard_pca * signs[:, None])
+    }
+    report = {check: bool(passed) for check, passed in report.items()}
+    report['equivalent'] = all(report.values())
+    return report
@@ -7,6 +7,7 @@ Provides personalized insights, progress tracking, and recommendations for indiv
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import seaborn as sns
 import plotly.graph_objects as go
 import plotly.express as px
@@ -14,57 +15,136 @@ from plotly.subplots import make_subplots
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
 from sklearn.metrics.pairwise import cosine_similarity
+from recommendation_store import RecommendationStore, frame_fingerprint, row_fingerprints
+from services_catalog import PROVIDERS_CSV, SERVICES_CSV, ServicesCatalog, parse_yes_no
+from eligibility import EligibilityEngine
+from recommendation_tables import CompiledRecommendationTables, USER_SCORE_ADJUSTMENTS, top_k_positions
+from dashboard_rendering import (
+    DASHBOARD_COLUMNS, RENDER_FORMATS, RenderCache, draw_user_comparison, draw_user_dashboard, figure_bytes,
+    row_fingerprint
+)
+from bulk_dashboards import generate_dashboards
+from chart_data import DEFAULT_POINT_BUDGET, downsample_series
+from progress_tracking import WeeklyHistory, fitness_scores
+from health_rules import decode_rules, evaluate_rules, rule_counts, rule_mask
+import io
+import os
 import warnings
 warnings.filterwarnings('ignore')
 
+# User columns the service relevance score depends on; a change re-scores that user
+RECOMMENDATION_KEY_COLUMNS = [
+    'provider_id', 'fitness_level', 'total_steps', 'age',
+    'has_medical_condition', 'stress_level_avg', 'sleep_hours_avg'
+]
+
+# Profile features find_similar_users compares users on
+SIMILARITY_FEATURES = [
+    'age', 'bmi', 'fitness_level_encoded', 'total_steps',
+    'total_calories_burned', 'exercise_frequency_per_week',
+    'resting_heart_rate', 'sleep_hours_avg'
+]
+
+# Raw CSV columns not carried into the master dataset
+MASTER_DROP_COLUMNS = [
+    'first_name', 'last_name', 'email', 'phone', 'postal_code',
+    'last_medical_checkup', 'week_start_date', 'nationality',
+    'education_level', 'occupation'
+]
+
 class UserAnalytics:
-    def __init__(self):
+    def __init__(self, data_dir='.'):
+        self.data_dir = data_dir
         self.master_df = None
+        self.activity_df = None
+        self.weekly_history = None
+        self._weekly_history_source = None
         self.scaler = StandardScaler()
         self.clustering_model = None
         self.cluster_labels = None
         self.user_features = None
+        self.recommendation_tables = None
+        self.recommendation_store = None
+        self.catalog = None
+        self.eligibility_engine = None
+        self.render_cache = RenderCache()
+        self._rule_bitsets = None
+        self._rule_bitsets_source = None
+        self._user_positions = None
+        self._user_positions_source = None
+        # Bumped whenever master_df is loaded or gains rows (see mark_data_changed)
+        self.data_version = 0
+        self._comparison_fingerprint = None
+        self._comparison_fingerprint_version = None
         
     def load_and_prepare_data(self):
         """Load all datasets and combine them into master dataset"""
         print("Loading datasets...")
         
         # Load individual datasets
-        demo_df = pd.read_csv('users_demographic.csv')
-        physical_df = pd.read_csv('users_physical.csv')
-        activity_df = pd.read_csv('users_activity_weekly.csv')
-        insurance_df = pd.read_csv('insurance_providers.csv')
-        services_df = pd.read_csv('insurance_services.csv')
-        
-        # Combine datasets
+        demo_df = pd.read_csv(os.path.join(self.data_dir, 'users_demographic.csv'))
+        physical_df = pd.read_csv(os.path.join(self.data_dir, 'users_physical.csv'))
+        activity_df = pd.read_csv(os.path.join(self.data_dir, 'users_activity_weekly.csv'))
+        
+        # Providers and services come from the provider-indexed catalog (loaded once)
+        if self.catalog is None:
+            self.catalog = ServicesCatalog(os.path.join(self.data_dir, PROVIDERS_CSV),
+                                           os.path.join(self.data_dir, SERVICES_CSV))
+        else:
+            self.catalog.reload_if_changed()
+        insurance_df = self.catalog.providers_df
+        services_df = self.catalog.services_df
+        
+        # Combine datasets; the full weekly history is kept for progress tracking
+        # and each user's latest week goes into the master dataset
+        latest_week = activity_df.sort_values('week_start_date', kind='stable').drop_duplicates('user_id', keep='last')
         master_df = demo_df.merge(physical_df, on='user_id')
-        master_df = master_df.merge(activity_df, on='user_id')
+        master_df = master_df.merge(latest_week, on='user_id')
         
         # Add insurance provider details
-        insurance_mapping = insurance_df.set_index('provider_name')['provider_id'].to_dict()
-        master_df['provider_id'] = master_df['current_insurance_provider'].map(insurance_mapping)
-        
-        # Remove unnecessary columns for analysis
-        columns_to_remove = [
-            'first_name', 'last_name', 'email', 'phone', 'postal_code',
-            'last_medical_checkup', 'week_start_date', 'nationality',
-            'education_level', 'occupation'
-        ]
+        master_df['provider_id'] = master_df['current_insurance_provider'].map(self.catalog.insurance_mapping)
         
-        # Only remove columns that exist
-        columns_to_remove = [col for col in columns_to_remove if col in master_df.columns]
+        # Remove unnecessary columns for analysis (only those that exist)
+        columns_to_remove = [col for col in MASTER_DROP_COLUMNS if col in master_df.columns]
         master_df = master_df.drop(columns=columns_to_remove)
         
         # Encode categorical variables
         master_df = self._encode_categorical_features(master_df)
         
         self.master_df = master_df
+        self.activity_df = activity_df
         self.services_df = services_df
         self.insurance_df = insurance_df
+        self.mark_data_changed()
         
         print(f"Master dataset created with {len(master_df)} users and {len(master_df.columns)} features")
         return master_df
     
+    def add_user(self, record):
+        """Fold one user's raw CSV rows (demographic, physical and one activity week) into the loaded data
+        
+        The master row is built as load_and_prepare_data builds it and
+        replaces any earlier row of the user; the week is appended to the
+        activity history. A signup therefore costs one row, not a reload of
+        every CSV.
+        """
+        if self.master_df is None:
+            self.load_and_prepare_data()
+            return
+        
+        # Read back the way the CSV files are read ('None' fields become NaN)
+        parsed = pd.read_csv(io.StringIO(pd.DataFrame([record]).to_csv(index=False)))
+        week = parsed.reindex(columns=self.activity_df.columns)
+        
+        row = parsed.drop(columns=[col for col in MASTER_DROP_COLUMNS if col in parsed.columns])
+        row['provider_id'] = row['current_insurance_provider'].map(self.catalog.insurance_mapping)
+        row = self._encode_categorical_features(row).reindex(columns=self.master_df.columns)
+        
+        others = self.master_df[self.master_df['user_id'] != record['user_id']]
+        self.master_df = pd.concat([others, row], ignore_index=True)
+        self.activity_df = pd.concat([self.activity_df, week], ignore_index=True)
+        self.mark_data_changed()
+    
     def _encode_categorical_features(self, df):
         """Encode categorical features for ML algorithms"""
         # Fitness level encoding
@@ -88,18 +168,29 @@ class UserAnalytics:
         
         return df
     
-    def get_user_profile_summary(self, user_id):
-        """Get comprehensive user profile summary"""
+    def _get_user_row(self, user_id):
+        """A user's master_df row via a user_id -> position index (None if unknown)
+        
+        The index is rebuilt whenever master_df is replaced, so lookups cost a
+        dict access instead of a boolean filter over all users.
+        """
         if self.master_df is None:
             self.load_and_prepare_data()
-            
-        user_data = self.master_df[self.master_df['user_id'] == user_id]
+        if self._user_positions_source is not self.master_df:
+            user_ids = self.master_df['user_id'].to_numpy()
+            # First row per user, as the boolean-filter lookups used
+            self._user_positions = dict(zip(user_ids[::-1].tolist(), range(len(user_ids) - 1, -1, -1)))
+            self._user_positions_source = self.master_df
+        position = self._user_positions.get(user_id)
+        return None if position is None else self.master_df.iloc[position]
+    
+    def get_user_profile_summary(self, user_id):
+        """Get comprehensive user profile summary"""
+        user = self._get_user_row(user_id)
         
-        if user_data.empty:
+        if user is None:
             return {"error": f"User {user_id} not found"}
         
-        user = user_data.iloc[0]
-        
         profile = {
             "user_id": user_id,
             "basic_info": {
@@ -129,32 +220,112 @@ class UserAnalytics:
     
     def _calculate_fitness_score(self, user_data):
         """Calculate overall fitness score (0-100)"""
-        score = 0
+        return float(fitness_scores(
+            user_data['total_steps'], user_data['bmi'], user_data['resting_heart_rate'],
+            user_data['sleep_hours_avg'], user_data['exercise_frequency_per_week']
+        ))
+    
+    def user_dashboard_data(self, user_id):
+        """Series behind the six user dashboard panels (or an error dict)"""
+        profile = self.get_user_profile_summary(user_id)
         
-        # Activity score (40% weight)
-        steps_score = min(user_data['total_steps'] / 70000 * 40, 40)
+        if "error" in profile:
+            return profile
         
-        # Health metrics score (30% weight)
-        bmi_score = 30 if 18.5 <= user_data['bmi'] <= 24.9 else 15
-        hr_score = 30 if 60 <= user_data['resting_heart_rate'] <= 75 else 15
-        health_score = (bmi_score + hr_score) / 2
+        user_data = self._get_user_row(user_id)
+        weekly = profile['weekly_activity']
+        sleep_hours = weekly['sleep_hours']
+        
+        return {
+            'user_id': user_id,
+            'profile': profile,
+            'activity': {
+                'labels': ['Steps', 'Calories', 'Active Min', 'Sessions'],
+                'values': [
+                    weekly['total_steps'],
+                    weekly['calories_burned'],
+                    weekly['active_minutes'],
+                    weekly['exercise_sessions'] * 1000  # Scale for visibility
+                ]
+            },
+            'health_radar': {
+                'categories': ['BMI', 'Heart Rate', 'Sleep', 'Activity', 'Overall'],
+                'scores': [
+                    100 if 18.5 <= profile['health_metrics']['bmi'] <= 24.9 else 60,
+                    100 if 60 <= profile['health_metrics']['resting_heart_rate'] <= 75 else 70,
+                    100 if 7 <= sleep_hours <= 9 else 70,
+                    min(weekly['total_steps'] / 500, 100),
+                    profile['fitness_score']
+                ]
+            },
+            'activity_breakdown': {
+                'labels': ['Walking', 'Running', 'Cycling'],
+                'values': [
+                    float(user_data['walking_distance_km']),
+                    float(user_data['running_distance_km']),
+                    float(user_data['cycling_distance_km'])
+                ]
+            },
+            'trend': self._user_trend(user_id),
+            'fitness_score': profile['fitness_score'],
+            'sleep': {
+                'labels': ['Deep Sleep', 'Light Sleep', 'Awake'],
+                'values': [sleep_hours * 0.3, sleep_hours * 0.6, sleep_hours * 0.1]
+            }
+        }
+    
+    def _user_trend(self, user_id):
+        """Weekly steps and fitness score over the user's whole recorded history (oldest first)
+        
+        Empty when no weekly activity data is loaded (master_df set directly).
+        """
+        if self.master_df is not None and self.activity_df is None:
+            return {'weeks': [], 'steps': [], 'fitness_score': []}
+        history = self._get_weekly_history()
+        progress = history.user_progress(user_id, weeks_back=len(history)) or []
+        return {
+            'weeks': [week['week'] for week in progress],
+            'steps': [week['steps'] for week in progress],
+            'fitness_score': [week['fitness_score'] for week in progress]
+        }
+    
+    def user_chart_data(self, user_id, max_points=DEFAULT_POINT_BUDGET):
+        """Dashboard series only, for clients that draw their own charts (or an error dict)
         
-        # Lifestyle score (30% weight)
-        sleep_score = 15 if 7 <= user_data['sleep_hours_avg'] <= 9 else 7
-        exercise_score = min(user_data['exercise_frequency_per_week'] / 5 * 15, 15)
-        lifestyle_score = sleep_score + exercise_score
+        Long series are downsampled to at most max_points points.
+        """
+        data = self.user_dashboard_data(user_id)
         
-        total_score = steps_score + health_score + lifestyle_score
-        return round(total_score, 1)
+        if "error" in data:
+            return data
+        
+        charts = {key: value for key, value in data.items() if key != 'profile'}
+        charts['trend'] = downsample_series(data['trend'], 'steps', n_points=max_points)
+        return charts
     
-    def create_user_dashboard(self, user_id, save_path=None):
-        """Create comprehensive user dashboard with multiple visualizations"""
-        profile = self.get_user_profile_summary(user_id)
+    def create_user_dashboard(self, user_id, save_path=None, show=True):
+        """Create comprehensive user dashboard with multiple visualizations
         
-        if "error" in profile:
-            print(profile["error"])
+        Pass show=False in servers and batch jobs; render_user_dashboard
+        returns cached HTML/JSON/PNG output instead of a figure.
+        """
+        data = self.user_dashboard_data(user_id)
+        
+        if "error" in data:
+            print(data["error"])
             return
         
+        fig = self._build_user_dashboard_figure(data)
+        
+        if save_path:
+            fig.write_html(save_path)
+        
+        if show:
+            fig.show()
+        return fig
+    
+    def _build_user_dashboard_figure(self, data):
+        """Six-panel Plotly dashboard from user_dashboard_data()"""
         # Create subplots
         fig = make_subplots(
             rows=3, cols=2,
@@ -171,33 +342,16 @@ class UserAnalytics:
         )
         
         # 1. Weekly Activity Overview (Bar Chart)
-        activity_metrics = ['Steps', 'Calories', 'Active Min', 'Sessions']
-        activity_values = [
-            profile['weekly_activity']['total_steps'],
-            profile['weekly_activity']['calories_burned'],
-            profile['weekly_activity']['active_minutes'],
-            profile['weekly_activity']['exercise_sessions'] * 1000  # Scale for visibility
-        ]
-        
         fig.add_trace(
-            go.Bar(x=activity_metrics, y=activity_values, name="Activity"),
+            go.Bar(x=data['activity']['labels'], y=data['activity']['values'], name="Activity"),
             row=1, col=1
         )
         
         # 2. Health Metrics Radar Chart
-        health_categories = ['BMI', 'Heart Rate', 'Sleep', 'Activity', 'Overall']
-        health_scores = [
-            100 if 18.5 <= profile['health_metrics']['bmi'] <= 24.9 else 60,
-            100 if 60 <= profile['health_metrics']['resting_heart_rate'] <= 75 else 70,
-            100 if 7 <= profile['weekly_activity']['sleep_hours'] <= 9 else 70,
-            min(profile['weekly_activity']['total_steps'] / 500, 100),
-            profile['fitness_score']
-        ]
-        
         fig.add_trace(
             go.Scatterpolar(
-                r=health_scores,
-                theta=health_categories,
+                r=data['health_radar']['scores'],
+                theta=data['health_radar']['categories'],
                 fill='toself',
                 name='Health Metrics'
             ),
@@ -205,33 +359,18 @@ class UserAnalytics:
         )
         
         # 3. Activity Breakdown (Pie Chart)
-        user_data = self.master_df[self.master_df['user_id'] == user_id].iloc[0]
-        activity_breakdown = {
-            'Walking': user_data['walking_distance_km'],
-            'Running': user_data['running_distance_km'],
-            'Cycling': user_data['cycling_distance_km']
-        }
-        
         fig.add_trace(
             go.Pie(
-                labels=list(activity_breakdown.keys()),
-                values=list(activity_breakdown.values()),
+                labels=data['activity_breakdown']['labels'],
+                values=data['activity_breakdown']['values'],
                 name="Activity Types"
             ),
             row=2, col=1
         )
         
-        # 4. Progress Trends (Mock weekly data)
-        weeks = ['Week 1', 'Week 2', 'Week 3', 'Week 4']
-        steps_trend = [
-            profile['weekly_activity']['total_steps'] * 0.8,
-            profile['weekly_activity']['total_steps'] * 0.9,
-            profile['weekly_activity']['total_steps'] * 0.95,
-            profile['weekly_activity']['total_steps']
-        ]
-        
+        # 4. Progress Trends (weekly history)
         fig.add_trace(
-            go.Scatter(x=weeks, y=steps_trend, mode='lines+markers', name="Steps Trend"),
+            go.Scatter(x=data['trend']['weeks'], y=data['trend']['steps'], mode='lines+markers', name="Steps Trend"),
             row=2, col=2
         )
         
@@ -239,7 +378,7 @@ class UserAnalytics:
         fig.add_trace(
             go.Indicator(
                 mode="gauge+number+delta",
-                value=profile['fitness_score'],
+                value=data['fitness_score'],
                 domain={'x': [0, 1], 'y': [0, 1]},
                 title={'text': "Fitness Score"},
                 gauge={
@@ -261,172 +400,287 @@ class UserAnalytics:
         )
         
         # 6. Sleep & Recovery
-        sleep_data = ['Deep Sleep', 'Light Sleep', 'Awake']
-        sleep_hours = profile['weekly_activity']['sleep_hours']
-        sleep_values = [sleep_hours * 0.3, sleep_hours * 0.6, sleep_hours * 0.1]
-        
         fig.add_trace(
-            go.Bar(x=sleep_data, y=sleep_values, name="Sleep Breakdown"),
+            go.Bar(x=data['sleep']['labels'], y=data['sleep']['values'], name="Sleep Breakdown"),
             row=3, col=2
         )
         
         # Update layout
         fig.update_layout(
             height=1200,
-            title_text=f"User Dashboard - {user_id}",
+            title_text=f"User Dashboard - {data['user_id']}",
             showlegend=False
         )
-        
-        if save_path:
-            fig.write_html(save_path)
-        
-        fig.show()
         return fig
     
-    def track_user_progress(self, user_id, weeks_back=4):
-        """Track user progress over time (mock implementation for demo)"""
-        profile = self.get_user_profile_summary(user_id)
-        
-        if "error" in profile:
-            return profile
+    def render_user_dashboard(self, user_id, output_format='html'):
+        """Headless dashboard: HTML (str), Plotly JSON (str) or PNG (bytes); None if the user is unknown
+        
+        Output is cached per user and format together with a hash of the
+        user's dashboard columns and weekly trend, so an unchanged dashboard
+        is served from memory and edited data is re-rendered on the next
+        request. HTML loads plotly.js from its CDN; PNG is drawn with
+        matplotlib (Agg), so no browser or display is needed.
+        """
+        if output_format not in RENDER_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        
+        user = self._get_user_row(user_id)
+        if user is None:
+            print(f"User {user_id} not found")
+            return None
+        
+        key = ('dashboard', user_id, output_format)
+        trend = self._user_trend(user_id)
+        fingerprint = row_fingerprint(user) + row_fingerprint(trend, columns=list(trend))
+        cached = self.render_cache.get(key, fingerprint)
+        if cached is not None:
+            return cached
+        
+        data = self.user_dashboard_data(user_id)
+        if output_format == 'png':
+            payload = figure_bytes(draw_user_dashboard(data))
+        else:
+            fig = self._build_user_dashboard_figure(data)
+            payload = fig.to_json() if output_format == 'json' else fig.to_html(include_plotlyjs='cdn')
+        return self.render_cache.put(key, fingerprint, payload)
+    
+    def invalidate_user_renders(self, user_id):
+        """Drop a user's cached dashboard output (e.g. after editing master_df directly)
         
-        # Generate mock historical data
-        current_stats = profile['weekly_activity']
-        
-        progress_data = []
-        for week in range(weeks_back, 0, -1):
-            # Simulate progressive improvement
-            improvement_factor = 0.8 + (weeks_back - week) * 0.05
-            
-            week_data = {
-                'week': f"Week -{week}",
-                'steps': int(current_stats['total_steps'] * improvement_factor),
-                'calories': int(current_stats['calories_burned'] * improvement_factor),
-                'active_minutes': int(current_stats['active_minutes'] * improvement_factor),
-                'fitness_score': round(profile['fitness_score'] * improvement_factor, 1)
-            }
-            progress_data.append(week_data)
+        The edit can change anyone's similar users, so data_version is bumped too.
+        """
+        self.render_cache.invalidate_user(user_id)
+        self.mark_data_changed()
+    
+    def generate_all_dashboards(self, output_dir, output_format='html', user_ids=None, n_jobs=None,
+                                batch_size=100, resume=True):
+        """Render every user's dashboard to output_dir in parallel (weekly report job)
+        
+        Files are written atomically and existing ones are skipped with
+        resume=True, so a failed run can simply be started again. Returns a
+        report with rendered/skipped/failed counts and throughput, and raises
+        RuntimeError if every attempted dashboard failed.
+        """
+        return generate_dashboards(self, output_dir, user_ids=user_ids, output_format=output_format,
+                                   n_jobs=n_jobs, batch_size=batch_size, resume=resume)
+    
+    def _get_weekly_history(self):
+        """Cumulative-sum index over the weekly activity history (rebuilt when the data is reloaded)"""
+        if self.master_df is None:
+            self.load_and_prepare_data()
+        history = self.weekly_history
+        if history is None or self._weekly_history_source is not self.activity_df:
+            history = WeeklyHistory(self.activity_df, self.master_df)
+            self.weekly_history = history
+            self._weekly_history_source = self.activity_df
+        return history
+    
+    def track_user_progress(self, user_id, weeks_back=4, window=4, step_goal=70000):
+        """Track user progress over the recorded weeks
+        
+        Returns the user's last weeks_back + 1 weeks (oldest first) with
+        steps, calories, active minutes and fitness score, plus the rolling
+        mean of steps over `window` weeks, the week-over-week step change
+        and the current run of weeks reaching step_goal.
+        """
+        if self._get_user_row(user_id) is None:
+            return {"error": f"User {user_id} not found"}
         
-        # Add current week
-        progress_data.append({
-            'week': 'Current',
-            'steps': current_stats['total_steps'],
-            'calories': current_stats['calories_burned'],
-            'active_minutes': current_stats['active_minutes'],
-            'fitness_score': profile['fitness_score']
-        })
+        progress = self._get_weekly_history().user_progress(user_id, weeks_back, window, step_goal)
+        if not progress:
+            return {"error": f"No activity history for user {user_id}"}
+        return progress
+    
+    def flag_progress_trends(self, metric='steps', window=4, threshold=0.05):
+        """Flag every user as improving, declining or stable on a progress metric
         
-        return progress_data
+        Compares each user's mean over the last `window` weeks with the
+        `window` weeks before; see WeeklyHistory.trends.
+        """
+        return self._get_weekly_history().trends(metric, window, threshold)
     
     def get_user_recommendations(self, user_id):
         """Get personalized recommendations for user"""
-        if self.master_df is None:
-            self.load_and_prepare_data()
-        
-        user_data = self.master_df[self.master_df['user_id'] == user_id]
-        if user_data.empty:
+        user = self._get_user_row(user_id)
+        if user is None:
             return {"error": f"User {user_id} not found"}
         
-        user = user_data.iloc[0]
-        recommendations = {
-            "activity_recommendations": self._get_activity_recommendations(user),
-            "health_recommendations": self._get_health_recommendations(user),
-            "insurance_services": self._get_insurance_service_recommendations(user)
-        }
+        # Activity and health advice is decoded from the user's rule bitset
+        bits = self.recommendation_bitsets().iloc[self._user_positions[user_id]]
+        recommendations = decode_rules(bits)
+        recommendations["insurance_services"] = self._get_insurance_service_recommendations(user)
         
         return recommendations
     
-    def _get_activity_recommendations(self, user):
-        """Generate activity recommendations based on user profile"""
-        recommendations = []
-        
-        if user['total_steps'] < 40000:
-            recommendations.append({
-                "type": "steps",
-                "message": "Try to increase daily steps by 2000. Consider taking walking breaks every hour.",
-                "target": "45000+ steps per week"
-            })
-        
-        if user['exercise_sessions'] < 3:
-            recommendations.append({
-                "type": "exercise",
-                "message": "Add 1-2 more exercise sessions per week for better fitness.",
-                "target": "4-5 sessions per week"
-            })
-        
-        if user['total_active_minutes'] < 150:
-            recommendations.append({
-                "type": "activity",
-                "message": "Increase active minutes to meet WHO recommendations.",
-                "target": "150+ minutes per week"
-            })
+    def recommendation_bitsets(self):
+        """Per-user bitset of triggered activity/health rules (bit i = RECOMMENDATION_RULES[i])
         
-        return recommendations
+        Evaluated for the whole population with one vectorized mask per rule
+        and cached until master_df is replaced.
+        """
+        if self.master_df is None:
+            self.load_and_prepare_data()
+        if self._rule_bitsets is None or self._rule_bitsets_source is not self.master_df:
+            self._rule_bitsets = pd.Series(evaluate_rules(self.master_df), index=self.master_df['user_id'].to_numpy(),
+                                           name='recommendation_bits')
+            self._rule_bitsets_source = self.master_df
+        return self._rule_bitsets
     
-    def _get_health_recommendations(self, user):
-        """Generate health recommendations based on user metrics"""
-        recommendations = []
-        
-        if user['bmi'] > 25:
-            recommendations.append({
-                "type": "weight",
-                "message": "Consider consulting a nutritionist for healthy weight management.",
-                "target": "BMI 18.5-24.9"
-            })
-        
-        if user['resting_heart_rate'] > 80:
-            recommendations.append({
-                "type": "cardio",
-                "message": "Focus on cardiovascular exercises to improve heart health.",
-                "target": "Resting HR 60-75 bpm"
-            })
-        
-        if user['sleep_hours_avg'] < 7:
-            recommendations.append({
-                "type": "sleep",
-                "message": "Prioritize sleep hygiene for better recovery and health.",
-                "target": "7-9 hours per night"
-            })
-        
-        return recommendations
+    def target_users(self, rule_types, provider=None):
+        """Users triggering all of the given rule types (e.g. ['steps', 'sleep']), optionally of one provider"""
+        bits = self.recommendation_bitsets()
+        mask = rule_mask(rule_types)
+        selected = (bits.to_numpy() & mask) == mask
+        if provider is not None:
+            selected &= (self.master_df['current_insurance_provider'] == provider).to_numpy()
+        return bits.index[selected].tolist()
+    
+    def recommendation_rule_counts(self, by='current_insurance_provider'):
+        """Users triggering each activity/health rule per value of a column (None: overall)"""
+        bits = self.recommendation_bitsets().to_numpy()
+        return rule_counts(bits, None if by is None else self.master_df[by].to_numpy())
     
     def _get_insurance_service_recommendations(self, user):
-        """Get insurance service recommendations based on user profile"""
-        user_provider = user['current_insurance_provider']
+        """Get insurance service recommendations based on user profile
+        
+        Served from the materialized recommendation table when it holds an
+        entry computed from the user's current row.
+        """
         provider_id = user.get('provider_id')
         
         if not provider_id:
             return []
         
-        # Get services for user's insurance provider
-        provider_services = self.services_df[
-            self.services_df['provider_id'] == provider_id
-        ].copy()
-        
-        if provider_services.empty:
+        store = self.recommendation_store
+        if store is not None:
+            if self.reload_services_if_changed():
+                self.materialize_recommendations()
+            tables = self._get_recommendation_tables()
+            fingerprint = row_fingerprints(self.master_df.loc[[user.name]], store.key_columns)[0]
+            entry = store.lookup(user['user_id'], tables.fingerprint, fingerprint=fingerprint)
+            if entry is not None:
+                return [
+                    self._format_service_recommendation(
+                        tables.service_rows[tables.service_positions[service_id]], score
+                    )
+                    for service_id, score in zip(entry['service_ids'], entry['scores'])
+                ]
+        
+        # Score the services of the user's insurance provider from the compiled tables
+        tables = self._get_recommendation_tables()
+        service_index, scores = tables.score_provider_services(user, None, provider_id)
+        
+        if len(service_index) == 0:
             return []
         
-        # Score services based on user profile
-        provider_services['user_relevance_score'] = provider_services.apply(
-            lambda service: self._calculate_service_relevance(user, service), axis=1
+        # Get top 2 recommendations
+        top = top_k_positions(scores, 2)
+        
+        if store is not None and store.context == tables.fingerprint:
+            store.put(user['user_id'], fingerprint,
+                      tables.services_df['service_id'].to_numpy()[service_index[top]].tolist(),
+                      list(scores[top]))
+        
+        return [
+            self._format_service_recommendation(tables.services_df.iloc[service_index[position]], scores[position])
+            for position in top
+        ]
+    
+    def _format_service_recommendation(self, service, score):
+        return {
+            "service_name": service['service_name'],
+            "category": service['category'],
+            "description": service['description'],
+            "reward_amount": service['reward_amount'],
+            "reward_type": service['reward_type'],
+            "relevance_score": round(score, 2),
+            "eligibility": service['eligibility_criteria']
+        }
+    
+    def _get_recommendation_tables(self):
+        """Compiled scoring tables for the current services catalog"""
+        tables = self.recommendation_tables
+        if tables is None or tables.source_services_df is not self.services_df:
+            tables = CompiledRecommendationTables(self.services_df, adjustments=USER_SCORE_ADJUSTMENTS,
+                                                  **self._catalog_table_args())
+            self.recommendation_tables = tables
+        return tables
+    
+    def _catalog_table_args(self):
+        """The catalog's provider slices and parsed arrays, if services_df is the catalog's frame"""
+        if self.catalog is not None and self.catalog.services_df is self.services_df:
+            return {'provider_slices': self.catalog.provider_slices,
+                    'service_arrays': self.catalog.arrays}
+        return {}
+    
+    def materialize_recommendations(self, filepath=None):
+        """Precompute every user's insurance service recommendations for lookups
+        
+        Re-running it only re-scores users whose relevant columns changed;
+        a changed services catalog re-scores everyone.
+        """
+        if self.master_df is None:
+            self.load_and_prepare_data()
+        self.reload_services_if_changed()
+        
+        if self.recommendation_store is None:
+            self.recommendation_store = RecommendationStore(k=2, key_columns=RECOMMENDATION_KEY_COLUMNS)
+        
+        tables = self._get_recommendation_tables()
+        result = self.recommendation_store.refresh(
+            self.master_df,
+            lambda users: tables.score_all_users(users, [None] * len(users)),
+            tables.services_df['service_id'],
+            tables.fingerprint
         )
+        print(f"Materialized recommendations: {result['recomputed']} recomputed, "
+              f"{result['reused']} reused, {result['dropped']} dropped")
         
-        # Get top 2 recommendations
-        top_services = provider_services.nlargest(2, 'user_relevance_score')
-        
-        recommendations = []
-        for _, service in top_services.iterrows():
-            recommendations.append({
-                "service_name": service['service_name'],
-                "category": service['category'],
-                "description": service['description'],
-                "reward_amount": service['reward_amount'],
-                "reward_type": service['reward_type'],
-                "relevance_score": round(service['user_relevance_score'], 2),
-                "eligibility": service['eligibility_criteria']
-            })
+        if filepath:
+            self.recommendation_store.save(filepath)
+            print(f"Recommendation table saved to {filepath}")
+        return result
+    
+    def load_materialized_recommendations(self, filepath):
+        """Load a saved recommendation table; stale entries are refreshed on demand"""
+        self.recommendation_store = RecommendationStore.load(filepath)
+        print(f"Recommendation table loaded from {filepath}")
+    
+    def _get_eligibility_engine(self):
+        """Parsed eligibility predicates for the current services catalog"""
+        engine = self.eligibility_engine
+        if engine is None or engine.source_services_df is not self.services_df:
+            engine = EligibilityEngine(self.services_df)
+            self.eligibility_engine = engine
+        return engine
+    
+    def get_user_eligibility(self, user_id):
+        """Eligibility and expected annual reward for each of a user's provider services"""
+        if self.master_df is None:
+            self.load_and_prepare_data()
         
-        return recommendations
+        user_data = self.master_df[self.master_df['user_id'] == user_id]
+        if user_data.empty:
+            return {"error": f"User {user_id} not found"}
+        
+        self.reload_services_if_changed()
+        services = self._get_eligibility_engine().user_eligibility(user_data)
+        return {
+            "user_id": user_id,
+            "insurance_provider": user_data['current_insurance_provider'].iloc[0],
+            "eligible_services": [service for service in services if service['eligible']],
+            "ineligible_services": [service for service in services if not service['eligible']],
+            "expected_annual_reward": sum(service['expected_annual_reward'] for service in services)
+        }
+    
+    def reload_services_if_changed(self):
+        """Pick up insurance_providers.csv / insurance_services.csv changes made on disk"""
+        if self.catalog is None or not self.catalog.reload_if_changed():
+            return False
+        self.services_df = self.catalog.services_df
+        self.insurance_df = self.catalog.providers_df
+        return True
     
     def _calculate_service_relevance(self, user, service):
         """Calculate how relevant a service is for a specific user"""
@@ -463,106 +717,106 @@ class UserAnalytics:
                 score += 1.5
         
         # Digital services preference (younger users)
-        if service.get('digital_app_required') and user['age'] < 40:
+        if parse_yes_no(service.get('digital_app_required')) and user['age'] < 40:
             score += 0.5
         
         return score
     
     def visualize_user_vs_similar_users(self, user_id, n_similar=5):
         """Compare user with similar users in their cluster"""
-        if self.master_df is None:
-            self.load_and_prepare_data()
-        
-        similar_users = self.find_similar_users(user_id, n_similar)
+        comparison = self._user_comparison_data(user_id, n_similar)
         
-        if not similar_users:
+        if comparison is None:
             print(f"No similar users found for {user_id}")
             return
         
-        # Get comparison metrics
-        metrics = ['total_steps', 'total_calories_burned', 'total_active_minutes', 'fitness_score']
-        user_data = self.master_df[self.master_df['user_id'] == user_id].iloc[0]
-        
-        # Prepare data for comparison
-        comparison_data = {
-            'User': user_id,
-            'Steps': user_data['total_steps'],
-            'Calories': user_data['total_calories_burned'],
-            'Active_Min': user_data['total_active_minutes'],
-            'Fitness_Score': self._calculate_fitness_score(user_data)
-        }
-        
-        similar_data = []
-        for similar_user_id in similar_users:
-            similar_user_data = self.master_df[self.master_df['user_id'] == similar_user_id].iloc[0]
-            similar_data.append({
-                'User': similar_user_id,
-                'Steps': similar_user_data['total_steps'],
-                'Calories': similar_user_data['total_calories_burned'],
-                'Active_Min': similar_user_data['total_active_minutes'],
-                'Fitness_Score': self._calculate_fitness_score(similar_user_data)
-            })
+        comparison_data, similar_data, _ = comparison
         
         # Create visualization
-        fig, axes = plt.subplots(2, 2, figsize=(15, 10))
-        fig.suptitle(f'User {user_id} vs Similar Users Comparison', fontsize=16)
-        
-        metrics_to_plot = [
-            ('Steps', 'total_steps'),
-            ('Calories', 'total_calories_burned'),
-            ('Active Minutes', 'total_active_minutes'),
-            ('Fitness Score', 'fitness_score')
-        ]
-        
-        for idx, (title, metric_key) in enumerate(metrics_to_plot):
-            row, col = idx // 2, idx % 2
-            ax = axes[row, col]
-            
-            # Plot similar users
-            similar_values = [data[title.replace(' ', '_')] for data in similar_data]
-            user_value = comparison_data[title.replace(' ', '_')]
-            
-            ax.bar(range(len(similar_values)), similar_values, alpha=0.7, color='lightblue', label='Similar Users')
-            ax.axhline(y=user_value, color='red', linestyle='--', linewidth=2, label=f'Your {title}')
-            
-            ax.set_title(f'{title} Comparison')
-            ax.set_ylabel(title)
-            ax.set_xlabel('Similar Users')
-            ax.legend()
-            ax.grid(True, alpha=0.3)
-        
-        plt.tight_layout()
+        fig = plt.figure(figsize=(15, 10))
+        draw_user_comparison(fig, user_id, comparison_data, similar_data)
         plt.show()
         
         return comparison_data, similar_data
     
+    def render_user_comparison(self, user_id, n_similar=5, output_format='png'):
+        """Headless user vs similar users chart as image bytes ('png' or 'svg'), cached
+        
+        Which users are similar depends on the whole population, so the cache
+        fingerprint is a hash of the master_df columns the similarity search
+        and the chart read. That hash is computed once per data_version, so a
+        hit costs neither hashing nor the search nor the drawing.
+        """
+        if self.master_df is None:
+            self.load_and_prepare_data()
+        key = ('comparison', user_id, output_format, n_similar)
+        fingerprint = self._get_comparison_fingerprint()
+        cached = self.render_cache.get(key, fingerprint)
+        if cached is not None:
+            return cached
+        
+        comparison = self._user_comparison_data(user_id, n_similar)
+        if comparison is None:
+            print(f"No similar users found for {user_id}")
+            return None
+        
+        comparison_data, similar_data, _ = comparison
+        fig = draw_user_comparison(Figure(figsize=(15, 10)), user_id, comparison_data, similar_data)
+        return self.render_cache.put(key, fingerprint, figure_bytes(fig, output_format))
+    
+    def mark_data_changed(self):
+        """Bump data_version after master_df was reloaded, gained rows or was edited directly"""
+        self.data_version += 1
+    
+    def _get_comparison_fingerprint(self):
+        """Content hash of the master_df columns behind the comparison charts (once per data_version)"""
+        if self._comparison_fingerprint_version != self.data_version:
+            columns = list(dict.fromkeys(['user_id'] + SIMILARITY_FEATURES + DASHBOARD_COLUMNS))
+            self._comparison_fingerprint = frame_fingerprint(
+                self.master_df[[c for c in columns if c in self.master_df.columns]]
+            )
+            self._comparison_fingerprint_version = self.data_version
+        return self._comparison_fingerprint
+    
+    def _user_comparison_data(self, user_id, n_similar):
+        """(user record, similar user records, source rows) for the comparison charts"""
+        if self.master_df is None:
+            self.load_and_prepare_data()
+        
+        similar_users = self.find_similar_users(user_id, n_similar)
+        
+        if not similar_users:
+            return None
+        
+        rows = [self._get_user_row(user_id)] + [self._get_user_row(uid) for uid in similar_users]
+        records = [{
+            'User': row['user_id'],
+            'Steps': row['total_steps'],
+            'Calories': row['total_calories_burned'],
+            'Active_Min': row['total_active_minutes'],
+            'Fitness_Score': self._calculate_fitness_score(row)
+        } for row in rows]
+        
+        return records[0], records[1:], rows
+    
     def find_similar_users(self, user_id, n_similar=5):
         """Find similar users based on profile characteristics"""
         if self.master_df is None:
             self.load_and_prepare_data()
         
-        # Features for similarity calculation
-        similarity_features = [
-            'age', 'bmi', 'fitness_level_encoded', 'total_steps',
-            'total_calories_burned', 'exercise_frequency_per_week',
-            'resting_heart_rate', 'sleep_hours_avg'
-        ]
-        
         # Prepare data
-        X = self.master_df[similarity_features].fillna(self.master_df[similarity_features].mean())
+        X = self.master_df[SIMILARITY_FEATURES].fillna(self.master_df[SIMILARITY_FEATURES].mean())
         scaler = StandardScaler()
         X_scaled = scaler.fit_transform(X)
         
-        # Calculate similarities
-        similarity_matrix = cosine_similarity(X_scaled)
-        
         # Find user index
         user_idx = self.master_df[self.master_df['user_id'] == user_id].index
         if len(user_idx) == 0:
             return []
         
+        # Similarities of this user to everyone (one row, not the full N x N matrix)
         user_idx = user_idx[0]
-        user_similarities = similarity_matrix[user_idx]
+        user_similarities = cosine_similarity(X_scaled[user_idx:user_idx + 1], X_scaled)[0]
         
         # Get most similar users (excluding self)
         similar_indices = np.argsort(user_similarities)[::-1][1:n_similar+1]